@@ -0,0 +1,82 @@
+# benchmark_database.py
+import os
+import sqlite3
+import tempfile
+import time
+
+from database import Database
+
+
+def time_calls(label, func, calls):
+    """Run func for every call argument and print the elapsed time"""
+    start = time.perf_counter()
+    for args in calls:
+        func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {len(calls):>6} calls  {elapsed * 1000:>9.1f} ms  "
+          f"({elapsed / len(calls) * 1_000_000:.1f} us/call)")
+    return elapsed
+
+
+def connect_per_call_value(db_path, employee_id, variable_name, period_year, period_month):
+    """The old access pattern: open, query and close a connection for one cell"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT value
+        FROM employee_variable_values
+        WHERE employee_id = ? AND variable_name = ? AND period_year = ? AND period_month = ?
+    """, (employee_id, variable_name, period_year, period_month))
+    result = cursor.fetchone()
+    conn.close()
+    return result[0] if result else None
+
+
+def connect_per_call_save(db_path, value_data):
+    """The old access pattern: open, write, commit and close a connection for one cell"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR REPLACE INTO employee_variable_values
+        (employee_id, variable_name, period_year, period_month, value, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (value_data["employee_id"], value_data["variable_name"], value_data["period_year"],
+          value_data["period_month"], value_data["value"], "", ""))
+    conn.commit()
+    conn.close()
+
+
+def run_benchmark(employees=300, variables=10):
+    """Compare connection-per-call with the pooled connection on the variable grid paths"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "benchmark.db")
+        database = Database(db_path)
+
+        cells = [(f"EMP{e:05d}", f"var_{v}", 2024, 1) for e in range(employees) for v in range(variables)]
+        values = [{"employee_id": c[0], "variable_name": c[1], "period_year": c[2], "period_month": c[3],
+                   "value": float(i)} for i, c in enumerate(cells)]
+
+        print(f"Variable grid: {employees} employees x {variables} variables")
+
+        print("Saving cells one by one:")
+        old_save = time_calls("connect per call", lambda v: connect_per_call_save(db_path, v),
+                              [(v,) for v in values])
+        new_save = time_calls("pooled connection", database.save_employee_variable_value,
+                              [(v,) for v in values])
+
+        print("Saving the whole grid:")
+        bulk_values = [dict(v, value=v["value"] + 1) for v in values]
+        bulk_save = time_calls("one transaction", lambda v: database.save_period_variable_values(2024, 1, v),
+                               [(bulk_values,)])
+
+        print("Loading cells one by one:")
+        old_load = time_calls("connect per call", lambda *c: connect_per_call_value(db_path, *c), cells)
+        new_load = time_calls("pooled connection", database.get_employee_variable_value, cells)
+
+        print(f"Speed-up: save x{old_save / new_save:.1f}, bulk save x{old_save / bulk_save:.1f}, "
+              f"load x{old_load / new_load:.1f}")
+        database.close()
+
+
+if __name__ == "__main__":
+    run_benchmark()
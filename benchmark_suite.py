@@ -0,0 +1,199 @@
+# benchmark_suite.py
+"""Time the calculation and storage paths on a synthetic database and report JSON:
+
+    python benchmark_suite.py --employees 5000 --departments 10 --output bench-5000.json
+    python benchmark_suite.py --db copy-of-production.db --config config.json
+
+Reports from two releases can be compared scenario by scenario to catch
+regressions. An existing database is copied first, so it is never changed.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bonus_calculator import BonusCalculator
+from config_manager import ConfigManager
+from database import Database
+import instrumentation
+from synthetic_data import generate_database
+
+
+def time_scenario(func, repeats, setup=None):
+    """Run func repeats times, returning its timings in seconds and its last result"""
+    timings = []
+    result = None
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeats": repeats,
+        "min": round(min(timings), 6),
+        "median": round(statistics.median(timings), 6),
+        "max": round(max(timings), 6),
+    }, result
+
+
+def run_scenarios(database, config_manager, year, repeats=3, parallel=False, workers=None):
+    """Time every scenario on an open database, returning {scenario: timings}"""
+    calculator = BonusCalculator(database, config_manager)
+    departments = sorted(name for name, status in config_manager.get_departments().items() if status == "active")
+    department = departments[0]
+    scenarios = {}
+
+    def record(name, func, setup=None, scenario_repeats=None, count_queries=True, **details):
+        print(f"INFO: Running {name}")
+        timings, result = time_scenario(func, scenario_repeats or repeats, setup)
+        scenarios[name] = dict(timings, **details)
+        if count_queries:
+            # One more run with instrumentation on, so the timings above are not affected
+            if setup:
+                setup()
+            with instrumentation.profile(), instrumentation.span(name) as measured:
+                func()
+            scenarios[name].update(queries=measured.queries, rows=measured.rows)
+        return result
+
+    # Employee roster, from the database and from the directory cache
+    employees = record("get_all_employees_cold", database.get_all_employees,
+                       setup=database.invalidate_employee_directory)
+    record("get_all_employees_cached", database.get_all_employees, employees=len(employees))
+    scenarios["get_all_employees_cold"]["employees"] = len(employees)
+
+    # Variable grid of the entry page, for one department and for everyone
+    grid = record("load_variable_grid_department", lambda: database.get_period_variable_values(year, 1, department),
+                  department=department)
+    scenarios["load_variable_grid_department"]["employees"] = len(grid)
+    grid = record("load_variable_grid_all", lambda: database.get_period_variable_values(year, 1))
+    scenarios["load_variable_grid_all"]["employees"] = len(grid)
+
+    # save_all_values writes the whole grid through save_period_variable_values;
+    # time a save where nothing changed and one where every value changed
+    values = [{"employee_id": employee_id, "variable_name": name, "value": value}
+              for employee_id, employee_values in grid.items() for name, value in employee_values.items()]
+    record("save_all_values_unchanged", lambda: database.save_period_variable_values(year, 1, values),
+           cells=len(values))
+    generation = [0]
+
+    def changed_values():
+        generation[0] += 1
+        return [dict(value_data, value=float(value_data["value"] or 0) + generation[0]) for value_data in values]
+
+    pending = []
+    record("save_all_values_changed", lambda: database.save_period_variable_values(year, 1, pending[-1]),
+           setup=lambda: pending.append(changed_values()), cells=len(values))
+
+    record("are_variable_values_saved", lambda: calculator.are_variable_values_saved(year, 1, department),
+           department=department)
+    record("are_variable_values_saved_all", lambda: calculator.are_variable_values_saved(year, 1, "All Departments"))
+
+    # Full calculations, without storing runs so every repeat does the same work
+    results = record("calculate_department_month",
+                     lambda: calculator.calculate_bonuses_for_department(year, 1, department),
+                     department=department)
+    scenarios["calculate_department_month"]["results"] = len(results)
+
+    def calculate_department_year():
+        return [result for month in range(1, 13)
+                for result in calculator.calculate_bonuses_for_department(year, month, department)]
+
+    results = record("calculate_department_year", calculate_department_year, department=department)
+    scenarios["calculate_department_year"]["results"] = len(results)
+
+    def calculate_department_year_range():
+        return [result for month_result in calculator.iter_bonuses_for_range(department, (year, 1), (year, 12), 0)
+                for result in month_result["results"]]
+
+    results = record("calculate_department_year_range", calculate_department_year_range, department=department)
+    scenarios["calculate_department_year_range"]["results"] = len(results)
+
+    def calculate_all_departments_year():
+        merged = calculator.calculate_periods_parallel(
+            [(year, month) for month in range(1, 13)], departments, max_workers=workers if parallel else 1
+        )
+        return [result for partition_results in merged.values() for result in partition_results]
+
+    name = "calculate_all_departments_year_parallel" if parallel else "calculate_all_departments_year"
+    # Queries of worker processes are not seen by this process's profiler
+    results = record(name, calculate_all_departments_year, scenario_repeats=1, count_queries=not parallel,
+                     departments=len(departments))
+    scenarios[name]["results"] = len(results)
+
+    return scenarios
+
+
+def run_suite(args):
+    """Prepare the database, run the scenarios and build the report"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bonus_system.db")
+        config_path = os.path.join(tmp_dir, "config.json")
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+            shutil.copyfile(args.config, config_path)
+            dataset = {"source": os.path.abspath(args.db)}
+        else:
+            dataset = generate_database(
+                db_path, args.employees, args.departments, args.kpis, args.variables, args.months, args.year,
+                seed=args.seed, config_path=config_path
+            )
+            del dataset["db_path"], dataset["config_path"]
+
+        database = Database(db_path)
+        config_manager = ConfigManager(config_path, database)
+        try:
+            scenarios = run_scenarios(database, config_manager, args.year, args.repeats, args.parallel, args.workers)
+        finally:
+            database.close()
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dataset,
+        "scenarios": scenarios,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bonus system on synthetic data")
+    parser.add_argument("--db", help="Benchmark a copy of this database instead of generating one")
+    parser.add_argument("--config", default="config.json", help="Configuration file used with --db")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--kpis", type=int, default=12)
+    parser.add_argument("--variables", type=int, default=6)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per scenario; min, median and max are reported")
+    parser.add_argument("--parallel", action="store_true", help="Calculate the whole year on a process pool")
+    parser.add_argument("--workers", type=int, help="Worker processes for --parallel (default: CPU count)")
+    parser.add_argument("--output", help="JSON report file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # The calculator prints progress; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_suite(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
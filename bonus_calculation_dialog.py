@@ -162,10 +162,12 @@ class BonusCalculationDialog(QDialog):
 
         # Use the centralized bonus calculator
         calculator = BonusCalculator(self.database, self.config_manager)
-        results = calculator.calculate_bonuses_with_validation(year, month, department_filter, self)
+        results, validation = calculator.calculate_bonuses_with_validation(year, month, department_filter)
 
         if results is not None:  # Only proceed if validation passed
             self.display_results(results)
+        else:
+            QMessageBox.warning(self, "Unsaved Changes", validation["message"])
 
     def display_results(self, results):
         """Display results in the table"""
@@ -0,0 +1,81 @@
+# bonus_calculation_worker.py
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+from bonus_calculator import BonusCalculator, CalculationCancelled
+
+
+class BonusCalculationSignals(QObject):
+    """Signals a calculation worker emits back to the GUI thread"""
+    progress = pyqtSignal(int, int)  # Employees done, employees in the run
+    results_ready = pyqtSignal(list)  # A batch of finished employee results
+    finished = pyqtSignal(list)  # Every result of the stored run
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+
+class BonusCalculationWorker(QRunnable):
+    """Calculates and stores a period's bonuses off the GUI thread
+
+    Database keeps one connection per thread, so the worker queries through
+    its own connection and closes it when the run ends. Results are sent in batches so large runs do not
+    flood the event loop with one signal per employee.
+    """
+
+    RESULT_BATCH_SIZE = 100
+
+    def __init__(self, database, config_manager, year, month, department, working_days=None,
+                 salary_adjustments=None):
+        super().__init__()
+        self.database = database
+        self.config_manager = config_manager
+        self.year = year
+        self.month = month
+        self.department = department
+        self.working_days = working_days
+        self.salary_adjustments = salary_adjustments
+
+        self.signals = BonusCalculationSignals()
+        self.cancel_event = threading.Event()
+        self._pending_results = []
+
+    def cancel(self):
+        """Ask the calculation to stop at the next employee"""
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _on_progress(self, done, total, result):
+        self._pending_results.append(result)
+        if len(self._pending_results) >= self.RESULT_BATCH_SIZE or done == total:
+            self._flush_results()
+            self.signals.progress.emit(done, total)
+
+    def _flush_results(self):
+        if self._pending_results:
+            self.signals.results_ready.emit(self._pending_results)
+            self._pending_results = []
+
+    def run(self):
+        calculator = BonusCalculator(self.database, self.config_manager)
+        try:
+            results = calculator.calculate_bonuses_for_department(
+                self.year, self.month, self.department, self.working_days, self.salary_adjustments,
+                store_run=True, progress_callback=self._on_progress, cancel_event=self.cancel_event
+            )
+        except CalculationCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            # Pool threads expire when idle; do not keep their connection open for the session
+            self.database.close_thread_connection()
+
+        self._flush_results()
+        self.signals.finished.emit(results or [])
@@ -1,13 +1,34 @@
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import json
+import logging
 import math
-from PyQt6.QtWidgets import QMessageBox
+import multiprocessing
+import os
+
+from formula_compiler import build_columns, compile_formula, get_variable_dependency_index
+from instrumentation import instrumented, span
+from salary_proration import SalaryProrationEngine
+from working_calendar import WorkingCalendar
+
+logger = logging.getLogger(__name__)
+
+
+class CalculationCancelled(Exception):
+    """Raised inside a calculation when its cancel event is set"""
 
 
 class BonusCalculator:
+    # Evaluate formula KPIs over whole columns with numpy when a run has at least this many employees
+    VECTORIZE_FORMULAS = True
+    VECTORIZE_MIN_EMPLOYEES = 16
+
     def __init__(self, database, config_manager):
         self.database = database
         self.config_manager = config_manager
 
+    @instrumented("BonusCalculator.calculate_monthly_bonus")
     def calculate_monthly_bonus(self, employee_id, year, month, proportional_salary=None):
         """Calculate bonus for an employee for a specific month"""
         # Get employee data
@@ -20,34 +41,57 @@ class BonusCalculator:
         # Use proportional salary if provided, otherwise use current salary
         if proportional_salary is not None:
             monthly_salary = proportional_salary
-            print(f"DEBUG: Using proportional salary for {employee['first_name']}: ${monthly_salary:,.2f}")
+            logger.debug("Using proportional salary for %s: $%.2f", employee['first_name'], monthly_salary)
         else:
             monthly_salary = employee["salary"]
-            print(f"DEBUG: Using current salary for {employee['first_name']}: ${monthly_salary:,.2f}")
+            logger.debug("Using current salary for %s: $%.2f", employee['first_name'], monthly_salary)
 
         # Get applicable KPIs
         kpis = self.config_manager.get_kpis()
-        print(f"DEBUG: Found {len(kpis)} total KPIs")
-
         applicable_kpis = [kpi for kpi in kpis if self._is_kpi_applicable(kpi, employee)]
 
-        print(f"DEBUG: {len(applicable_kpis)} KPIs applicable to {employee['first_name']} in {employee['department']}")
-
         # Get custom variables
         custom_variables = []
         if self.database:
             try:
                 custom_variables = self.database.get_custom_variables()
             except Exception as e:
-                print(f"Error loading custom variables: {e}")
+                logger.error("Error loading custom variables: %s", e)
 
-        # Calculate bonus based on KPIs
+        # Get ACTUAL variable values from database
+        variable_values = {}
+        if self.database:
+            variable_values = self.database.get_employee_variable_values(employee['id'], year, month)
+
+        return self._calculate_employee_bonus(
+            employee, applicable_kpis, monthly_salary, variable_values,
+            self._get_variable_defaults(custom_variables), year, month
+        )
+
+    def _calculate_employee_bonus(self, employee, applicable_kpis, monthly_salary, variable_values,
+                                  variable_defaults, year, month):
+        """Calculate bonus for one employee from already loaded KPIs and variable values"""
+        eval_env = self._build_eval_env(monthly_salary, variable_values, variable_defaults)
+        kpi_amounts = [self._calculate_kpi_bonus(kpi, monthly_salary, eval_env) for kpi in applicable_kpis]
+        return self._build_bonus_result(employee, applicable_kpis, kpi_amounts, monthly_salary, year, month)
+
+    def _build_eval_env(self, monthly_salary, variable_values, variable_defaults):
+        """Create the formula evaluation environment for one employee"""
+        eval_env = {"base_salary": monthly_salary}
+        eval_env.update(variable_values)
+
+        # Add default values for any missing custom variables
+        for var_name, default_value in variable_defaults.items():
+            if var_name not in eval_env:
+                eval_env[var_name] = default_value
+        return eval_env
+
+    def _build_bonus_result(self, employee, applicable_kpis, kpi_amounts, monthly_salary, year, month):
+        """Assemble the bonus result of one employee from per-KPI amounts"""
         total_bonus = 0
         kpi_details = []
 
-        for kpi in applicable_kpis:
-            bonus_amount = self._calculate_kpi_bonus(kpi, monthly_salary, employee, custom_variables, year, month)
-            print(f"DEBUG: KPI '{kpi['name']}' calculated bonus: ${bonus_amount:.2f}")
+        for kpi, bonus_amount in zip(applicable_kpis, kpi_amounts):
             total_bonus += bonus_amount
 
             kpi_details.append({
@@ -56,10 +100,8 @@ class BonusCalculator:
                 "bonus_amount": bonus_amount
             })
 
-        print(f"DEBUG: Total bonus for {employee['first_name']}: ${total_bonus:.2f}")
-
         return {
-            "employee_id": employee_id,
+            "employee_id": employee["id"],
             "employee_name": f"{employee['last_name']} {employee['first_name']} {employee['father_name']}",
             "department": employee['department'],
             "period_month": month,
@@ -69,124 +111,84 @@ class BonusCalculator:
             "kpi_details": kpi_details
         }
 
+    def _get_variable_defaults(self, custom_variables):
+        """Get default values of custom variables for formula evaluation"""
+        defaults = {}
+        for var in custom_variables:
+            if var['data_type'] in ['number', 'percentage', 'currency']:
+                try:
+                    defaults[var['name']] = float(var.get('default_value', 0))
+                except (ValueError, TypeError):
+                    defaults[var['name']] = 0
+            else:
+                defaults[var['name']] = var.get('default_value', "")
+        return defaults
+
     def _calculate_proportional_salary(self, employee, salary_history, year, month, working_days=None):
         """Calculate proportional salary based on salary changes during the month"""
         # If no working days specified, return current salary
         if not working_days or working_days <= 0:
             return employee["salary"]
 
-        # Get first and last day of the month
-        first_day = datetime(year, month, 1)
-        if month == 12:
-            last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-
-        total_days = (last_day - first_day).days + 1
-
-        # Convert working_days to actual days proportion
-        # We assume working days are evenly distributed throughout the month
-        daily_rate = employee["salary"] / working_days if working_days > 0 else 0
-
-        # Find salary periods that overlap with the target month
-        weighted_salary = 0
-
-        for salary_record in salary_history:
-            effective_date = datetime.strptime(salary_record["effective_date"], "%Y-%m-%d")
-
-            end_date = salary_record["end_date"]
-            if end_date:
-                end_date = datetime.strptime(end_date, "%Y-%m-%d")
-            else:
-                end_date = last_day  # Current salary
-
-            # Calculate overlap period
-            period_start = max(effective_date, first_day)
-            period_end = min(end_date, last_day)
-
-            if period_start <= period_end:
-                # Calculate working days in this period
-                # Simple approximation: proportion of calendar days
-                period_calendar_days = (period_end - period_start).days + 1
-                period_working_days = max(1, int(period_calendar_days * working_days / total_days))
-
-                weighted_salary += salary_record["salary"] * period_working_days
+        proportional_salary = self._calculate_proportional_salaries([(employee, salary_history)], year, month)[0]
 
-        # Divide by total working days to get average
-        proportional_salary = weighted_salary / working_days if working_days > 0 else employee["salary"]
-
-        print(f"DEBUG: Proportional salary for {employee['first_name']}: ${proportional_salary:,.2f} "
-              f"(based on {working_days} working days)")
+        logger.debug("Proportional salary for %s: $%.2f (based on %s working days)", employee['first_name'],
+                     proportional_salary, working_days)
 
         return proportional_salary
 
+    @instrumented("BonusCalculator._calculate_proportional_salaries")
+    def _calculate_proportional_salaries(self, employee_histories, year, month):
+        """Prorate (employee, salary_history) pairs by working days, in input order"""
+        adjustments = SalaryProrationEngine.from_database(self.database, self.config_manager).prorate(
+            employee_histories, year, month
+        )
+        return [adjustments[employee["id"]]["proportional_salary"] for employee, _ in employee_histories]
+
+    @instrumented("BonusCalculator.prorate_salary_changes")
+    def prorate_salary_changes(self, year, month, employees_with_changes=None):
+        """Precompute salary adjustments for every employee with a salary change in the month
+
+        Returns {employee_id: adjustment} in the format of the salary adjustment
+        dialog, ready to pass as salary_adjustments or to review in the dialog.
+        """
+        if employees_with_changes is None:
+            employees_with_changes = self.get_employees_with_salary_changes(year, month)
+        if not employees_with_changes:
+            return {}
+
+        adjustments = SalaryProrationEngine.from_database(self.database, self.config_manager).prorate_changes(
+            employees_with_changes, year, month
+        )
+        logger.debug("Prorated salaries of %d employees with salary changes", len(adjustments))
+        return adjustments
+
     def _is_kpi_applicable(self, kpi, employee):
         """Check if KPI applies to employee's department"""
         applicable_depts = kpi.get("applicable_departments", [])
-        is_applicable = not applicable_depts or employee['department'] in applicable_depts
-        print(f"DEBUG: KPI '{kpi['name']}' for department {employee['department']} - Applicable: {is_applicable}")
-        return is_applicable
+        return not applicable_depts or employee['department'] in applicable_depts
 
-    def _calculate_kpi_bonus(self, kpi, base_salary, employee, custom_variables, year, month):
+    def _calculate_kpi_bonus(self, kpi, base_salary, eval_env):
         """Calculate bonus for a specific KPI"""
         method = kpi["calculation_method"]
-        print(f"DEBUG: Calculating KPI '{kpi['name']}' using method: {method}")
 
         if method == "percentage":
             percentage = kpi.get('percentage', 0.1)
-            bonus = base_salary * percentage
-            print(f"    Percentage Calculation: ${base_salary} * {percentage} = ${bonus:,.2f}")
-            return bonus
+            return base_salary * percentage
 
         elif method == "fixed":
-            fixed_amount = kpi.get("fixed_amount", 100)
-            print(f"DEBUG: Fixed amount: ${fixed_amount}")
-            return fixed_amount
+            return kpi.get("fixed_amount", 100)
 
         elif method == "formula":
             formula = kpi.get("formula", "base_salary * 0.05")
-            print(f"DEBUG: Formula: {formula}")
             try:
-                # Create evaluation environment with employee data
-                eval_env = {
-                    "base_salary": base_salary,
-                    "min": min,
-                    "max": max,
-                    "round": round,
-                    "sum": sum,
-                    "abs": abs
-                }
-
-                # Add ACTUAL variable values from database
-                if self.database:
-                    variable_values = self.database.get_employee_variable_values(
-                        employee['id'], year, month
-                    )
-                    eval_env.update(variable_values)
-                    print(f"DEBUG: Loaded variable values: {variable_values}")
-
-                # Add default values for any missing custom variables
-                for var in custom_variables:
-                    if var['name'] not in eval_env:  # Only add if not already set from database
-                        if var['data_type'] in ['number', 'percentage', 'currency']:
-                            try:
-                                eval_env[var['name']] = float(var.get('default_value', 0))
-                            except (ValueError, TypeError):
-                                eval_env[var['name']] = 0
-                        else:
-                            eval_env[var['name']] = var.get('default_value', "")
-
-                # Replace custom syntax
-                formula = formula.replace(" then ", " if ").replace(" else ", " else ")
-
-                result = eval(formula, {"__builtins__": {}}, eval_env)
-                print(f"DEBUG: Formula result: {result:.2f}")
-                return result
+                # Parsed and checked once per KPI, then reused for every employee
+                return compile_formula(formula, kpi.get("id")).evaluate(eval_env)
             except Exception as e:
-                print(f"DEBUG: Formula error: {e}")
+                logger.warning("Formula error in KPI '%s': %s", kpi['name'], e)
                 return 0
 
-        print(f"DEBUG: Unknown method, returning 0")
+        logger.debug("Unknown method '%s', returning 0", method)
         return 0
 
     def _get_years_of_service(self, employee, calculation_date=None):
@@ -198,105 +200,104 @@ class BonusCalculator:
         years = (calculation_date - hire_date).days / 365.25
         return max(0, years)  # Ensure non-negative
 
+    # Longest list of missing values shown per department in the unsaved values warning
+    MAX_MISSING_SHOWN = 10
+
+    @instrumented("BonusCalculator.are_variable_values_saved")
     def are_variable_values_saved(self, year, month, department):
         """Check if variable values are saved in database for the given period and department"""
         try:
-            employees = self.database.get_all_employees()
-            custom_variables = self.database.get_custom_variables()
-            kpis = self.config_manager.get_kpis()
-
-            # Filter employees by department
-            filtered_employees = []
-            for employee in employees:
-                if department == "All Departments" or employee['department'] == department:
-                    filtered_employees.append(employee)
-
-            # For each employee, check if all applicable variables have values
-            for employee in filtered_employees:
-                if employee["status"] != "Active":
-                    continue
-
-                # Get variables applicable to this employee
-                applicable_vars = self._get_applicable_variables_for_employee(employee, kpis, custom_variables)
-
-                for var_name in applicable_vars:
-                    value = self.database.get_employee_variable_value(
-                        employee['id'], var_name, year, month
-                    )
-                    if value is None:
-                        print(f"DEBUG: Missing value for {employee['id']}, variable {var_name}")
-                        return False
-
-            return True
-
+            missing = self.get_missing_variable_values(year, month, department)
         except Exception as e:
-            print(f"Error checking saved values: {e}")
+            logger.error("Error checking saved values: %s", e)
             return False
 
+        if missing:
+            logger.debug("Missing %d values in %d departments", sum(len(gaps) for gaps in missing.values()), len(missing))
+            return False
+        return True
+
+    @instrumented("BonusCalculator.get_missing_variable_values")
+    def get_missing_variable_values(self, year, month, department):
+        """Get every active employee's applicable variable without a saved value, grouped by department"""
+        index = get_variable_dependency_index(self.config_manager.get_kpis(), self.database.get_custom_variables())
+        return self.database.get_missing_variable_values(
+            year, month, index.department_variables, None if department == "All Departments" else department
+        )
+
+    @instrumented("BonusCalculator.validate_variable_values")
+    def validate_variable_values(self, year, month, department):
+        """Check saved values before a calculation
+
+        Returns {"valid": bool, "missing": {department: gaps}, "message": str}.
+        missing is None when the check itself failed, and message lists the
+        gaps for the user when the values are not valid.
+        """
+        try:
+            missing = self.get_missing_variable_values(year, month, department)
+        except Exception as e:
+            logger.error("Error checking saved values: %s", e)
+            return {"valid": False, "missing": None, "message": f"Could not check saved variable values: {e}"}
+
+        if not missing:
+            return {"valid": True, "missing": {}, "message": ""}
+
+        details = ""
+        for dept, gaps in sorted(missing.items()):
+            details += f"\n{dept} - {len(gaps)} missing:\n"
+            for gap in gaps[:self.MAX_MISSING_SHOWN]:
+                details += f"  {gap['employee_name']}: {gap['variable_name']}\n"
+            if len(gaps) > self.MAX_MISSING_SHOWN:
+                details += f"  ... and {len(gaps) - self.MAX_MISSING_SHOWN} more\n"
+
+        message = (
+            f"Variable values for {self._get_month_name(month)} {year} ({department}) have not been saved.\n"
+            f"{details}\n"
+            f"Please save the values first before calculating bonuses."
+        )
+        return {"valid": False, "missing": missing, "message": message}
+
     def _get_applicable_variables_for_employee(self, employee, kpis, custom_variables):
         """Get variables used in KPIs applicable to this employee"""
-        applicable_vars = set()
-
-        for kpi in kpis:
-            # Check if KPI applies to employee's department
-            applicable_depts = kpi.get('applicable_departments', [])
-            if not applicable_depts or employee['department'] in applicable_depts:
-                # Check which variables are used in this KPI's formula
-                formula = kpi.get('formula', '')
-                for var in custom_variables:
-                    if var['name'] in formula:
-                        applicable_vars.add(var['name'])
-
-        return list(applicable_vars)
+        index = get_variable_dependency_index(kpis, custom_variables)
+        return list(index.variables_for_department(employee['department']))
 
+    @instrumented("BonusCalculator.get_employees_with_salary_changes")
     def get_employees_with_salary_changes(self, year, month):
         """Get employees who had salary changes during the specified month - handles multiple changes"""
-        employees = self.database.get_all_employees()
-        employees_with_changes = []
+        # Only employees with a salary record taking effect this month, from one query
+        salary_histories = self.database.get_salary_histories_changed_in_period(year, month)
+        if not salary_histories:
+            return []
 
-        # Calculate month boundaries
-        first_day = datetime(year, month, 1)
-        if month == 12:
-            last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            last_day = datetime(year, month + 1, 1) - timedelta(days=1)
+        employees_with_changes = []
+        month_prefix = f"{year:04d}-{month:02d}-"
 
-        for employee in employees:
+        for employee in self.database.get_all_employees():
             if employee["status"] != "Active":
                 continue
 
-            # Get salary history
-            salary_history = self.database.get_employee_salary_history(employee["id"])
-
+            salary_history = salary_histories.get(employee["id"])
             if not salary_history or len(salary_history) <= 1:
-                continue  # No history or only one salary record
-
-            # Sort by effective date
-            salary_history.sort(key=lambda x: x['effective_date'])
+                continue  # No change this month or only one salary record
 
             # Collect all changes within this month
             month_changes = []
 
-            for i in range(len(salary_history)):
-                record = salary_history[i]
-                effective_date = datetime.strptime(record["effective_date"], "%Y-%m-%d")
-
-                # Check if this change happened within this month
-                if first_day <= effective_date <= last_day:
+            for i, record in enumerate(salary_history):
+                # Dates are stored as YYYY-MM-DD, so the month check needs no parsing
+                if record["effective_date"].startswith(month_prefix):
                     # Get previous salary (either from previous record or current)
                     if i > 0:
-                        prev_record = salary_history[i - 1]
-                        prev_salary = prev_record["salary"]
-                        prev_effective_date = datetime.strptime(prev_record["effective_date"], "%Y-%m-%d")
+                        prev_salary = salary_history[i - 1]["salary"]
                     else:
                         # First record in history, use employee's current as previous?
                         prev_salary = record["salary"]  # This is tricky
-                        prev_effective_date = first_day
 
                     # Only add if it's a real change (different salary)
                     if prev_salary != record["salary"]:
                         month_changes.append({
-                            'change_date': effective_date,
+                            'change_date': datetime.strptime(record["effective_date"], "%Y-%m-%d"),
                             'old_salary': prev_salary,
                             'new_salary': record["salary"]
                         })
@@ -310,98 +311,527 @@ class BonusCalculator:
 
         return employees_with_changes
 
-    def calculate_bonuses_with_validation(self, year, month, department, parent_dialog=None, working_days=None,
-                                          salary_adjustments=None):
-        """Calculate bonuses with validation for saved variable values"""
-        # Check if values are saved
-        if not self.are_variable_values_saved(year, month, department):
-            if parent_dialog:
-                reply = QMessageBox.warning(
-                    parent_dialog,
-                    "Unsaved Changes",
-                    f"Variable values for {self._get_month_name(month)} {year} ({department}) have not been saved.\n\n"
-                    f"Please save the values first before calculating bonuses.",
-                    QMessageBox.StandardButton.Ok
-                )
-            return None
+    @instrumented("BonusCalculator.calculate_bonuses_with_validation")
+    def calculate_bonuses_with_validation(self, year, month, department, working_days=None, salary_adjustments=None):
+        """Calculate and store bonuses if every variable value is saved
+
+        Returns (results, validation); results is None when validation failed.
+        """
+        validation = self.validate_variable_values(year, month, department)
+        if not validation["valid"]:
+            return None, validation
 
         # Calculate bonuses
-        return self.calculate_bonuses_for_department(year, month, department, working_days, salary_adjustments)
+        return self.calculate_bonuses_for_department(year, month, department, working_days, salary_adjustments,
+                                                     store_run=True), validation
+
+    @instrumented("BonusCalculator.calculate_bonuses_for_department")
+    def calculate_bonuses_for_department(self, year, month, department, working_days=None, salary_adjustments=None,
+                                         store_run=False, progress_callback=None, cancel_event=None):
+        """Calculate bonuses for a specific department and period, optionally storing the run
+
+        progress_callback(done, total, result) is called as each employee finishes.
+        Setting cancel_event (a threading.Event) stops the run with
+        CalculationCancelled before anything is stored.
+        """
+        if store_run:
+            return self.recalculate_and_store_bonuses(year, month, department, working_days, salary_adjustments,
+                                                      progress_callback, cancel_event)
+
+        results, _ = self._calculate_department_run(year, month, department, working_days, salary_adjustments,
+                                                    progress_callback=progress_callback, cancel_event=cancel_event)
+        return results
 
-    def calculate_bonuses_for_department(self, year, month, department, working_days=None, salary_adjustments=None):
-        """Calculate bonuses for a specific department and period"""
-        employees = self.database.get_all_employees()
-        results = []
+    @instrumented("BonusCalculator.recalculate_and_store_bonuses")
+    def recalculate_and_store_bonuses(self, year, month, department, working_days=None, salary_adjustments=None,
+                                      progress_callback=None, cancel_event=None):
+        """Bring the stored run of a period up to date, recomputing only employees whose inputs changed
+
+        Falls back to a full run when nothing is stored yet, the working days
+        differ, the stored run does not record its salary adjustments, or a
+        change affects everyone (KPIs, custom variables, config).
+        """
+        # Taken before loading inputs, so changes made during the run stay dirty
+        dirty_mark_id = self.database.get_last_dirty_mark_id()
+        run = self.database.get_latest_bonus_run(year, month, department)
+        adjusted_salaries = self._adjusted_salaries(salary_adjustments)
+
+        dirty_employee_ids = None
+        if run is not None and run["working_days"] == working_days and run["salary_adjustments"] is not None:
+            dirty_employee_ids = self.database.get_dirty_employee_ids(run["dirty_mark_id"], year, month)
+
+        if dirty_employee_ids is None:
+            results, input_fingerprint = self._calculate_department_run(
+                year, month, department, working_days, salary_adjustments,
+                progress_callback=progress_callback, cancel_event=cancel_event
+            )
+            if results:
+                run_id = self.database.save_bonus_run({
+                    "period_year": year,
+                    "period_month": month,
+                    "department": department,
+                    "working_days": working_days,
+                    "input_fingerprint": input_fingerprint,
+                    "dirty_mark_id": dirty_mark_id,
+                    "salary_adjustments": adjusted_salaries
+                }, results)
+                logger.debug("Stored bonus run %s with %d results", run_id, len(results))
+            return results
+
+        # Recompute employees whose manual salary adjustment was added, changed or dropped since the run
+        stored_salaries = run["salary_adjustments"]
+        dirty_employee_ids.update(
+            employee_id for employee_id in stored_salaries.keys() | adjusted_salaries.keys()
+            if stored_salaries.get(employee_id) != adjusted_salaries.get(employee_id)
+        )
+        if not dirty_employee_ids:
+            logger.debug("Bonus run %s is up to date", run['id'])
+            return self.database.get_bonus_run_results(run["id"])
+
+        results, input_fingerprint = self._calculate_department_run(
+            year, month, department, working_days, salary_adjustments, dirty_employee_ids,
+            progress_callback, cancel_event
+        )
+
+        # Chain the fingerprint onto the stored one, as only the changed inputs were loaded
+        chained_fingerprint = hashlib.sha256(f"{run['input_fingerprint']}:{input_fingerprint}".encode("utf-8")).hexdigest()
+        self.database.update_bonus_run(run["id"], {
+            "input_fingerprint": chained_fingerprint,
+            "dirty_mark_id": dirty_mark_id,
+            "salary_adjustments": adjusted_salaries
+        }, results, dirty_employee_ids)
+        logger.debug("Recalculated %d of %d dirty employees in bonus run %s", len(results), len(dirty_employee_ids),
+                     run['id'])
+
+        return self.database.get_bonus_run_results(run["id"])
+
+    @instrumented("BonusCalculator.get_stored_bonuses")
+    def get_stored_bonuses(self, year, month, department):
+        """Get the results of the latest stored run for a period, or None if it was never calculated"""
+        run = self.database.get_latest_bonus_run(year, month, department)
+        if run is None:
+            return None
+        return self.database.get_bonus_run_results(run["id"])
+
+    @instrumented("BonusCalculator.get_outdated_employee_ids")
+    def get_outdated_employee_ids(self, run, results):
+        """Get IDs of employees whose inputs changed since a stored run with the given results
+
+        Returns None when every result is outdated, e.g. after a KPI, custom
+        variable or config change, and an empty set when the run is current.
+        """
+        dirty_employee_ids = self.database.get_dirty_employee_ids(run["dirty_mark_id"], run["period_year"],
+                                                                  run["period_month"])
+        if dirty_employee_ids is None or not dirty_employee_ids:
+            return dirty_employee_ids
+
+        # Marks are per employee, so keep those in the run or in its department now
+        directory = self.database.get_employee_directory()
+        run_employee_ids = {result["employee_id"] for result in results}
+        return {
+            employee_id for employee_id in dirty_employee_ids
+            if employee_id in run_employee_ids or (employee_id in directory and (
+                run["department"] == "All Departments" or directory[employee_id]["department"] == run["department"]))
+        }
 
-        for employee in employees:
-            # Apply department filter
-            if department != "All Departments" and employee["department"] != department:
-                continue
+    def iter_bonuses_for_range(self, department, start, end, working_days=None, store_runs=False, cancel_event=None):
+        """Calculate a department month by month over an inclusive range of (year, month), yielding each month
+
+        Employees, KPIs, custom variables, every variable value of the range and
+        the salary histories changing in it are loaded once; each month is then
+        calculated from that shared data, so a year costs a handful of queries.
+
+        Yields {"period_year", "period_month", "results", "ytd"}, where ytd is the
+        running year-to-date totals {employee_id: {employee_name, department,
+        months, total_base_salary, total_bonus}} including that month, counted
+        from January or the start of the range. It is updated in place and
+        replaced by a new dict each January. working_days
+        applies to every month and defaults to each month's working days on the
+        working calendar. With store_runs every month is stored as a bonus run.
+        """
+        (start_year, start_month), (end_year, end_month) = start, end
+        if (start_year, start_month) > (end_year, end_month):
+            raise ValueError(f"Range start {start_year}-{start_month:02d} is after its end {end_year}-{end_month:02d}")
+
+        with span("BonusCalculator.load_range_inputs"):
+            # Taken before loading inputs, so changes made during the range stay dirty
+            dirty_mark_id = self.database.get_last_dirty_mark_id() if store_runs else None
+            employees = [
+                employee for employee in self.database.get_all_employees()
+                if (department == "All Departments" or employee["department"] == department)
+                and employee["status"].lower() == "active"
+            ]
+            kpis = self.config_manager.get_kpis()
+            variable_defaults = self._get_variable_defaults(self.database.get_custom_variables())
+            range_values = self.database.get_range_variable_values(start_year, start_month, end_year, end_month)
+            salary_histories = self.database.get_salary_histories_changed_in_range(
+                start_year, start_month, end_year, end_month
+            )
+            working_calendar = WorkingCalendar.from_database(self.database, self.config_manager)
+
+        ytd = {}
+        year, month = start_year, start_month
+        while (year, month) <= (end_year, end_month):
+            if month == 1:
+                ytd = {}
+
+            with span("BonusCalculator.range_month"):
+                month_working_days = working_days
+                if month_working_days is None:
+                    month_working_days = int(round(working_calendar.month_working_days(year, month)))
+                period_values = range_values.pop((year, month), {})
+                month_histories = {}
+                if month_working_days and month_working_days > 0:
+                    # Same histories a single-month run loads: a record taking effect this month
+                    month_prefix = f"{year:04d}-{month:02d}-"
+                    month_histories = {
+                        employee_id: salary_history for employee_id, salary_history in salary_histories.items()
+                        if any(record["effective_date"].startswith(month_prefix) for record in salary_history)
+                    }
+
+                results = []
+                if employees:
+                    results = self._calculate_loaded_run(
+                        year, month, department, employees, kpis, variable_defaults, period_values,
+                        month_histories, cancel_event=cancel_event
+                    )
+
+                if store_runs and results:
+                    input_fingerprint = self._get_input_fingerprint(
+                        year, month, department, month_working_days, employees, kpis, variable_defaults,
+                        period_values, month_histories, None
+                    )
+                    run_id = self.database.save_bonus_run({
+                        "period_year": year,
+                        "period_month": month,
+                        "department": department,
+                        "working_days": month_working_days,
+                        "input_fingerprint": input_fingerprint,
+                        "dirty_mark_id": dirty_mark_id
+                    }, results)
+                    logger.debug("Stored bonus run %s with %d results", run_id, len(results))
+
+                for result in results:
+                    totals = ytd.get(result["employee_id"])
+                    if totals is None:
+                        totals = ytd[result["employee_id"]] = {
+                            "employee_id": result["employee_id"],
+                            "employee_name": result["employee_name"],
+                            "department": result["department"],
+                            "months": 0,
+                            "total_base_salary": 0,
+                            "total_bonus": 0
+                        }
+                    totals["months"] += 1
+                    totals["total_base_salary"] += result["base_salary"]
+                    totals["total_bonus"] += result["calculated_bonus"]
+
+            yield {"period_year": year, "period_month": month, "results": results, "ytd": ytd}
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    @instrumented("BonusCalculator.calculate_bonuses_for_range")
+    def calculate_bonuses_for_range(self, department, start, end, working_days=None, store_runs=False):
+        """Calculate every month of an inclusive range, e.g. ((2024, 1), (2024, 12)) for a year-end run
+
+        Returns {"months": [{period_year, period_month, results}], "ytd": {year: year-to-date totals}},
+        see iter_bonuses_for_range for the formats.
+        """
+        months = []
+        ytd_by_year = {}
+        for month_result in self.iter_bonuses_for_range(department, start, end, working_days, store_runs):
+            ytd_by_year[month_result["period_year"]] = month_result.pop("ytd")
+            months.append(month_result)
+        return {"months": months, "ytd": ytd_by_year}
+
+    @instrumented("BonusCalculator.calculate_periods_parallel")
+    def calculate_periods_parallel(self, periods, departments=None, working_days=None, store_runs=False,
+                                   max_workers=None):
+        """Calculate many departments and periods at once on a process pool
+
+        periods is a list of (year, month). Work is split into one partition per
+        (period, department); each worker process reads through its own read-only
+        connection. departments defaults to every active department, and
+        working_days to the working days of each month on the working calendar.
+
+        Returns {(year, month, department): results} ordered by period then
+        department, whatever order the partitions finish in. With store_runs the
+        results are stored as bonus runs by this process, the only writer.
+        Worker processes log at the level of this process's root logger.
+        """
+        if departments is None:
+            departments = [name for name, status in self.config_manager.get_departments().items()
+                           if status == "active"]
+
+        working_calendar = WorkingCalendar.from_database(self.database, self.config_manager)
+        partitions = []
+        for year, month in sorted(set(periods)):
+            period_working_days = working_days
+            if period_working_days is None:
+                period_working_days = int(round(working_calendar.month_working_days(year, month)))
+            for department in sorted(set(departments)):
+                partitions.append((year, month, department, period_working_days))
+
+        # Taken before any input is read, so changes made during the run stay dirty
+        dirty_mark_id = self.database.get_last_dirty_mark_id()
+
+        max_workers = min(max_workers or os.cpu_count() or 1, len(partitions))
+        if max_workers <= 1:
+            outputs = [self._calculate_department_run(year, month, department, period_working_days)
+                       for year, month, department, period_working_days in partitions]
+        else:
+            # spawn gives every worker a clean interpreter instead of a fork of open SQLite connections
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_parallel_worker,
+                                     initargs=(self.database.db_path, self.config_manager.config_file,
+                                               logging.getLogger().getEffectiveLevel())) as executor:
+                outputs = list(executor.map(_calculate_parallel_partition, partitions))
+
+        merged = {}
+        for (year, month, department, period_working_days), (results, input_fingerprint) in zip(partitions, outputs):
+            merged[(year, month, department)] = results
+            if store_runs and results:
+                self.database.save_bonus_run({
+                    "period_year": year,
+                    "period_month": month,
+                    "department": department,
+                    "working_days": period_working_days,
+                    "input_fingerprint": input_fingerprint,
+                    "dirty_mark_id": dirty_mark_id
+                }, results)
+
+        logger.info("Calculated %d department periods on %d processes", len(partitions), max_workers)
+        return merged
+
+    def _adjusted_salaries(self, salary_adjustments):
+        """Reduce salary adjustments to {employee_id: salary}, the part a run's results depend on"""
+        return {employee_id: adjustment["proportional_salary"]
+                for employee_id, adjustment in (salary_adjustments or {}).items()}
+
+    @instrumented("BonusCalculator._get_input_fingerprint")
+    def _get_input_fingerprint(self, year, month, department, working_days, employees, kpis, variable_defaults,
+                               period_values, salary_histories, salary_adjustments):
+        """Hash everything a run's results depend on, so identical inputs give the same fingerprint"""
+        employee_ids = [employee["id"] for employee in employees]
+        inputs = {
+            "period": [year, month, department, working_days],
+            "employees": employees,
+            "kpis": kpis,
+            "variable_defaults": variable_defaults,
+            "variable_values": {emp_id: period_values.get(emp_id, {}) for emp_id in employee_ids},
+            "salary_histories": {emp_id: salary_histories.get(emp_id, []) for emp_id in employee_ids},
+            "salary_adjustments": self._adjusted_salaries(salary_adjustments),
+        }
+        encoded = json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    @instrumented("BonusCalculator._calculate_department_run")
+    def _calculate_department_run(self, year, month, department, working_days=None, salary_adjustments=None,
+                                  employee_ids=None, progress_callback=None, cancel_event=None):
+        """Calculate bonuses for a department from bulk-loaded data, returning (results, input fingerprint)
+
+        employee_ids limits the run to those employees, for incremental recalculation.
+        """
+        with span("BonusCalculator.load_inputs"):
+            employees = [
+                employee for employee in self.database.get_all_employees()
+                if (department == "All Departments" or employee["department"] == department)
+                and employee["status"].lower() == "active"
+                and (employee_ids is None or employee["id"] in employee_ids)
+            ]
+            if not employees:
+                return [], None
+
+            # Load everything the run needs once instead of once per employee
+            kpis = self.config_manager.get_kpis()
+            variable_defaults = self._get_variable_defaults(self.database.get_custom_variables())
+            period_values = self.database.get_period_variable_values(year, month)
+            salary_histories = {}
+            if working_days and working_days > 0:
+                # Only employees with a salary change in the month need proration
+                salary_histories = self.database.get_salary_histories_changed_in_period(year, month)
+
+        input_fingerprint = self._get_input_fingerprint(
+            year, month, department, working_days, employees, kpis, variable_defaults,
+            period_values, salary_histories, salary_adjustments
+        )
+
+        results = self._calculate_loaded_run(
+            year, month, department, employees, kpis, variable_defaults, period_values, salary_histories,
+            salary_adjustments, progress_callback, cancel_event
+        )
+        return results, input_fingerprint
+
+    def _calculate_loaded_run(self, year, month, department, employees, kpis, variable_defaults, period_values,
+                              salary_histories, salary_adjustments=None, progress_callback=None, cancel_event=None):
+        """Calculate a department's bonuses for a month from inputs that are already loaded
+
+        salary_histories may hold employees without a change in this month; only
+        those with one are prorated.
+        """
+        with span("BonusCalculator.build_rows"):
+            # Applicable KPIs are the same for every employee of a department
+            department_plans = {}
+            rows = []
+            prorated = []
 
-            if employee["status"].lower() == "active":
-                proportional_salary = None
+            for employee in employees:
+                applicable_kpis = department_plans.get(employee["department"])
+                if applicable_kpis is None:
+                    applicable_kpis = [kpi for kpi in kpis if self._is_kpi_applicable(kpi, employee)]
+                    department_plans[employee["department"]] = applicable_kpis
+
+                monthly_salary = employee["salary"]
 
                 # Check if we have manual salary adjustments from dialog
                 if salary_adjustments and employee['id'] in salary_adjustments:
-                    proportional_salary = salary_adjustments[employee['id']]['proportional_salary']
-                    print(f"DEBUG: Using manual adjustment for {employee['first_name']}: ${proportional_salary:,.2f}")
+                    monthly_salary = salary_adjustments[employee['id']]['proportional_salary']
                 # Otherwise, check if salary changed during the month and calculate proportional
-                elif working_days and working_days > 0:
-                    # Get salary history for this employee
-                    salary_history = self.database.get_employee_salary_history(employee["id"])
-
-                    # Check if there were any salary changes in this month
-                    has_change_in_month = False
-                    if salary_history and len(salary_history) > 1:
-                        salary_history.sort(key=lambda x: x['effective_date'])
-                        for record in salary_history:
-                            effective_date = datetime.strptime(record["effective_date"], "%Y-%m-%d")
-                            if effective_date.year == year and effective_date.month == month and effective_date.day != 1:
-                                has_change_in_month = True
-                                break
-
-                    # If salary changed, calculate proportional salary
-                    if has_change_in_month:
-                        proportional_salary = self._calculate_proportional_salary(
-                            employee, salary_history, year, month, working_days
-                        )
-
-                result = self.calculate_monthly_bonus(employee["id"], year, month, proportional_salary)
-                if result:
-                    results.append(result)
-
+                elif salary_histories:
+                    salary_history = salary_histories.get(employee["id"], [])
+                    if self._has_salary_change_in_month(salary_history, year, month):
+                        prorated.append((len(rows), employee, salary_history))
+
+                eval_env = self._build_eval_env(monthly_salary, period_values.get(employee["id"], {}), variable_defaults)
+                rows.append((employee, applicable_kpis, monthly_salary, eval_env))
+
+        if prorated:
+            with span("BonusCalculator.prorate"):
+                # Count the working days of every changed employee in one batch
+                salaries = self._calculate_proportional_salaries(
+                    [(employee, salary_history) for _, employee, salary_history in prorated], year, month
+                )
+                for (index, employee, _), monthly_salary in zip(prorated, salaries):
+                    eval_env = self._build_eval_env(monthly_salary, period_values.get(employee["id"], {}), variable_defaults)
+                    rows[index] = (employee, rows[index][1], monthly_salary, eval_env)
+                logger.debug("Prorated %d salaries by working days", len(prorated))
+
+        vector_results = {}
+        if self.VECTORIZE_FORMULAS and len(rows) >= self.VECTORIZE_MIN_EMPLOYEES:
+            vector_results = self._evaluate_formulas_vectorized(kpis, rows)
+
+        with span("BonusCalculator.evaluate"):
+            results = []
+            for index, (employee, applicable_kpis, monthly_salary, eval_env) in enumerate(rows):
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("Bonus calculation for %s cancelled after %d of %d employees", department, index, len(rows))
+                    raise CalculationCancelled()
+
+                kpi_amounts = []
+                for kpi in applicable_kpis:
+                    column = vector_results.get(id(kpi))
+                    amount = column[index] if column is not None else None
+                    if amount is None:
+                        amount = self._calculate_kpi_bonus(kpi, monthly_salary, eval_env)
+                    kpi_amounts.append(amount)
+                results.append(self._build_bonus_result(employee, applicable_kpis, kpi_amounts, monthly_salary, year, month))
+                if progress_callback is not None:
+                    progress_callback(index + 1, len(rows), results[-1])
+
+        logger.debug("Calculated %d bonuses for %s using %d department plans", len(results), department,
+                     len(department_plans))
         return results
 
+    @instrumented("BonusCalculator._evaluate_formulas_vectorized")
+    def _evaluate_formulas_vectorized(self, kpis, rows):
+        """Evaluate every formula KPI over all applicable employees at once
+
+        Returns {id(kpi): values} with one entry per row (None where the KPI does
+        not apply or the row must be evaluated by the scalar path). Formulas that
+        cannot be vectorized are left out and use the scalar path entirely.
+        """
+        columns = build_columns([row[3] for row in rows])
+        if not columns:
+            return {}
+
+        # Rows share one applicable-KPI list per department
+        plan_kpi_ids = {}
+        for row in rows:
+            if id(row[1]) not in plan_kpi_ids:
+                plan_kpi_ids[id(row[1])] = {id(kpi) for kpi in row[1]}
+
+        vector_results = {}
+        for kpi in kpis:
+            if kpi["calculation_method"] != "formula":
+                continue
+
+            row_indices = [index for index, row in enumerate(rows) if id(kpi) in plan_kpi_ids[id(row[1])]]
+            if not row_indices:
+                continue
+
+            try:
+                compiled = compile_formula(kpi.get("formula", "base_salary * 0.05"), kpi.get("id"))
+            except Exception:
+                continue  # The scalar path reports the error
+
+            values = compiled.evaluate_columns(columns, row_indices)
+            if values is None:
+                continue
+
+            column = [None] * len(rows)
+            for index, value in zip(row_indices, values):
+                column[index] = value
+            vector_results[id(kpi)] = column
+
+        logger.debug("Vectorized %d formula KPIs over %d employees", len(vector_results), len(rows))
+        return vector_results
+
+    def _has_salary_change_in_month(self, salary_history, year, month):
+        """Check if a salary record takes effect after the first day of the month"""
+        if len(salary_history) <= 1:
+            return False
+
+        month_prefix = f"{year:04d}-{month:02d}-"
+        return any(
+            record["effective_date"].startswith(month_prefix) and not record["effective_date"].endswith("-01")
+            for record in salary_history
+        )
+
     def _get_month_name(self, month):
         """Get month name from month number"""
         months = ["January", "February", "March", "April", "May", "June",
                   "July", "August", "September", "October", "November", "December"]
         return months[month - 1] if 1 <= month <= 12 else f"Month {month}"
 
-    def validate_and_calculate_bonuses(self, year, month, department, parent_dialog=None):
-        """Complete validation and calculation workflow - used by variable entry dialog"""
-        print(f"DEBUG: validate_and_calculate_bonuses called with year={year}, month={month}, department={department}")
+    @instrumented("BonusCalculator.validate_and_calculate_bonuses")
+    def validate_and_calculate_bonuses(self, year, month, department):
+        """Complete validation and calculation workflow - used by variable entry dialog
+
+        Returns (results, validation); results is None when validation failed.
+        """
+        logger.debug("validate_and_calculate_bonuses called with year=%s, month=%s, department=%s", year, month,
+                     department)
 
         # Check if values are saved
-        are_saved = self.are_variable_values_saved(year, month, department)
-        print(f"DEBUG: are_variable_values_saved returned: {are_saved}")
-
-        if not are_saved:
-            print("DEBUG: Values not saved, showing warning and returning None")
-            if parent_dialog:
-                from PyQt6.QtWidgets import QMessageBox
-                reply = QMessageBox.warning(
-                    parent_dialog,
-                    "Unsaved Changes",
-                    f"Variable values for {self._get_month_name(month)} {year} ({department}) have not been saved.\n\n"
-                    f"Please save the values first before calculating bonuses.",
-                    QMessageBox.StandardButton.Ok
-                )
-            return None
+        validation = self.validate_variable_values(year, month, department)
+        if not validation["valid"]:
+            logger.debug("Values not saved, returning the validation result")
+            return None, validation
 
         # Calculate and return bonuses (without working days for variable entry dialog)
-        print("DEBUG: Values are saved, calculating bonuses...")
-        results = self.calculate_bonuses_for_department(year, month, department)
-        print(
-            f"DEBUG: calculate_bonuses_for_department returned: {type(results)} with {len(results) if isinstance(results, list) else 'non-list'} items")
-        return results
\ No newline at end of file
+        logger.debug("Values are saved, calculating bonuses")
+        results = self.calculate_bonuses_for_department(year, month, department, store_run=True)
+        logger.debug("calculate_bonuses_for_department returned %d results", len(results))
+        return results, validation
+
+
+# Calculator of the current parallel worker process, set up once by the pool initializer
+_parallel_calculator = None
+
+
+def _init_parallel_worker(db_path, config_file, log_level=logging.WARNING):
+    """Open a read-only database and the configuration in a worker process"""
+    global _parallel_calculator
+    from config_manager import ConfigManager
+    from database import Database
+
+    # Spawned workers start without the caller's logging setup; log to stderr at the caller's level
+    logging.basicConfig(level=log_level, format="%(levelname)s: %(message)s")
+
+    database = Database(db_path, read_only=True)
+    _parallel_calculator = BonusCalculator(database, ConfigManager(config_file, database))
+
+
+def _calculate_parallel_partition(partition):
+    """Calculate one (year, month, department, working days) partition, returning (results, input fingerprint)"""
+    year, month, department, working_days = partition
+    return _parallel_calculator._calculate_department_run(year, month, department, working_days)
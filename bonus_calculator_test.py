@@ -0,0 +1,53 @@
+# bonus_calculator_test.py
+import pytest
+
+from bonus_calculator import BonusCalculator
+from config_manager import ConfigManager
+from database import Database
+from employee_utils import create_employee_with_history
+
+
+@pytest.fixture
+def calculator(tmp_path):
+    database = Database(str(tmp_path / "bonus_system.db"))
+    config_manager = ConfigManager(str(tmp_path / "config.json"), database)
+    config_manager.add_kpi({"name": "Base", "calculation_method": "formula", "formula": "base_salary * 0.1",
+                            "applicable_departments": ["Sales"], "weight": 1.0, "is_active": True})
+    for employee_id, salary in (("S1", 3000.0), ("S2", 4000.0)):
+        database.save_employee(create_employee_with_history({
+            "id": employee_id, "first_name": employee_id, "last_name": "Test", "hire_date": "2024-01-01",
+            "department": "Sales", "salary": salary, "status": "active"
+        }))
+    yield BonusCalculator(database, config_manager)
+    database.close()
+
+
+def _base_salaries(results):
+    return {result["employee_id"]: result["base_salary"] for result in results}
+
+
+def test_stored_run_follows_added_changed_and_dropped_salary_adjustments(calculator):
+    calculate = calculator.recalculate_and_store_bonuses
+
+    assert _base_salaries(calculate(2024, 3, "Sales")) == {"S1": 3000.0, "S2": 4000.0}
+    assert _base_salaries(calculate(2024, 3, "Sales", salary_adjustments={"S1": {"proportional_salary": 2000.0}})) \
+        == {"S1": 2000.0, "S2": 4000.0}
+    assert _base_salaries(calculate(2024, 3, "Sales", salary_adjustments={"S1": {"proportional_salary": 2500.0}})) \
+        == {"S1": 2500.0, "S2": 4000.0}
+    assert _base_salaries(calculate(2024, 3, "Sales")) == {"S1": 3000.0, "S2": 4000.0}
+
+    run = calculator.database.get_latest_bonus_run(2024, 3, "Sales")
+    assert run["salary_adjustments"] == {}
+
+
+def test_stored_run_reports_employees_changed_since(calculator):
+    results = calculator.recalculate_and_store_bonuses(2024, 3, "Sales")
+    run = calculator.database.get_latest_bonus_run(2024, 3, "Sales")
+    assert calculator.get_outdated_employee_ids(run, results) == set()
+
+    calculator.database.mark_bonuses_dirty("S2", 2024, 3)
+    calculator.database.mark_bonuses_dirty("OTHER", 2024, 3)
+    assert calculator.get_outdated_employee_ids(run, results) == {"S2"}
+
+    calculator.database.mark_bonuses_dirty()
+    assert calculator.get_outdated_employee_ids(run, results) is None
@@ -0,0 +1,303 @@
+# bonus_cli.py
+"""Headless bonus calculation, e.g. for nightly jobs:
+
+    python bonus_cli.py calculate --year 2024 --month 3 --department Sales --output march.csv
+    python bonus_cli.py calculate --year 2024 --month 1-12 --parallel --output 2024.json
+    python bonus_cli.py export --year 2024 --month 1-12 --output 2024.xlsx
+    python bonus_cli.py import --file new_hires.csv --errors failed_rows.csv
+    python bonus_cli.py import-variables --file sales_march.xlsx --year 2024 --month 3 --dry-run --diff diff.csv
+
+Only the Qt-free core is imported, so no display is needed.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from bonus_calculator import BonusCalculator
+from bulk_import import DEFAULT_BATCH_SIZE, import_csv, write_error_report
+from config_manager import ConfigManager
+from database import Database
+import instrumentation
+from result_export import (EXPORT_FORMATS, ExportError, export_fields, export_results,
+                           iter_calculated_results, iter_export_rows, iter_stored_results, write_csv_rows)
+from variable_import import VariableImportError, import_variable_values, write_diff
+from working_calendar import WorkingCalendar
+
+# Exit codes
+EXIT_OK = 0
+EXIT_VALIDATION_FAILED = 2
+EXIT_EXPORT_FAILED = 3
+EXIT_IMPORT_ROWS_FAILED = 4
+
+logger = logging.getLogger("bonus_cli")
+
+
+def parse_months(value):
+    """Parse a month or an inclusive month range such as 1-12"""
+    first, _, last = value.partition("-")
+    try:
+        months = list(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month or month range: '{value}'")
+    if not months or months[0] < 1 or months[-1] > 12:
+        raise argparse.ArgumentTypeError(f"months must be between 1 and 12: '{value}'")
+    return months
+
+
+def write_results(results, output=None, output_format=None, stdout=None, include_kpis=False):
+    """Write results as CSV, JSON, XLSX or Parquet to a file, or as CSV/JSON to stdout when output is None or '-'
+
+    results may be any iterable of result dicts; CSV, XLSX and Parquet are streamed.
+    Returns the number of rows written.
+    """
+    to_stdout = not output or output == "-"
+    if output_format is None:
+        extension = "" if to_stdout else os.path.splitext(output)[1].lower().lstrip(".")
+        output_format = extension if extension in EXPORT_FORMATS + ["json"] else "csv"
+
+    if output_format == "json":
+        results = list(results)
+        stream = (stdout or sys.stdout) if to_stdout else open(output, "w", encoding="utf-8")
+        try:
+            json.dump(results, stream, indent=2, default=str)
+            stream.write("\n")
+        finally:
+            if not to_stdout:
+                stream.close()
+        return len(results)
+
+    if to_stdout:
+        if output_format != "csv":
+            raise ExportError(f"{output_format.upper()} output needs a file, use --output")
+        return write_csv_rows(stdout or sys.stdout, iter_export_rows(results, include_kpis),
+                              export_fields(include_kpis))
+    return export_results(results, output, output_format, include_kpis)
+
+
+def run_calculate(args):
+    """Calculate (and by default store) the requested periods, then write the results"""
+    database = Database(args.db)
+    config_manager = ConfigManager(args.config, database)
+    calculator = BonusCalculator(database, config_manager)
+    periods = [(args.year, month) for month in args.month]
+
+    # Departments named on the command line, or the single department of a GUI-style run
+    departments = args.department or ["All Departments"]
+
+    # Check every period and department before calculating anything
+    failures = []
+    if not args.skip_validation:
+        for year, month in periods:
+            for department in departments:
+                validation = calculator.validate_variable_values(year, month, department)
+                if not validation["valid"]:
+                    failures.append(validation)
+    if failures:
+        for validation in failures:
+            print(validation["message"], file=sys.stderr)
+        return EXIT_VALIDATION_FAILED
+
+    results = []
+    if args.parallel:
+        merged = calculator.calculate_periods_parallel(
+            periods, departments, args.working_days, store_runs=not args.no_store, max_workers=args.workers
+        )
+        for partition_results in merged.values():
+            results.extend(partition_results)
+    elif args.no_store:
+        # Nothing is stored, so each department's months share one load of their inputs
+        for department in departments:
+            for month_result in calculator.iter_bonuses_for_range(department, periods[0], periods[-1],
+                                                                  args.working_days):
+                results.extend(month_result["results"])
+        results.sort(key=lambda result: (result["period_year"], result["period_month"]))
+    else:
+        working_calendar = WorkingCalendar.from_database(database, config_manager)
+        for year, month in periods:
+            working_days = args.working_days
+            if working_days is None:
+                working_days = int(round(working_calendar.month_working_days(year, month)))
+            for department in departments:
+                results.extend(calculator.calculate_bonuses_for_department(
+                    year, month, department, working_days, store_run=not args.no_store
+                ))
+
+    try:
+        write_results(results, args.output, args.format, args.stdout, args.kpis)
+    except ExportError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return EXIT_EXPORT_FAILED
+    finally:
+        database.close()
+    logger.info("Wrote %d results", len(results))
+    return EXIT_OK
+
+
+def run_export(args):
+    """Stream stored (or, with --calculate, freshly calculated) results to a file"""
+    database = Database(args.db, read_only=not args.calculate)
+    config_manager = ConfigManager(args.config, database)
+    periods = [(args.year, month) for month in args.month]
+    department = args.department
+
+    if args.calculate:
+        calculator = BonusCalculator(database, config_manager)
+        results = iter_calculated_results(calculator, department, periods[0], periods[-1], args.working_days)
+    else:
+        results = iter_stored_results(database, periods, department)
+
+    try:
+        write_results(results, args.output, args.format, args.stdout, not args.no_kpis)
+    except ExportError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return EXIT_EXPORT_FAILED
+    finally:
+        database.close()
+    return EXIT_OK
+
+
+def run_import(args):
+    """Import employees and orders from a CSV file, reporting the rows that failed"""
+    database = Database(args.db)
+    config_manager = ConfigManager(args.config, database)
+    try:
+        report = import_csv(database, args.file, config_manager.get_departments(), args.batch_size, args.dry_run)
+    finally:
+        database.close()
+
+    for error in report["errors"][:args.show_errors]:
+        print(f"Line {error['line']} ({error['employee_id'] or 'no ID'}): {error['message']}", file=sys.stderr)
+    if len(report["errors"]) > args.show_errors:
+        print(f"... and {len(report['errors']) - args.show_errors} more", file=sys.stderr)
+    if args.errors and report["errors"]:
+        write_error_report(report["errors"], args.errors)
+    return EXIT_IMPORT_ROWS_FAILED if report["errors"] else EXIT_OK
+
+
+def parse_mapping(value):
+    """Parse a --map "Column=variable_name" argument"""
+    column, separator, variable_name = value.partition("=")
+    if not separator or not column.strip() or not variable_name.strip():
+        raise argparse.ArgumentTypeError(f"'{value}' is not in the form Column=variable_name")
+    return column.strip(), variable_name.strip()
+
+
+def run_import_variables(args):
+    """Import one period's variable values from a spreadsheet, or with --dry-run only show what would change"""
+    database = Database(args.db)
+    try:
+        plan = import_variable_values(database, args.file, args.year, args.month, dict(args.map or []),
+                                      args.sheet, args.dry_run)
+    except VariableImportError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return EXIT_VALIDATION_FAILED
+    finally:
+        database.close()
+
+    if plan["unmapped_columns"]:
+        print(f"Ignored columns: {', '.join(plan['unmapped_columns'])}", file=sys.stderr)
+    changes = [entry for entry in plan["diff"] if entry["status"] != "unchanged"]
+    for entry in changes[:args.show_changes]:
+        print(f"{entry['status']}: {entry['employee_id']} {entry['variable_name']} "
+                  f"{entry['old_value']} -> {entry['new_value']}", file=sys.stderr)
+    for error in plan["errors"][:args.show_errors]:
+        print(f"Row {error['row']} ({error['employee_id'] or 'no ID'}): {error['message']}", file=sys.stderr)
+    if len(plan["errors"]) > args.show_errors:
+        print(f"... and {len(plan['errors']) - args.show_errors} more", file=sys.stderr)
+    if args.diff:
+        write_diff(plan, args.diff)
+    return EXIT_IMPORT_ROWS_FAILED if plan["errors"] else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Employee bonus system without the GUI")
+    parser.add_argument("--db", default="bonus_system.db", help="SQLite database file")
+    parser.add_argument("--config", default="config.json", help="Configuration file")
+    parser.add_argument("--quiet", action="store_true", help="Hide progress output, showing only warnings and errors")
+    parser.add_argument("--verbose", action="store_true", help="Also show debug output")
+    parser.add_argument("--profile", help="Write a profile of spans, queries and rows: .json, or .folded for flame graphs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    calculate = subparsers.add_parser("calculate", help="Calculate bonuses for one or more periods")
+    calculate.add_argument("--year", type=int, required=True)
+    calculate.add_argument("--month", type=parse_months, required=True, help="Month or range, e.g. 3 or 1-12")
+    calculate.add_argument("--department", action="append",
+                           help="Department to calculate; repeat for several (default: All Departments)")
+    calculate.add_argument("--working-days", type=int,
+                           help="Working days in the month (default: from the working calendar)")
+    calculate.add_argument("--output", help="Output file, .csv, .json, .xlsx or .parquet (default: CSV on stdout)")
+    calculate.add_argument("--format", choices=EXPORT_FORMATS + ["json"], help="Output format (default: from --output)")
+    calculate.add_argument("--kpis", action="store_true", help="Add one row per KPI with its bonus amount")
+    calculate.add_argument("--no-store", action="store_true", help="Do not store the calculation runs")
+    calculate.add_argument("--skip-validation", action="store_true",
+                           help="Calculate even if some variable values are not saved")
+    calculate.add_argument("--parallel", action="store_true",
+                           help="Calculate each department and month on a process pool")
+    calculate.add_argument("--workers", type=int, help="Worker processes for --parallel (default: CPU count)")
+    calculate.set_defaults(handler=run_calculate)
+
+    export = subparsers.add_parser("export", help="Export stored results, one row per employee and KPI")
+    export.add_argument("--year", type=int, required=True)
+    export.add_argument("--month", type=parse_months, required=True, help="Month or range, e.g. 3 or 1-12")
+    export.add_argument("--department", default="All Departments",
+                        help="Department of the stored runs (default: All Departments)")
+    export.add_argument("--output", help="Output file, .csv, .xlsx, .parquet or .json (default: CSV on stdout)")
+    export.add_argument("--format", choices=EXPORT_FORMATS + ["json"], help="Output format (default: from --output)")
+    export.add_argument("--no-kpis", action="store_true", help="One row per employee, without KPI details")
+    export.add_argument("--calculate", action="store_true",
+                        help="Calculate the results instead of reading stored runs; nothing is stored")
+    export.add_argument("--working-days", type=int,
+                        help="Working days with --calculate (default: from the working calendar)")
+    export.set_defaults(handler=run_export)
+
+    import_parser = subparsers.add_parser("import", help="Import employees and orders from a CSV file")
+    import_parser.add_argument("--file", required=True, help="CSV file of employees and/or orders")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                               help="Rows written per transaction")
+    import_parser.add_argument("--dry-run", action="store_true", help="Validate the rows without writing them")
+    import_parser.add_argument("--errors", help="Write the failed rows and their errors to this CSV file")
+    import_parser.add_argument("--show-errors", type=int, default=20, help="Failed rows printed (default: 20)")
+    import_parser.set_defaults(handler=run_import)
+
+    variables = subparsers.add_parser("import-variables",
+                                      help="Import one period's variable values from a CSV or XLSX file")
+    variables.add_argument("--file", required=True,
+                           help="Spreadsheet with an employee_id column and one column per variable")
+    variables.add_argument("--year", type=int, required=True)
+    variables.add_argument("--month", type=int, choices=range(1, 13), required=True)
+    variables.add_argument("--map", type=parse_mapping, action="append",
+                           help="Column=variable_name for a column not named after its variable; repeatable")
+    variables.add_argument("--sheet", help="Worksheet of an XLSX file (default: the active one)")
+    variables.add_argument("--dry-run", action="store_true", help="Show what would change without writing it")
+    variables.add_argument("--diff", help="Write every value with its old value and status to this CSV file")
+    variables.add_argument("--show-changes", type=int, default=20, help="Changed values printed (default: 20)")
+    variables.add_argument("--show-errors", type=int, default=20, help="Skipped cells printed (default: 20)")
+    variables.set_defaults(handler=run_import_variables)
+    return parser
+
+
+def configure_logging(quiet=False, verbose=False):
+    """Send log records to stderr: warnings and errors only when quiet, debug output too when verbose"""
+    level = logging.WARNING if quiet else logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(level=level, format="%(levelname)s: %(message)s", stream=sys.stderr, force=True)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.stdout = sys.stdout
+
+    # The core logs its progress; stdout is kept for results
+    configure_logging(args.quiet, args.verbose)
+    if args.profile:
+        instrumentation.start_profiling()
+    try:
+        return args.handler(args)
+    finally:
+        if args.profile:
+            instrumentation.stop_profiling().write(args.profile)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+# bulk_import.py
+"""Import employees and orders from a CSV file in batched transactions
+
+Every row is one of:
+- an employee: id (or employee_id), first_name, last_name, father_name,
+  hire_date, department, salary and optional status;
+- an order: order_number, employee_id, order_date, effective_date,
+  order_action, new_department and new_salary. An "employment" order also
+  creates the employee, taking the employee columns from the same row (hire
+  date, department and salary default to the order's values). Termination,
+  salary change and department change orders update the employee like the
+  order dialog does.
+
+Rows are validated as they are read; valid rows are written batch_size at a
+time with executemany, and every invalid row is reported with its line number.
+"""
+import csv
+import logging
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+
+ORDER_ACTIONS = ["employment", "termination", "salary change", "department change"]
+
+
+class RowError(Exception):
+    """A CSV row that cannot be imported"""
+
+
+def _text(row, column):
+    return (row.get(column) or "").strip()
+
+
+def _parse_date(row, column, default=None):
+    value = _text(row, column) or default
+    if not value:
+        raise RowError(f"{column} is required")
+    try:
+        if len(value) != 10:
+            raise ValueError()
+        date.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"{column} '{value}' is not a date in YYYY-MM-DD format")
+    return value
+
+
+def _parse_salary(row, column, default=None):
+    value = _text(row, column) or default
+    if not value:
+        raise RowError(f"{column} is required")
+    try:
+        salary = float(value)
+    except ValueError:
+        raise RowError(f"{column} '{value}' is not a number")
+    if salary < 0:
+        raise RowError(f"{column} cannot be negative")
+    return salary
+
+
+class BulkImporter:
+    """Validates CSV rows against the employees already stored and those imported so far
+
+    departments, if given, is the set of department names rows may use.
+    """
+
+    def __init__(self, database, departments=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.database = database
+        self.departments = set(departments) if departments is not None else None
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+        # Employee ID -> status, kept up to date as rows are accepted
+        self.statuses = {employee_id: employee["status"]
+                         for employee_id, employee in database.get_employee_directory().items()}
+
+        self.employees = []
+        self.orders = []
+        self.changes = []
+        self.changed_ids = set()
+        self.report = {"rows": 0, "employees": 0, "orders": 0, "changes": 0, "errors": [], "dry_run": dry_run}
+
+    def _check_department(self, department, column):
+        if not department:
+            raise RowError(f"{column} is required")
+        if self.departments is not None and department not in self.departments:
+            raise RowError(f"Unknown department '{department}'")
+        return department
+
+    def _parse_employee(self, row, employee_id, hire_date=None, department=None, salary=None):
+        """Build an employee in the save_employee format from the employee columns of a row"""
+        if not employee_id:
+            raise RowError("id is required")
+        if self.statuses.get(employee_id, "").lower() == "active":
+            raise RowError(f"An active employee with ID '{employee_id}' already exists")
+
+        first_name = _text(row, "first_name")
+        last_name = _text(row, "last_name")
+        if not first_name or not last_name:
+            raise RowError("first_name and last_name are required")
+
+        hire_date = _parse_date(row, "hire_date", hire_date)
+        department = self._check_department(_text(row, "department") or department, "department")
+        salary = _parse_salary(row, "salary", salary)
+        return {
+            "id": employee_id,
+            "first_name": first_name,
+            "last_name": last_name,
+            "father_name": _text(row, "father_name"),
+            "hire_date": hire_date,
+            "department": department,
+            "salary": salary,
+            "status": _text(row, "status") or "active",
+            # Re-employed employees keep their old records; these are added to them
+            "salary_history": [{"salary": salary, "effective_date": hire_date, "end_date": None}],
+            "department_history": [{"department": department, "effective_date": hire_date, "end_date": None}],
+        }
+
+    def _parse_order(self, row):
+        """Build an order and the employee or change it implies from a row"""
+        order_number = _text(row, "order_number")
+        employee_id = _text(row, "employee_id") or _text(row, "id")
+        action = _text(row, "order_action").lower()
+        if not order_number:
+            raise RowError("order_number is required")
+        if not employee_id:
+            raise RowError("employee_id is required")
+        if not action:
+            raise RowError("order_action is required")
+        if action not in ORDER_ACTIONS:
+            raise RowError(f"Unknown order_action '{action}', expected one of: {', '.join(ORDER_ACTIONS)}")
+
+        order_date = _parse_date(row, "order_date")
+        effective_date = _parse_date(row, "effective_date", order_date)
+        order = {
+            "order_number": order_number,
+            "employee_id": employee_id,
+            "order_date": order_date,
+            "effective_date": effective_date,
+            "order_action": action,
+            "new_department": _text(row, "new_department"),
+            "new_salary": _text(row, "new_salary"),
+        }
+
+        if action == "employment":
+            employee = self._parse_employee(row, employee_id, effective_date, order["new_department"],
+                                            order["new_salary"])
+            order["new_department"] = employee["department"]
+            order["new_salary"] = order["new_salary"] or str(employee["salary"])
+            return order, employee, None
+
+        if employee_id not in self.statuses:
+            raise RowError(f"Employee '{employee_id}' does not exist")
+
+        change = {"employee_id": employee_id, "effective_date": effective_date}
+        if action == "termination":
+            change["status"] = "terminated"
+        elif action == "salary change":
+            change["salary"] = _parse_salary(row, "new_salary")
+        else:
+            change["department"] = self._check_department(order["new_department"], "new_department")
+        return order, None, change
+
+    def add_row(self, row, line_number):
+        """Validate a CSV row and queue what it writes, recording an error if it is invalid"""
+        self.report["rows"] += 1
+        try:
+            if _text(row, "order_action") or _text(row, "order_number"):
+                order, employee, change = self._parse_order(row)
+            else:
+                order, change = None, None
+                employee = self._parse_employee(row, _text(row, "id") or _text(row, "employee_id"))
+        except RowError as e:
+            self.report["errors"].append({
+                "line": line_number,
+                "employee_id": _text(row, "employee_id") or _text(row, "id"),
+                "message": str(e)
+            })
+            return
+
+        if employee is not None:
+            # Changes of this batch run after its inserts, so keep a re-employment after them
+            if employee["id"] in self.changed_ids:
+                self.flush()
+            self.employees.append(employee)
+            self.statuses[employee["id"]] = employee["status"]
+        if order is not None:
+            self.orders.append(order)
+        if change is not None:
+            self.changes.append(change)
+            self.changed_ids.add(change["employee_id"])
+            if "status" in change:
+                self.statuses[change["employee_id"]] = change["status"]
+
+        if len(self.employees) + len(self.orders) + len(self.changes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the queued rows in one transaction"""
+        if not self.dry_run and (self.employees or self.orders or self.changes):
+            self.database.import_batch(self.employees, self.orders, self.changes)
+        self.report["employees"] += len(self.employees)
+        self.report["orders"] += len(self.orders)
+        self.report["changes"] += len(self.changes)
+        self.employees = []
+        self.orders = []
+        self.changes = []
+        self.changed_ids = set()
+
+    def import_rows(self, reader):
+        """Import every row of a csv.DictReader and return the report"""
+        started = time.perf_counter()
+        for row in reader:
+            self.add_row(row, reader.line_num)
+        self.flush()
+        self.report["seconds"] = round(time.perf_counter() - started, 3)
+        return self.report
+
+
+def import_csv(database, path, departments=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Import employees and orders from a CSV file and return the report
+
+    The report has the counts of rows read and of employees, orders and changes
+    written, and errors as [{line, employee_id, message}]. Batches written
+    before an error stay written; rerun with the failed rows only. dry_run
+    validates without writing anything.
+    """
+    importer = BulkImporter(database, departments, batch_size, dry_run)
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        report = importer.import_rows(csv.DictReader(f))
+
+    logger.info("Imported %d employees, %d orders and %d changes from %d rows in %ss, %d rows failed",
+                report['employees'], report['orders'], report['changes'], report['rows'], report['seconds'],
+                len(report['errors']))
+    return report
+
+
+def write_error_report(errors, path):
+    """Write import errors to a CSV file for fixing and re-importing the failed rows"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["line", "employee_id", "message"])
+        writer.writeheader()
+        writer.writerows(errors)
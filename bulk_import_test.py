@@ -0,0 +1,72 @@
+# bulk_import_test.py
+import csv
+
+import pytest
+
+from bulk_import import import_csv
+from database import Database
+from salary_proration import SalaryProrationEngine
+from working_calendar import WorkingCalendar
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "bonus_system.db"))
+    yield database
+    database.close()
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            "order_number", "employee_id", "order_date", "effective_date", "order_action",
+            "new_department", "new_salary", "first_name", "last_name"
+        ])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_salary_change_closes_previous_record_the_day_before(database, tmp_path):
+    path = tmp_path / "import.csv"
+    _write_csv(path, [
+        {"order_number": "1", "employee_id": "X1", "order_date": "2024-01-02", "effective_date": "2024-01-02",
+         "order_action": "employment", "new_department": "Sales", "new_salary": "3000",
+         "first_name": "Ann", "last_name": "Lee"},
+        {"order_number": "2", "employee_id": "X1", "order_date": "2024-03-15", "effective_date": "2024-03-15",
+         "order_action": "salary change", "new_salary": "6000"},
+    ])
+
+    report = import_csv(database, path)
+
+    assert report["errors"] == []
+    assert database.get_employee_salary_history("X1") == [
+        {"salary": 3000.0, "effective_date": "2024-01-02", "end_date": "2024-03-14"},
+        {"salary": 6000.0, "effective_date": "2024-03-15", "end_date": None},
+    ]
+
+    employee = database.get_employee_by_id("X1")
+    adjustment = SalaryProrationEngine(WorkingCalendar()).prorate(
+        [(employee, database.get_employee_salary_history("X1"))], 2024, 3
+    )["X1"]
+
+    assert [period["days"] for period in adjustment["periods"]] == [10, 11]
+    assert adjustment["total_days"] == 21
+    assert adjustment["proportional_salary"] == pytest.approx((10 * 3000 + 11 * 6000) / 21)
+
+
+def test_unknown_order_action_is_rejected(database, tmp_path):
+    path = tmp_path / "import.csv"
+    _write_csv(path, [
+        {"order_number": "1", "employee_id": "X2", "order_date": "2024-01-02", "effective_date": "2024-01-02",
+         "order_action": "hire", "new_department": "Sales", "new_salary": "3000",
+         "first_name": "Bo", "last_name": "Kim"},
+    ])
+
+    report = import_csv(database, path)
+
+    assert [(error["line"], error["employee_id"]) for error in report["errors"]] == [(2, "X2")]
+    assert "Unknown order_action 'hire'" in report["errors"][0]["message"]
+    assert "employment, termination, salary change, department change" in report["errors"][0]["message"]
+    assert report["orders"] == 0
+    assert database.get_all_orders() == []
+    assert database.get_employee_by_id("X2") is None
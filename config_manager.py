@@ -1,7 +1,12 @@
 import json
+import logging
 import os
 from datetime import datetime
 
+from formula_compiler import FormulaError
+
+logger = logging.getLogger(__name__)
+
 
 class ConfigManager:
     def __init__(self, config_file = "config.json", database = None):
@@ -32,22 +37,22 @@ class ConfigManager:
                     db_kpis = self.database.get_all_kpis()
                     if db_kpis:
                         merged_config["kpis"] = db_kpis
-                        print("INFO: Loaded KPIs from database")
+                        logger.info("Loaded KPIs from database")
                     elif "kpis" not in user_config or not user_config["kpis"]:
                         merged_config["kpis"] = default_config["kpis"]
                 else:
-                    print("WARNING: No database connection for KPIs")
+                    logger.warning("No database connection for KPIs")
 
                 return merged_config
 
             else:
                 # Create config file with defaults
                 self.save_config(default_config)
-                print("INFO: Created new config file")
+                logger.info("Created new config file %s", self.config_file)
                 return default_config
 
         except Exception as e:
-            print(f"Error loading config config_manager load_config:{e}")
+            logger.error("Error loading config %s: %s", self.config_file, e)
             return default_config
 
 
@@ -59,10 +64,14 @@ class ConfigManager:
         try:
             with open(self.config_file, "w") as f:
                 json.dump(self.config, f, indent = 4)
+
+            # KPIs and departments kept in config.json can change any stored bonus result
+            if self.database:
+                self.database.mark_bonuses_dirty()
             return True
 
         except Exception as e:
-            print(f"Error saving config save_config line 73: {e}")
+            logger.error("Error saving config %s: %s", self.config_file, e)
             return False
 
 
@@ -71,6 +80,15 @@ class ConfigManager:
         return self.config.get("departments", {})
 
 
+    def get_working_weekmask(self):
+        """Get the working week as seven 0/1 flags starting on Monday"""
+        return self.config.get("working_weekmask", "1111100")
+
+    def set_working_weekmask(self, weekmask):
+        """Set which weekdays are working days, e.g. "1111110" for a six-day week"""
+        self.config["working_weekmask"] = weekmask
+        return self.save_config()
+
     def add_department(self,department):
         departments = self.get_departments()
         #if department not in departments:
@@ -120,7 +138,7 @@ class ConfigManager:
                     self.config["kpis"] = db_kpis
                     return db_kpis
             except Exception as e:
-                print(f"Error getting KPIs from database get_kpis: {e}")
+                logger.error("Error getting KPIs from database: %s", e)
 
 
         # Fallback to config file
@@ -133,9 +151,9 @@ class ConfigManager:
         if self.database:
             try:
                 self.database.save_kpi(kpi_data)
-                print("INFO: KPI saved to database")
+                logger.info("KPI saved to database")
             except Exception as e:
-                print(f"Error saving KPI to database add_kpi line 122:{e}")
+                logger.error("Error saving KPI to database: %s", e)
                 return False
 
         # Also update config file
@@ -160,30 +178,34 @@ class ConfigManager:
                     # PRESERVE THE ORIGINAL ID FOR DATABASE UPDATE
                     if "id" in original_kpi:
                         kpi_data["id"] = original_kpi["id"]
-                        print(f"Preserved ID for database update: {kpi_data['id']}")
+                        logger.debug("Preserved ID for database update: %s", kpi_data['id'])
 
                     # Save to database - this should update existing record due to ID
                     success = self.database.save_kpi(kpi_data)
-                    print(f"Database save result: {success}")
+                    logger.debug("Database save result: %s", success)
 
                     if success:
-                        print("KPI updated in database")
+                        logger.info("KPI updated in database")
                         # Refresh KPIs from database to get the updated data
                         db_kpis = self.database.get_all_kpis()
                         if db_kpis:
                             self.config["kpis"] = db_kpis
                             if self.save_config():
-                                print("Config updated with database KPIs")
+                                logger.debug("Config updated with database KPIs")
                                 return True
                             else:
-                                print("Failed to save config after database update")
+                                logger.error("Failed to save config after database update")
                                 return False
                     else:
-                        print("Database save failed")
+                        logger.error("Database save failed")
                         return False
 
+                except FormulaError as e:
+                    # A rejected formula must not reach the config file either
+                    logger.error("Error updating KPI in database: %s", e)
+                    return False
                 except Exception as e:
-                    print(f"Error updating KPI in database: {e}")
+                    logger.error("Error updating KPI in database: %s", e)
                     # Fall through to config update
 
 
@@ -191,8 +213,8 @@ class ConfigManager:
             kpis[index] = kpi_data
             self.config["kpis"] = kpis
             result = self.save_config()
-            print(f"Config save result: {result}")
+            logger.debug("Config save result: %s", result)
             return result
 
-        print(f"Invalid index: {index}")
+        logger.error("Invalid KPI index: %s", index)
         return False
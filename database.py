@@ -1,17 +1,157 @@
+import os
 import sqlite3
-from datetime import datetime
+import threading
+import urllib.request
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 import json
+import logging
 
+from employee_utils import format_employee_name
+from formula_compiler import validate_formula
+from instrumentation import CountingConnection, instrument_methods
+
+logger = logging.getLogger(__name__)
+
+# Every method is a span when instrumentation is on; see instrumentation.py
+@instrument_methods("Database", exclude=("get_connection", "transaction", "close"))
 class Database:
-    def __init__(self, db_path = "bonus_system.db"):
+    # Connection settings applied once to every pooled connection
+    BUSY_TIMEOUT_MS = 30000
+    CACHE_SIZE_KB = 20000
+
+    # Ordered schema migrations as (version, description, method name).
+    # Each one runs exactly once per database file and is recorded in schema_version.
+    SCHEMA_MIGRATIONS = [
+        (1, "Create base tables", "_create_tables"),
+        (2, "Add employees.father_name", "_migrate_add_father_name"),
+        (3, "Rebuild orders without UNIQUE order_number", "_migrate_orders_drop_unique"),
+        (4, "Add hot-path indexes", "_migrate_add_hot_path_indexes"),
+        (5, "Add bonus run store", "_migrate_add_bonus_runs"),
+        (6, "Add dirty tracking for bonus runs", "_migrate_add_dirty_marks"),
+        (7, "Index salary changes by effective date", "_migrate_add_salary_change_index"),
+        (8, "Add holidays table", "_migrate_add_holidays"),
+        (9, "Store salary adjustments of bonus runs", "_migrate_add_run_salary_adjustments"),
+    ]
+
+    # Wildcards in bonus_dirty_marks: every employee, or every period of an employee
+    ALL_EMPLOYEES = "*"
+    ALL_PERIODS = 0
+
+    def __init__(self, db_path = "bonus_system.db", read_only=False):
+        """Open the database; read_only connections skip migrations and cannot write, e.g. in worker processes"""
         self.db_path = db_path
-        self.init_database()
-        self.fix_orders_table_constraint()
+        self.read_only = read_only
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        # Employee directory cache; the generation guards against storing a load that raced a write
+        self._employee_directory = None
+        self._employee_directory_generation = 0
+        self._employee_directory_lock = threading.Lock()
+
+        if not read_only:
+            self.init_database()
+
+    def get_connection(self):
+        """Get the long-lived connection of the current thread, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                uri = f"file:{urllib.request.pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, timeout=self.BUSY_TIMEOUT_MS / 1000, factory=CountingConnection)
+            else:
+                conn = sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT_MS / 1000, factory=CountingConnection)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{self.CACHE_SIZE_KB}")
+            conn.execute(f"PRAGMA busy_timeout={self.BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+            self._local.transaction_depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of writes as one transaction, e.g. ``with database.transaction() as cursor:``
+
+        Nested blocks join the outermost transaction, so callers can group
+        several Database writes and have them commit or roll back together.
+        """
+        conn = self.get_connection()
+        depth = self._local.transaction_depth
+        self._local.transaction_depth = depth + 1
+        try:
+            if depth == 0 and not conn.in_transaction:
+                # Explicit BEGIN so schema changes are transactional too
+                conn.execute("BEGIN")
+            yield conn.cursor()
+            if depth == 0:
+                conn.commit()
+        except Exception:
+            if depth == 0:
+                conn.rollback()
+            raise
+        finally:
+            self._local.transaction_depth = depth
+
+    def close_thread_connection(self):
+        """Close the current thread's connection, e.g. before a pool thread that will not be reused exits"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        with self._connections_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+        self._local.conn = None
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    # Connection belongs to a thread that already finished
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
 
     def init_database(self):
-        """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Bring the database schema up to date by applying pending migrations"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current_version = cursor.fetchone()[0]
+
+        for version, description, method_name in self.SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            with self.transaction() as cursor:
+                getattr(self, method_name)(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                               (version, description, datetime.now().isoformat()))
+            logger.info("Applied schema migration %d: %s", version, description)
+
+    def get_schema_version(self):
+        """Get the version of the last applied schema migration"""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+
+    def _create_tables(self, cursor):
+        """Create missing tables"""
 
         # Employees table
         cursor.execute("""
@@ -29,25 +169,6 @@ class Database:
             )
         """)
 
-        # Check if father_name column exists, if not, add it
-        cursor.execute("PRAGMA table_info(employees)")
-        columns_after_create = [column[1] for column in cursor.fetchall()]
-        print(f"DEBUG: After CREATE TABLE - columns: {columns_after_create}")
-
-        # Check if father_name column exists, if not, add it
-        if 'father_name' not in columns_after_create:
-            print("DEBUG: Adding missing father_name column to employees table")
-            try:
-                cursor.execute("ALTER TABLE employees ADD COLUMN father_name TEXT DEFAULT ''")
-                print("DEBUG: ALTER TABLE executed successfully")
-            except Exception as e:
-                print(f"DEBUG: Error executing ALTER TABLE: {e}")
-
-        # Check final schema
-        cursor.execute("PRAGMA table_info(employees)")
-        columns_final = [column[1] for column in cursor.fetchall()]
-        print(f"DEBUG: Final columns: {columns_final}")
-
         # Salary history table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS salary_history (
@@ -145,14 +266,174 @@ class Database:
             )
         ''')
 
-        conn.commit()
-        conn.close()
+    def _migrate_add_father_name(self, cursor):
+        """Add the father_name column to databases created before it existed"""
+        cursor.execute("PRAGMA table_info(employees)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'father_name' not in columns:
+            cursor.execute("ALTER TABLE employees ADD COLUMN father_name TEXT DEFAULT ''")
+
+    def _migrate_orders_drop_unique(self, cursor):
+        """Remove UNIQUE constraint from order_number if it exists"""
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='orders'")
+        table_sql = cursor.fetchone()
+        if not table_sql or "UNIQUE" not in table_sql[0].upper():
+            return
+
+        # Backup the data
+        cursor.execute("""
+            SELECT id, order_number, employee_id, order_date, effective_date, order_action, new_department, new_salary
+            FROM orders
+        """)
+        orders_data = cursor.fetchall()
+
+        # Recreate table without UNIQUE constraint
+        cursor.execute("DROP TABLE orders")
+        cursor.execute('''
+                       CREATE TABLE orders
+                       (
+                           id             INTEGER PRIMARY KEY AUTOINCREMENT,
+                           order_number   TEXT NOT NULL,
+                           employee_id    TEXT NOT NULL,
+                           order_date     TEXT NOT NULL,
+                           effective_date TEXT NOT NULL,
+                           order_action   TEXT NOT NULL,
+                           new_department TEXT,
+                           new_salary TEXT,
+                           FOREIGN KEY (employee_id) REFERENCES employees (id)
+                       )
+                       ''')
+
+        # Restore data
+        cursor.executemany("INSERT INTO orders VALUES (?,?,?,?,?,?,?,?)", orders_data)
+        logger.info("Fixed orders table constraint - removed UNIQUE from order_number")
+
+    def _migrate_add_hot_path_indexes(self, cursor):
+        """Index the columns used by history, variable grid and order lookups"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_salary_history_employee_date "
+                       "ON salary_history (employee_id, effective_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_department_history_employee_date "
+                       "ON department_history (employee_id, effective_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_variable_values_period_employee "
+                       "ON employee_variable_values (period_year, period_month, employee_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders (order_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_employee ON orders (employee_id)")
+
+    def _migrate_add_bonus_runs(self, cursor):
+        """Store every calculation run with its results and per-KPI amounts"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bonus_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                period_year INTEGER NOT NULL,
+                period_month INTEGER NOT NULL,
+                department TEXT NOT NULL,
+                working_days INTEGER,
+                input_fingerprint TEXT NOT NULL,
+                employee_count INTEGER NOT NULL,
+                total_bonus REAL NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bonus_runs_period "
+                       "ON bonus_runs (period_year, period_month, department, id)")
+
+        # Results of a run reuse the bonus_calculations table
+        cursor.execute("ALTER TABLE bonus_calculations ADD COLUMN run_id INTEGER REFERENCES bonus_runs (id)")
+        cursor.execute("ALTER TABLE bonus_calculations ADD COLUMN employee_name TEXT")
+        cursor.execute("ALTER TABLE bonus_calculations ADD COLUMN department TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bonus_calculations_run ON bonus_calculations (run_id)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bonus_calculation_kpis (
+                run_id INTEGER NOT NULL,
+                employee_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                kpi_name TEXT NOT NULL,
+                calculation_method TEXT NOT NULL,
+                bonus_amount REAL NOT NULL,
+                PRIMARY KEY (run_id, employee_id, position),
+                FOREIGN KEY (run_id) REFERENCES bonus_runs (id)
+            )
+        """)
+
+    def _migrate_add_dirty_marks(self, cursor):
+        """Track which employees and periods changed since a run was calculated"""
+        # One row per (employee, period); re-marking bumps the id so runs can compare against it
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bonus_dirty_marks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee_id TEXT NOT NULL,
+                period_year INTEGER NOT NULL,
+                period_month INTEGER NOT NULL,
+                UNIQUE (employee_id, period_year, period_month)
+            )
+        """)
+        cursor.execute("ALTER TABLE bonus_runs ADD COLUMN dirty_mark_id INTEGER NOT NULL DEFAULT 0")
+
+    def _migrate_add_salary_change_index(self, cursor):
+        """Find the salary changes of a month without scanning the whole history"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_salary_history_effective_date "
+                       "ON salary_history (effective_date, employee_id)")
+
+    def _migrate_add_holidays(self, cursor):
+        """Holidays (working_fraction 0) and shortened days used by the working calendar"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS holidays (
+                holiday_date TEXT PRIMARY KEY,
+                description TEXT,
+                working_fraction REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    def _migrate_add_run_salary_adjustments(self, cursor):
+        """Manually adjusted salaries of a run as JSON {employee_id: salary}; NULL for runs stored before"""
+        cursor.execute("ALTER TABLE bonus_runs ADD COLUMN salary_adjustments TEXT")
+
+    def _mark_dirty(self, cursor, employee_id=ALL_EMPLOYEES, period_year=ALL_PERIODS, period_month=ALL_PERIODS):
+        """Record that stored bonus results of an employee (or everyone) for a period (or all periods) are stale"""
+        cursor.execute("""
+            INSERT OR REPLACE INTO bonus_dirty_marks (employee_id, period_year, period_month)
+            VALUES (?, ?, ?)
+        """, (employee_id, period_year, period_month))
+
+    def mark_bonuses_dirty(self, employee_id=ALL_EMPLOYEES, period_year=ALL_PERIODS, period_month=ALL_PERIODS):
+        """Mark stored bonus results stale after a change made outside the database, e.g. config.json"""
+        with self.transaction() as cursor:
+            self._mark_dirty(cursor, employee_id, period_year, period_month)
+
+    def get_last_dirty_mark_id(self):
+        """Get the id of the latest dirty mark, used as the starting point of a run"""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM bonus_dirty_marks")
+        return cursor.fetchone()[0]
+
+    def get_dirty_employee_ids(self, since_mark_id, period_year, period_month):
+        """Get IDs of employees marked dirty for a period after the given mark
+
+        Returns None when everyone is dirty, e.g. after a KPI or custom variable change.
+        """
+        cursor = self.get_connection().cursor()
+
+        cursor.execute("""
+            SELECT DISTINCT employee_id
+            FROM bonus_dirty_marks
+            WHERE id > ?
+            AND ((period_year = ? AND period_month = ?) OR period_year = ?)
+        """, (since_mark_id, period_year, period_month, self.ALL_PERIODS))
+
+        employee_ids = {row[0] for row in cursor.fetchall()}
+        if self.ALL_EMPLOYEES in employee_ids:
+            return None
+        return employee_ids
 
     def save_employee(self, employee_data):
-        """Save employee to database - handles both old and new schemas"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Save employee to database"""
+        with self.transaction() as cursor:
+            self._save_employee(cursor, employee_data)
+        self.invalidate_employee_directory()
 
+    def _save_employee(self, cursor, employee_data):
+        """Write an employee and its history rows using the given cursor"""
         current_time = datetime.now().isoformat()
 
         # First check if employee exists and is active
@@ -161,49 +442,25 @@ class Database:
 
         # If employee exists and is active, we should not overwrite
         # if existing_employee and existing_employee[1].lower() == "active":
-        #     conn.close()
         #     raise ValueError(f"Active employee with ID '{employee_data['id']}' already exists")
 
-        # Check if father_name column exists
-        cursor.execute("PRAGMA table_info(employees)")
-        columns = [column[1] for column in cursor.fetchall()]
-        has_father_name = 'father_name' in columns
-
-        if has_father_name:
-            # New schema with father_name
-            cursor.execute("""
-                INSERT OR REPLACE INTO employees
-                (id, first_name, last_name, father_name, hire_date, current_department, current_salary, status, created_at, updated_at)
-                VALUES (?,?,?,?,?,?,?,?,?,?)
-                """, (
-                employee_data["id"],
-                employee_data["first_name"],
-                employee_data["last_name"],
-                employee_data.get("father_name", ""),
-                employee_data["hire_date"],
-                employee_data["department"],
-                float(employee_data["salary"]),  # Ensure it's float
-                employee_data["status"],
-                current_time,
-                current_time
-            ))
-        else:
-            # Old schema without father_name
-            cursor.execute("""
-                INSERT OR REPLACE INTO employees
-                (id, first_name, last_name, hire_date, current_department, current_salary, status, created_at, updated_at)
-                VALUES (?,?,?,?,?,?,?,?,?)
-                """, (
-                employee_data["id"],
-                employee_data["first_name"],
-                employee_data["last_name"],
-                employee_data["hire_date"],
-                employee_data["department"],
-                float(employee_data["salary"]),  # Ensure it's float
-                employee_data["status"],
-                current_time,
-                current_time
-            ))
+        # father_name is guaranteed by schema migration 2
+        cursor.execute("""
+            INSERT OR REPLACE INTO employees
+            (id, first_name, last_name, father_name, hire_date, current_department, current_salary, status, created_at, updated_at)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+            """, (
+            employee_data["id"],
+            employee_data["first_name"],
+            employee_data["last_name"],
+            employee_data.get("father_name", ""),
+            employee_data["hire_date"],
+            employee_data["department"],
+            float(employee_data["salary"]),  # Ensure it's float
+            employee_data["status"],
+            current_time,
+            current_time
+        ))
 
         # Save salary history if provided
         if "salary_history" in employee_data:
@@ -232,13 +489,46 @@ class Database:
                                    dept_record["effective_date"],
                                    dept_record.get("end_date")
                                ))
-        conn.commit()
-        conn.close()
+
+        # Salary, department and status changes affect every period of the employee
+        self._mark_dirty(cursor, employee_data["id"])
+
+    def get_employee_directory(self):
+        """Get {employee_id: employee} for all employees, ordered by name
+
+        Loaded with one query and cached until an employee is saved, deleted or
+        renamed. The dictionaries are shared by every caller, so copy one before
+        changing it.
+        """
+        with self._employee_directory_lock:
+            directory = self._employee_directory
+            generation = self._employee_directory_generation
+
+        if directory is None:
+            directory = {employee["id"]: employee for employee in self._query_all_employees()}
+            with self._employee_directory_lock:
+                if generation == self._employee_directory_generation:
+                    self._employee_directory = directory
+        return directory
+
+    def invalidate_employee_directory(self):
+        """Drop the cached employee directory so the next lookup reloads it"""
+        with self._employee_directory_lock:
+            self._employee_directory = None
+            self._employee_directory_generation += 1
+
+    def get_employee_name(self, employee_id, default="Unknown"):
+        """Get an employee's full name from the employee directory"""
+        employee = self.get_employee_directory().get(employee_id)
+        return format_employee_name(employee) if employee else default
 
     def get_all_employees(self):
-        """Get all employees from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Get all employees ordered by name, as copies from the employee directory"""
+        return [dict(employee) for employee in self.get_employee_directory().values()]
+
+    def _query_all_employees(self):
+        """Load all employees from database"""
+        cursor = self.get_connection().cursor()
 
         cursor.execute("SELECT * FROM employees ORDER BY first_name, last_name")
         employees = cursor.fetchall()
@@ -249,20 +539,11 @@ class Database:
         # Create column index mapping
         col_index = {name: idx for idx, name in enumerate(column_names)}
 
-        # DEBUG: Print column mapping for verification
-        print(f"DEBUG get_all_employees: Column mapping:")
-        for name, idx in col_index.items():
-            print(f"  {name}: {idx}")
-
         # Convert to list of dictionaries
         employee_list = []
         for emp in employees:
-            # DEBUG: Print raw data for each employee
-            print(f"DEBUG: Raw employee data: {emp}")
-
             # Get salary value and ensure it's a float
             salary_raw = emp[col_index["current_salary"]]
-            print(f"DEBUG: Raw salary value: {salary_raw}, type: {type(salary_raw)}")
 
             try:
                 # Try to convert salary to float
@@ -277,7 +558,7 @@ class Database:
                 else:
                     salary = 0.0
             except (ValueError, TypeError) as e:
-                print(f"DEBUG: Error converting salary '{salary_raw}' to float: {e}")
+                logger.warning("Error converting salary '%s' to float: %s", salary_raw, e)
                 salary = 0.0
 
             # Create employee dictionary
@@ -292,31 +573,23 @@ class Database:
                 "status": str(emp[col_index["status"]])
             }
 
-            # DEBUG: Print processed employee data
-            print(
-                f"DEBUG: Processed employee: {employee_dict['first_name']} {employee_dict['last_name']}, Salary: {employee_dict['salary']} (type: {type(employee_dict['salary'])})")
-
             employee_list.append(employee_dict)
 
-        conn.close()
+        logger.debug("Loaded employee directory with %d employees", len(employee_list))
         return employee_list
 
     def delete_employee(self, employee_id):
         """Delete employee from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM employees WHERE id = ?",(employee_id,))
-        cursor.execute("DELETE FROM salary_history WHERE employee_id = ?", (employee_id,))
-        cursor.execute("DELETE FROM department_history WHERE employee_id = ?", (employee_id,))
-
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM employees WHERE id = ?",(employee_id,))
+            cursor.execute("DELETE FROM salary_history WHERE employee_id = ?", (employee_id,))
+            cursor.execute("DELETE FROM department_history WHERE employee_id = ?", (employee_id,))
+            self._mark_dirty(cursor, employee_id)
+        self.invalidate_employee_directory()
 
     def get_employee_salary_history(self, employee_id):
         """Get salary history for an employee"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         cursor.execute("""
         SELECT salary, effective_date, end_date
@@ -326,64 +599,114 @@ class Database:
         """, (employee_id,))
 
         history = cursor.fetchall()
-        conn.close()
 
         return [{"salary": h[0], "effective_date": h[1], "end_date": h[2]} for h in history]
 
+    def get_all_salary_histories(self):
+        """Get salary history for all employees in one query, keyed by employee ID"""
+        cursor = self.get_connection().cursor()
+
+        cursor.execute("""
+        SELECT employee_id, salary, effective_date, end_date
+        FROM salary_history
+        ORDER BY employee_id, effective_date
+        """)
+
+        histories = {}
+        for row in cursor.fetchall():
+            histories.setdefault(str(row[0]), []).append(
+                {"salary": row[1], "effective_date": row[2], "end_date": row[3]}
+            )
+
+        return histories
+
+    def get_salary_histories_changed_in_period(self, period_year, period_month):
+        """Get the full salary history of every employee with a salary record taking effect in the month
+
+        Returns {employee ID: [{salary, effective_date, end_date}]} ordered by effective date, from one query.
+        """
+        return self.get_salary_histories_changed_in_range(period_year, period_month, period_year, period_month)
+
+    def get_salary_histories_changed_in_range(self, start_year, start_month, end_year, end_month):
+        """Get the full salary history of every employee with a salary record taking effect in the months
+
+        The range is inclusive. Returns the same format as get_salary_histories_changed_in_period.
+        """
+        cursor = self.get_connection().cursor()
+
+        next_year, next_month = (end_year + 1, 1) if end_month == 12 else (end_year, end_month + 1)
+        cursor.execute("""
+        SELECT employee_id, salary, effective_date, end_date
+        FROM salary_history
+        WHERE employee_id IN (
+            SELECT employee_id FROM salary_history WHERE effective_date >= ? AND effective_date < ?
+        )
+        ORDER BY employee_id, effective_date, id
+        """, (f"{start_year:04d}-{start_month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"))
+
+        histories = {}
+        for row in cursor.fetchall():
+            histories.setdefault(str(row[0]), []).append(
+                {"salary": row[1], "effective_date": row[2], "end_date": row[3]}
+            )
+
+        return histories
+
     def save_kpi(self, kpi_data):
         """Save KPI to database - properly handles updates"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        if kpi_data.get('calculation_method') == "formula":
+            # Reject formulas that would fail or are not allowed before they reach a bonus run
+            validate_formula(kpi_data.get('formula', ''))
 
         current_time = datetime.now().isoformat()
 
-        # Check if this is an update (has ID) or insert (no ID)
-        if 'id' in kpi_data and kpi_data['id'] is not None:
-            print(f"DEBUG: Updating existing KPI with ID: {kpi_data['id']}")
-            # UPDATE existing record
-            cursor.execute('''
-                UPDATE kpis SET 
-                name=?, description=?, calculation_method=?, formula=?, 
-                applicable_departments=?, weight=?, is_active=?, created_at=?
-                WHERE id=?
-            ''', (
-                kpi_data['name'],
-                kpi_data.get('description', ''),
-                kpi_data['calculation_method'],
-                kpi_data.get('formula', ''),
-                json.dumps(kpi_data.get('applicable_departments', [])),
-                kpi_data.get('weight', 1.0),
-                1 if kpi_data.get('is_active', True) else 0,
-                current_time,
-                kpi_data['id']  # WHERE condition
-            ))
-            print(f"DEBUG: Updated {cursor.rowcount} rows")
-        else:
-            print("DEBUG: Inserting new KPI (no ID)")
-            # INSERT new record
-            cursor.execute('''
-                INSERT INTO kpis 
-                (name, description, calculation_method, formula, applicable_departments, weight, is_active, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                kpi_data['name'],
-                kpi_data.get('description', ''),
-                kpi_data['calculation_method'],
-                kpi_data.get('formula', ''),
-                json.dumps(kpi_data.get('applicable_departments', [])),
-                kpi_data.get('weight', 1.0),
-                1 if kpi_data.get('is_active', True) else 0,
-                current_time
-            ))
-
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            # Check if this is an update (has ID) or insert (no ID)
+            if 'id' in kpi_data and kpi_data['id'] is not None:
+                logger.debug("Updating existing KPI with ID: %s", kpi_data['id'])
+                # UPDATE existing record
+                cursor.execute('''
+                    UPDATE kpis SET 
+                    name=?, description=?, calculation_method=?, formula=?, 
+                    applicable_departments=?, weight=?, is_active=?, created_at=?
+                    WHERE id=?
+                ''', (
+                    kpi_data['name'],
+                    kpi_data.get('description', ''),
+                    kpi_data['calculation_method'],
+                    kpi_data.get('formula', ''),
+                    json.dumps(kpi_data.get('applicable_departments', [])),
+                    kpi_data.get('weight', 1.0),
+                    1 if kpi_data.get('is_active', True) else 0,
+                    current_time,
+                    kpi_data['id']  # WHERE condition
+                ))
+                logger.debug("Updated %d rows", cursor.rowcount)
+            else:
+                logger.debug("Inserting new KPI (no ID)")
+                # INSERT new record
+                cursor.execute('''
+                    INSERT INTO kpis 
+                    (name, description, calculation_method, formula, applicable_departments, weight, is_active, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    kpi_data['name'],
+                    kpi_data.get('description', ''),
+                    kpi_data['calculation_method'],
+                    kpi_data.get('formula', ''),
+                    json.dumps(kpi_data.get('applicable_departments', [])),
+                    kpi_data.get('weight', 1.0),
+                    1 if kpi_data.get('is_active', True) else 0,
+                    current_time
+                ))
+
+            # A KPI can apply to anyone, so every stored result is stale
+            self._mark_dirty(cursor)
         return True
 
     def get_all_kpis(self):
         """Get all KPIs from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         cursor.execute('SELECT * FROM kpis WHERE is_active = 1 ORDER BY name')
         kpis = cursor.fetchall()
@@ -402,47 +725,40 @@ class Database:
                 'is_active': bool(kpi[7])
             })
 
-        conn.close()
         return kpi_list
 
     def delete_kpi(self, kpi_id):
         """Soft delete KPI (set is_active = 0)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('UPDATE kpis SET is_active = 0 WHERE id = ?', (kpi_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute('UPDATE kpis SET is_active = 0 WHERE id = ?', (kpi_id,))
+            self._mark_dirty(cursor)
 
     def save_custom_variable(self, variable_data):
         """Save custom variable to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         current_time = datetime.now().isoformat()
 
-        cursor.execute("""
-            INSERT OR REPLACE INTO custom_variables
-            (name, display_name, data_type, default_value, description, is_active, created_at)
-            VALUES (?,?,?,?,?,?,?)
-            """, (
-            variable_data["name"],
-            variable_data["display_name"],
-            variable_data["data_type"],
-            variable_data.get("default_value",""),
-            variable_data.get("description",""),
-            1 if variable_data.get("is_active", True) else 0,
-            current_time
-        ))
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO custom_variables
+                (name, display_name, data_type, default_value, description, is_active, created_at)
+                VALUES (?,?,?,?,?,?,?)
+                """, (
+                variable_data["name"],
+                variable_data["display_name"],
+                variable_data["data_type"],
+                variable_data.get("default_value",""),
+                variable_data.get("description",""),
+                1 if variable_data.get("is_active", True) else 0,
+                current_time
+            ))
 
-        conn.commit()
-        conn.close()
+            # Default values feed every employee's formulas
+            self._mark_dirty(cursor)
 
     def get_custom_variables(self):
         """Get all custom variables from database FIXED VERSION"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self.get_connection().cursor()
 
 
             # First, check if table exists
@@ -450,8 +766,9 @@ class Database:
             table_exists = cursor.fetchone()
 
             if not table_exists:
-                print("DEBUG: custom_variables table does not exist, ctreating it...")
-                self.init_database() # Re-initialize to create missing table
+                logger.debug("custom_variables table does not exist, creating it")
+                with self.transaction() as create_cursor:
+                    self._create_tables(create_cursor)
                 return [] # Return empty list since we just created the table
 
             cursor.execute('SELECT * FROM custom_variables WHERE is_active = 1 ORDER BY display_name')
@@ -471,66 +788,154 @@ class Database:
                 })
 
 
-            conn.close()
-            print(f"DEBUG  database get_custom_variable line 329: Returning {len(variable_list)} custom variables")
+            logger.debug("Returning %d custom variables", len(variable_list))
             return variable_list
 
         except Exception as e:
-            print(f"ERROR in get_custom_variables get_custom_variables  line 333: {e}")
+            logger.error("Error in get_custom_variables: %s", e)
             return []  # Return empty list instead of None
 
     def delete_custom_variable(self,variable_id):
         """Delete a custom variable by ID - FIXED VERSION"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("DELETE FROM custom_variables WHERE id = ?", (variable_id,))
-            conn.commit()
+            with self.transaction() as cursor:
+                cursor.execute("DELETE FROM custom_variables WHERE id = ?", (variable_id,))
+                deleted_count = cursor.rowcount
+                self._mark_dirty(cursor)
 
             # Check if any row was actually deleted
-            if cursor.rowcount > 0:
-                print(f"DEBUG: Successfully deleted variable with ID: {variable_id}")
-                conn.close()
+            if deleted_count > 0:
+                logger.debug("Successfully deleted variable with ID: %s", variable_id)
                 return True
             else:
-                print(f"DEBUG: No variable found with ID: {variable_id}")
-                conn.close()
+                logger.debug("No variable found with ID: %s", variable_id)
                 return False
 
         except Exception as e:
-            print(f"Error deleting custom variable: {e}")
+            logger.error("Error deleting custom variable: %s", e)
             return False
 
     def save_employee_variable_value(self, value_data):
         """Save employee variable value for a specific period"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        current_time = datetime.now().isoformat()
+
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO employee_variable_values
+                (employee_id, variable_name, period_year, period_month, value, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                value_data["employee_id"],
+                value_data["variable_name"],
+                value_data["period_year"],
+                value_data["period_month"],
+                value_data["value"],
+                current_time,
+                current_time
+            ))
+            self._mark_dirty(cursor, value_data["employee_id"], value_data["period_year"], value_data["period_month"])
+        return True
 
+    def save_period_variable_values(self, period_year, period_month, values):
+        """Upsert many variable values of one period in a single transaction
+
+        values is a list of {"employee_id", "variable_name", "value"} dicts. Returns
+        one status per row, "inserted", "updated" or "unchanged". Either every
+        changed value is written or, if anything fails, none are.
+        """
         current_time = datetime.now().isoformat()
 
-        cursor.execute("""
-            INSERT OR REPLACE INTO employee_variable_values
-            (employee_id, variable_name, period_year, period_month, value, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            value_data["employee_id"],
-            value_data["variable_name"],
-            value_data["period_year"],
-            value_data["period_month"],
-            value_data["value"],
-            current_time,
-            current_time
-        ))
+        with self.transaction() as cursor:
+            stored = self.get_period_variable_values(
+                period_year, period_month, employee_ids={value_data["employee_id"] for value_data in values}
+            )
 
-        conn.commit()
-        conn.close()
-        return True
+            statuses = []
+            changed_rows = {}
+            for value_data in values:
+                employee_id = value_data["employee_id"]
+                variable_name = value_data["variable_name"]
+                value = self._to_real_affinity(value_data["value"])
+
+                employee_values = stored.setdefault(employee_id, {})
+                if variable_name not in employee_values:
+                    status = "inserted"
+                elif employee_values[variable_name] == value:
+                    status = "unchanged"
+                else:
+                    status = "updated"
+                employee_values[variable_name] = value
+                statuses.append(status)
+
+                if status != "unchanged":
+                    changed_rows[(employee_id, variable_name)] = (
+                        employee_id, variable_name, period_year, period_month, value, current_time, current_time
+                    )
+
+            cursor.executemany("""
+                INSERT OR REPLACE INTO employee_variable_values
+                (employee_id, variable_name, period_year, period_month, value, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, list(changed_rows.values()))
+
+            cursor.executemany("""
+                INSERT OR REPLACE INTO bonus_dirty_marks (employee_id, period_year, period_month) VALUES (?, ?, ?)
+            """, [(employee_id, period_year, period_month)
+                  for employee_id in sorted({key[0] for key in changed_rows})])
+
+        return statuses
+
+    def get_missing_variable_values(self, period_year, period_month, department_variables, department=None):
+        """Find active employees' expected variable values that are not saved for a period
+
+        department_variables maps a department to the variable names its employees
+        need; the None key lists variables needed in every department. Returns
+        {department: [{"employee_id", "employee_name", "variable_name"}]}.
+        """
+        expected = [(dept, var_name) for dept, var_names in department_variables.items() for var_name in var_names]
+        if not expected:
+            return {}
+
+        cursor = self.get_connection().cursor()
+
+        query = f"""
+            WITH expected(department, variable_name) AS (VALUES {", ".join(["(?, ?)"] * len(expected))})
+            SELECT DISTINCT e.current_department, e.id, e.last_name, e.first_name, e.father_name, x.variable_name
+            FROM employees e
+            JOIN expected x ON x.department IS NULL OR x.department = e.current_department
+            LEFT JOIN employee_variable_values v
+                ON v.employee_id = e.id AND v.variable_name = x.variable_name
+                AND v.period_year = ? AND v.period_month = ?
+            WHERE LOWER(e.status) = 'active' AND v.id IS NULL
+        """
+        params = [item for pair in expected for item in pair] + [period_year, period_month]
+        if department is not None:
+            query += " AND e.current_department = ?"
+            params.append(department)
+        query += " ORDER BY e.current_department, e.first_name, e.last_name, x.variable_name"
+
+        cursor.execute(query, params)
+
+        missing = {}
+        for row in cursor.fetchall():
+            missing.setdefault(row[0], []).append({
+                "employee_id": str(row[1]),
+                "employee_name": f"{row[2]} {row[3]} {row[4] or ''}".strip(),
+                "variable_name": row[5]
+            })
+
+        return missing
+
+    def _to_real_affinity(self, value):
+        """Convert a value the way the REAL value column stores it, so it compares equal to what is read back"""
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return value
 
     def get_employee_variable_values(self, employee_id, period_year, period_month):
         """Get variable values for an employee in a specific period"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         cursor.execute("""
             SELECT variable_name, value 
@@ -539,14 +944,82 @@ class Database:
         """, (employee_id, period_year, period_month))
 
         values = cursor.fetchall()
-        conn.close()
 
         return {row[0]: row[1] for row in values}
 
+    # Keep IN (...) lists under SQLite's bound parameter limit
+    QUERY_BATCH_SIZE = 500
+
+    def get_period_variable_values(self, period_year, period_month, department=None, employee_ids=None):
+        """Get variable values of a period as {employee ID: {variable name: value}}
+
+        department limits the result to employees currently in that department,
+        employee_ids to the given employees.
+        """
+        cursor = self.get_connection().cursor()
+
+        query = """
+            SELECT v.employee_id, v.variable_name, v.value
+            FROM employee_variable_values v
+        """
+        params = [period_year, period_month]
+        if department is not None:
+            query += " JOIN employees e ON e.id = v.employee_id AND e.current_department = ?"
+            params.insert(0, department)
+        query += " WHERE v.period_year = ? AND v.period_month = ?"
+
+        if employee_ids is None:
+            batches = [None]
+        else:
+            employee_ids = list(employee_ids)
+            batches = [employee_ids[i:i + self.QUERY_BATCH_SIZE]
+                       for i in range(0, len(employee_ids), self.QUERY_BATCH_SIZE)]
+
+        period_values = {}
+        for batch in batches:
+            if batch is None:
+                cursor.execute(query, params)
+            else:
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(f"{query} AND v.employee_id IN ({placeholders})", params + batch)
+
+            for row in cursor.fetchall():
+                period_values.setdefault(str(row[0]), {})[row[1]] = row[2]
+
+        return period_values
+
+    def get_range_variable_values(self, start_year, start_month, end_year, end_month, department=None):
+        """Get variable values of every month in an inclusive range as {(year, month): {employee ID: {name: value}}}
+
+        One query for the whole range; department limits the result to
+        employees currently in that department.
+        """
+        cursor = self.get_connection().cursor()
+
+        query = """
+            SELECT v.period_year, v.period_month, v.employee_id, v.variable_name, v.value
+            FROM employee_variable_values v
+        """
+        params = [start_year, end_year, start_year * 12 + start_month, end_year * 12 + end_month]
+        if department is not None:
+            query += " JOIN employees e ON e.id = v.employee_id AND e.current_department = ?"
+            params.insert(0, department)
+        # The period_year bounds let the period index narrow the scan
+        query += """
+            WHERE v.period_year BETWEEN ? AND ?
+            AND v.period_year * 12 + v.period_month BETWEEN ? AND ?
+        """
+        cursor.execute(query, params)
+
+        range_values = {}
+        for row in cursor.fetchall():
+            range_values.setdefault((row[0], row[1]), {}).setdefault(str(row[2]), {})[row[3]] = row[4]
+
+        return range_values
+
     def get_employee_variable_value(self, employee_id, variable_name, period_year, period_month):
         """Get specific variable value for an employee in a period"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         cursor.execute("""
             SELECT value 
@@ -555,14 +1028,12 @@ class Database:
         """, (employee_id, variable_name, period_year, period_month))
 
         result = cursor.fetchone()
-        conn.close()
 
         return result[0] if result else None
 
     def get_employee_salary_on_date(self, employee_id, target_date):
         """Get employee's salary on a specific date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         # Convert target_date to string if it's a datetime object
         if isinstance(target_date, datetime):
@@ -579,7 +1050,6 @@ class Database:
         """, (employee_id, target_date, target_date))
 
         result = cursor.fetchone()
-        conn.close()
 
         if result:
             return result[0]
@@ -591,14 +1061,12 @@ class Database:
 
     def get_employee_by_id(self, employee_id):
         """Get a specific employee by ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
         emp = cursor.fetchone()
 
         if not emp:
-            conn.close()
             return None
 
         # Get column names
@@ -653,30 +1121,25 @@ class Database:
 
         employee["department_history"] = department_history
 
-        conn.close()
         return employee
 
     def update_employee_father_name(self, employee_id, father_name):
         """Update only the father's name for an employee"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         current_time = datetime.now().isoformat()
 
-        cursor.execute("""
-                       UPDATE employees
-                       SET father_name = ?,
-                           updated_at  = ?
-                       WHERE id = ?
-                       """, (father_name, current_time, employee_id))
-
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("""
+                           UPDATE employees
+                           SET father_name = ?,
+                               updated_at  = ?
+                           WHERE id = ?
+                           """, (father_name, current_time, employee_id))
+            self._mark_dirty(cursor, employee_id)
+        self.invalidate_employee_directory()
         return True
 
     def check_schema(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         # Get all tables
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
@@ -690,12 +1153,9 @@ class Database:
             for col in columns:
                 print(f" {col[1]} ({col[2]}")
 
-        conn.close()
-
     def get_all_orders(self):
         """Get all orders from database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
 
         try:
             cursor.execute("SELECT * FROM orders ORDER BY order_date")
@@ -727,62 +1187,299 @@ class Database:
 
             return order_list
         except Exception as e:
-            print(f"Error in get_all_orders: {e}")
+            logger.error("Error in get_all_orders: %s", e)
             return []
-        finally:
-            conn.close()
 
-    def fix_orders_table_constraint(self):
-        """Remove UNIQUE constraint from order_number if it exists"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def save_order(self, order_data):
+        """Save an order record"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO orders (order_number, employee_id, order_date, effective_date, order_action, new_department, new_salary)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                order_data["order_number"],
+                order_data["employee_id"],
+                order_data["order_date"],
+                order_data["effective_date"],
+                order_data["order_action"],
+                order_data.get("new_department", ""),
+                order_data.get("new_salary", "")
+            ))
+        return True
 
-        try:
-            # Check if table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='orders'")
-            if cursor.fetchone():
-                # Backup the data
-                cursor.execute("SELECT * FROM orders")
-                orders_data = cursor.fetchall()
-
-                # Get column names (excluding the id for autoincrement)
-                cursor.execute("PRAGMA table_info(orders)")
-                columns_info = cursor.fetchall()
-                columns = [col[1] for col in columns_info if col[1] != 'id']
-
-                # Drop the old table
-                cursor.execute("DROP TABLE orders")
-
-                # Recreate table without UNIQUE constraint
-                cursor.execute('''
-                               CREATE TABLE orders
-                               (
-                                   id             INTEGER PRIMARY KEY AUTOINCREMENT,
-                                   order_number   TEXT NOT NULL,
-                                   employee_id    TEXT NOT NULL,
-                                   order_date     TEXT NOT NULL,
-                                   effective_date TEXT NOT NULL,
-                                   order_action   TEXT NOT NULL,
-                                   new_department TEXT,
-                                   new_salary TEXT,
-                                   FOREIGN KEY (employee_id) REFERENCES employees (id)
-                               )
-                               ''')
-
-                # Restore data
-                if orders_data:
-                    placeholders = ','.join(['?' for _ in range(len(columns) + 1)])  # +1 for id
-                    for row in orders_data:
-                        cursor.execute(f"INSERT INTO orders VALUES ({placeholders})", row)
+    def import_batch(self, employees=(), orders=(), changes=()):
+        """Write a batch of imported employees, orders and employee changes in one transaction
 
-                conn.commit()
-                print("Fixed orders table constraint - removed UNIQUE from order_number")
+        employees are in the save_employee format with salary_history and
+        department_history; existing employees are replaced and their history
+        records added to. orders are in the save_order format. changes are
+        {employee_id, effective_date, status?, salary?, department?} applied in
+        order after the inserts: a salary or department change closes the open
+        history record the day before effective_date and opens a new one.
+        """
+        current_time = datetime.now().isoformat()
+        touched_ids = set()
+
+        with self.transaction() as cursor:
+            if employees:
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO employees
+                    (id, first_name, last_name, father_name, hire_date, current_department, current_salary, status,
+                     created_at, updated_at)
+                    VALUES (?,?,?,?,?,?,?,?,?,?)
+                """, [(employee["id"], employee["first_name"], employee["last_name"], employee.get("father_name", ""),
+                       employee["hire_date"], employee["department"], float(employee["salary"]), employee["status"],
+                       current_time, current_time) for employee in employees])
+                cursor.executemany("""
+                    INSERT INTO salary_history (employee_id, salary, effective_date, end_date) VALUES (?, ?, ?, ?)
+                """, [(employee["id"], record["salary"], record["effective_date"], record.get("end_date"))
+                      for employee in employees for record in employee.get("salary_history", [])])
+                cursor.executemany("""
+                    INSERT INTO department_history (employee_id, department, effective_date, end_date) VALUES (?, ?, ?, ?)
+                """, [(employee["id"], record["department"], record["effective_date"], record.get("end_date"))
+                      for employee in employees for record in employee.get("department_history", [])])
+                touched_ids.update(employee["id"] for employee in employees)
+
+            if orders:
+                cursor.executemany("""
+                    INSERT INTO orders (order_number, employee_id, order_date, effective_date, order_action,
+                                        new_department, new_salary)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(order["order_number"], order["employee_id"], order["order_date"], order["effective_date"],
+                       order["order_action"], order.get("new_department", ""), order.get("new_salary", ""))
+                      for order in orders])
+
+            # Changes depend on the state left by the previous one, so they run one by one
+            for change in changes:
+                employee_id = change["employee_id"]
+                # The open record ends the day before the change takes effect
+                previous_day = (date.fromisoformat(change["effective_date"][:10]) - timedelta(days=1)).isoformat()
+                if "status" in change:
+                    cursor.execute("UPDATE employees SET status = ?, updated_at = ? WHERE id = ?",
+                                   (change["status"], current_time, employee_id))
+                if "salary" in change:
+                    cursor.execute("UPDATE employees SET current_salary = ?, updated_at = ? WHERE id = ?",
+                                   (float(change["salary"]), current_time, employee_id))
+                    cursor.execute("UPDATE salary_history SET end_date = ? WHERE employee_id = ? AND end_date IS NULL",
+                                   (previous_day, employee_id))
+                    cursor.execute("""
+                        INSERT INTO salary_history (employee_id, salary, effective_date, end_date) VALUES (?, ?, ?, NULL)
+                    """, (employee_id, float(change["salary"]), change["effective_date"]))
+                if "department" in change:
+                    cursor.execute("UPDATE employees SET current_department = ?, updated_at = ? WHERE id = ?",
+                                   (change["department"], current_time, employee_id))
+                    cursor.execute("""
+                        UPDATE department_history SET end_date = ? WHERE employee_id = ? AND end_date IS NULL
+                    """, (previous_day, employee_id))
+                    cursor.execute("""
+                        INSERT INTO department_history (employee_id, department, effective_date, end_date)
+                        VALUES (?, ?, ?, NULL)
+                    """, (employee_id, change["department"], change["effective_date"]))
+                touched_ids.add(employee_id)
+
+            # Salary, department and status changes affect every period of the employee
+            cursor.executemany("""
+                INSERT OR REPLACE INTO bonus_dirty_marks (employee_id, period_year, period_month) VALUES (?, ?, ?)
+            """, [(employee_id, self.ALL_PERIODS, self.ALL_PERIODS) for employee_id in sorted(touched_ids)])
+
+        if touched_ids:
+            self.invalidate_employee_directory()
+
+    def save_bonus_run(self, run_data, results):
+        """Store a calculation run and all its results in one transaction, returning the run ID
+
+        run_data["salary_adjustments"] is {employee_id: salary} of the salaries
+        adjusted by hand for the run, if any.
+        """
+        current_time = datetime.now().isoformat()
 
-        except Exception as e:
-            print(f"Error fixing orders table: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO bonus_runs
+                (period_year, period_month, department, working_days, input_fingerprint, employee_count, total_bonus,
+                 created_at, dirty_mark_id, salary_adjustments)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                run_data["period_year"],
+                run_data["period_month"],
+                run_data["department"],
+                run_data.get("working_days"),
+                run_data["input_fingerprint"],
+                len(results),
+                sum(result["calculated_bonus"] for result in results),
+                current_time,
+                run_data.get("dirty_mark_id", 0),
+                json.dumps(run_data.get("salary_adjustments") or {}, sort_keys=True)
+            ))
+            run_id = cursor.lastrowid
+            self._insert_bonus_results(cursor, run_id, results, current_time)
+
+        return run_id
+
+    def _insert_bonus_results(self, cursor, run_id, results, current_time):
+        """Bulk insert results and their KPI amounts of a run"""
+        cursor.executemany("""
+            INSERT INTO bonus_calculations
+            (run_id, employee_id, employee_name, department, calculation_date, period_month, period_year,
+             base_salary, calculated_bonus)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            run_id,
+            result["employee_id"],
+            result["employee_name"],
+            result["department"],
+            current_time,
+            result["period_month"],
+            result["period_year"],
+            result["base_salary"],
+            result["calculated_bonus"]
+        ) for result in results])
+
+        cursor.executemany("""
+            INSERT INTO bonus_calculation_kpis
+            (run_id, employee_id, position, kpi_name, calculation_method, bonus_amount)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (run_id, result["employee_id"], position, detail["kpi_name"], detail["calculation_method"],
+             detail["bonus_amount"])
+            for result in results
+            for position, detail in enumerate(result["kpi_details"])
+        ])
+
+    def update_bonus_run(self, run_id, run_data, results, employee_ids):
+        """Replace the stored results of the given employees in an existing run
+
+        Employees in employee_ids without a new result (e.g. terminated or
+        transferred since the run) are removed from it.
+        """
+        current_time = datetime.now().isoformat()
+        employee_keys = [(run_id, employee_id) for employee_id in employee_ids]
+
+        with self.transaction() as cursor:
+            cursor.executemany("DELETE FROM bonus_calculation_kpis WHERE run_id = ? AND employee_id = ?", employee_keys)
+            cursor.executemany("DELETE FROM bonus_calculations WHERE run_id = ? AND employee_id = ?", employee_keys)
+            self._insert_bonus_results(cursor, run_id, results, current_time)
+
+            cursor.execute("""
+                UPDATE bonus_runs SET
+                input_fingerprint = ?,
+                dirty_mark_id = ?,
+                salary_adjustments = ?,
+                employee_count = (SELECT COUNT(*) FROM bonus_calculations WHERE run_id = ?),
+                total_bonus = (SELECT COALESCE(SUM(calculated_bonus), 0) FROM bonus_calculations WHERE run_id = ?)
+                WHERE id = ?
+            """, (run_data["input_fingerprint"], run_data["dirty_mark_id"],
+                  json.dumps(run_data.get("salary_adjustments") or {}, sort_keys=True), run_id, run_id, run_id))
+
+    def get_latest_bonus_run(self, period_year, period_month, department):
+        """Get the most recent stored run for a period and department, or None"""
+        cursor = self.get_connection().cursor()
+
+        cursor.execute("""
+            SELECT id, period_year, period_month, department, working_days, input_fingerprint,
+                   employee_count, total_bonus, created_at, dirty_mark_id, salary_adjustments
+            FROM bonus_runs
+            WHERE period_year = ? AND period_month = ? AND department = ?
+            ORDER BY id DESC
+            LIMIT 1
+        """, (period_year, period_month, department))
+
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+        return {
+            "id": row[0],
+            "period_year": row[1],
+            "period_month": row[2],
+            "department": row[3],
+            "working_days": row[4],
+            "input_fingerprint": row[5],
+            "employee_count": row[6],
+            "total_bonus": row[7],
+            "created_at": row[8],
+            "dirty_mark_id": row[9],
+            # None when the run predates stored adjustments
+            "salary_adjustments": json.loads(row[10]) if row[10] is not None else None
+        }
+
+    def get_bonus_run_results(self, run_id):
+        """Get the stored results of a run in the same shape BonusCalculator returns them"""
+        return list(self.iter_bonus_run_results(run_id))
+
+    def iter_bonus_run_results(self, run_id, chunk_size=1000):
+        """Yield the stored results of a run one employee at a time, fetching chunk_size rows at a time"""
+        cursor = self.get_connection().cursor()
+
+        cursor.execute("""
+            SELECT c.employee_id, c.employee_name, c.department, c.period_month, c.period_year,
+                   c.base_salary, c.calculated_bonus, k.kpi_name, k.calculation_method, k.bonus_amount
+            FROM bonus_calculations c
+            LEFT JOIN bonus_calculation_kpis k ON k.run_id = c.run_id AND k.employee_id = c.employee_id
+            WHERE c.run_id = ?
+            ORDER BY c.id, k.position
+        """, (run_id,))
+
+        result = None
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                if result is None or result["employee_id"] != row[0]:
+                    if result is not None:
+                        yield result
+                    result = {
+                        "employee_id": row[0],
+                        "employee_name": row[1],
+                        "department": row[2],
+                        "period_month": row[3],
+                        "period_year": row[4],
+                        "base_salary": row[5],
+                        "calculated_bonus": row[6],
+                        "kpi_details": []
+                    }
+                if row[7] is not None:
+                    result["kpi_details"].append({
+                        "kpi_name": row[7],
+                        "calculation_method": row[8],
+                        "bonus_amount": row[9]
+                    })
+
+        if result is not None:
+            yield result
+
+    def get_holidays(self):
+        """Get all holidays and shortened days ordered by date"""
+        cursor = self.get_connection().cursor()
+
+        cursor.execute("SELECT holiday_date, description, working_fraction FROM holidays ORDER BY holiday_date")
+
+        return [{"holiday_date": row[0], "description": row[1], "working_fraction": row[2]}
+                for row in cursor.fetchall()]
+
+    def save_holiday(self, holiday_data):
+        """Save a holiday (working_fraction 0) or shortened day (e.g. 0.5 for a half day)"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO holidays (holiday_date, description, working_fraction)
+                VALUES (?, ?, ?)
+            """, (
+                holiday_data["holiday_date"],
+                holiday_data.get("description", ""),
+                float(holiday_data.get("working_fraction", 0))
+            ))
+
+            # Working days drive proration of every employee
+            self._mark_dirty(cursor)
+        return True
+
+    def delete_holiday(self, holiday_date):
+        """Delete a holiday or shortened day"""
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM holidays WHERE holiday_date = ?", (holiday_date,))
+            self._mark_dirty(cursor)
+        return True
 
 if __name__ == "__main__":
     database = Database()
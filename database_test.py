@@ -0,0 +1,58 @@
+# database_test.py
+import pytest
+
+from bonus_calculator import BonusCalculator
+from config_manager import ConfigManager
+from database import Database
+from employee_utils import create_employee_with_history
+from instrumentation import query_budget
+
+EMPLOYEE_COUNT = 300
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "bonus_system.db"))
+    for number in range(EMPLOYEE_COUNT):
+        database.save_employee(create_employee_with_history({
+            "id": f"E{number:03d}", "first_name": "First", "last_name": f"Last{number}", "hire_date": "2024-01-01",
+            "department": "Sales", "salary": 3000.0, "status": "active"
+        }))
+    database.save_custom_variable({"name": "sales_amount", "display_name": "Sales Amount", "data_type": "number",
+                                   "default_value": "0", "description": ""})
+    yield database
+    database.close()
+
+
+def _grid(value):
+    return [{"employee_id": f"E{number:03d}", "variable_name": "sales_amount", "value": value}
+            for number in range(EMPLOYEE_COUNT)]
+
+
+def test_variable_grid_saves_in_a_fixed_number_of_queries(database):
+    with query_budget(3, "save variable grid"):
+        statuses = database.save_period_variable_values(2024, 3, _grid(1000.0))
+    assert statuses == ["inserted"] * EMPLOYEE_COUNT
+
+    with query_budget(3, "save changed variable grid"):
+        statuses = database.save_period_variable_values(2024, 3, _grid(2000.0))
+    assert statuses == ["updated"] * EMPLOYEE_COUNT
+
+
+def test_variable_grid_loads_in_one_query(database):
+    database.save_period_variable_values(2024, 3, _grid(1000.0))
+
+    with query_budget(1, "load variable grid", max_rows=EMPLOYEE_COUNT):
+        values = database.get_period_variable_values(2024, 3)
+    assert len(values) == EMPLOYEE_COUNT
+
+
+def test_saved_values_check_runs_in_a_fixed_number_of_queries(database, tmp_path):
+    config_manager = ConfigManager(str(tmp_path / "config.json"), database)
+    config_manager.add_kpi({"name": "Sales", "calculation_method": "formula", "formula": "sales_amount * 0.01",
+                            "applicable_departments": ["Sales"], "weight": 1.0, "is_active": True})
+    calculator = BonusCalculator(database, config_manager)
+    database.save_period_variable_values(2024, 3, _grid(1000.0))
+
+    with query_budget(4, "check saved variable values"):
+        assert calculator.are_variable_values_saved(2024, 3, "Sales")
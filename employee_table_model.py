@@ -0,0 +1,150 @@
+# employee_table_model.py
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QBrush
+
+from employee_utils import format_employee_name
+
+
+class EmployeeTableModel(QAbstractTableModel):
+    """Employees page model over an in-memory roster
+
+    Cells are rendered only when the view asks for them. Filtering and sorting
+    work on a list of row positions into the roster, so neither touches the
+    database or creates widgets.
+    """
+
+    COLUMNS = ["ID", "Name", "Department", "Salary", "Status", "Actions"]
+    ACTIONS_COLUMN = 5
+    EmployeeRole = Qt.ItemDataRole.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.employees = []
+        self.visible_rows = []
+        self.search_text = ""
+        self.department_filter = "All Departments"
+        self.status_filter = "All"
+        self.sort_column = None
+        self.sort_order = Qt.SortOrder.AscendingOrder
+
+        # Per-employee values computed once per roster load
+        self._names = []
+        self._search_keys = []
+
+    def set_employees(self, employees):
+        """Replace the roster and reapply the current filter and sort order"""
+        self.beginResetModel()
+        self.employees = list(employees)
+        self._names = [format_employee_name(employee) for employee in self.employees]
+        self._search_keys = [
+            " ".join((employee["id"], employee["first_name"], employee["last_name"], employee["department"])).lower()
+            for employee in self.employees
+        ]
+        self._apply_filter()
+        self.endResetModel()
+
+    def set_filter(self, search_text="", department="All Departments", status="All"):
+        """Show only employees matching the search text, department and status"""
+        self.beginResetModel()
+        self.search_text = search_text.lower()
+        self.department_filter = department
+        self.status_filter = status
+        self._apply_filter()
+        self.endResetModel()
+
+    def _apply_filter(self):
+        search_text = self.search_text
+        department = self.department_filter
+        status = self.status_filter
+        self.visible_rows = [
+            row for row, employee in enumerate(self.employees)
+            if (not search_text or search_text in self._search_keys[row])
+            and (department == "All Departments" or employee["department"] == department)
+            and (status == "All" or employee["status"] == status)
+        ]
+        if self.sort_column is not None:
+            self._sort_rows()
+
+    def _sort_rows(self):
+        if self.sort_column == self.ACTIONS_COLUMN:
+            return
+        if self.sort_column == 1:
+            key = lambda row: self._names[row].lower()
+        elif self.sort_column == 3:
+            key = lambda row: self.employees[row]["salary"]
+        else:
+            field = {0: "id", 2: "department", 4: "status"}[self.sort_column]
+            key = lambda row: self.employees[row][field].lower()
+        self.visible_rows.sort(key=key, reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Sort the visible rows, called by the view when a header is clicked"""
+        self.layoutAboutToBeChanged.emit()
+        self.sort_order = order
+        if column < 0:
+            # No sort column: back to the roster order
+            self.sort_column = None
+            self.visible_rows.sort()
+        else:
+            self.sort_column = column
+            self._sort_rows()
+        self.layoutChanged.emit()
+
+    def employee_at(self, row):
+        """Get the employee shown in a view row"""
+        return self.employees[self.visible_rows[row]]
+
+    def visible_employees(self):
+        """Get the employees passing the current filter, in display order"""
+        return [self.employees[row] for row in self.visible_rows]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.visible_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        roster_row = self.visible_rows[index.row()]
+        employee = self.employees[roster_row]
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return employee["id"]
+            if column == 1:
+                return self._names[roster_row]
+            if column == 2:
+                return employee["department"]
+            if column == 3:
+                return f"${employee['salary']:,.2f}"
+            if column == 4:
+                return employee["status"]
+            return "⋮"  # Opens the shared action menu
+
+        if role == self.EmployeeRole:
+            return employee
+
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            if column == 3:
+                return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+            if column in (4, self.ACTIONS_COLUMN):
+                return Qt.AlignmentFlag.AlignCenter
+
+        if column == 4:
+            # Status with color coding
+            terminated = employee["status"] == "Terminated"
+            if role == Qt.ItemDataRole.ForegroundRole:
+                return QBrush(Qt.GlobalColor.red if terminated else Qt.GlobalColor.darkGreen)
+            if role == Qt.ItemDataRole.BackgroundRole and terminated:
+                return QBrush(Qt.GlobalColor.lightGray)
+
+        return None
@@ -24,6 +24,14 @@ def create_employee_with_history(employee_data):
     }
 
 
+def format_employee_name(employee):
+    """Full name as shown in employee and order lists: last, first and father's name"""
+    father_name = employee.get("father_name")
+    if father_name in (None, "None"):
+        father_name = ""
+    return " ".join(part for part in (employee["last_name"], employee["first_name"], father_name) if part)
+
+
 def get_current_salary(employee, target_date=None):
     """Get effective salary for a specific date"""
     if target_date is None:
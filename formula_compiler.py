@@ -0,0 +1,346 @@
+# formula_compiler.py
+import ast
+import re
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FormulaError(ValueError):
+    """Raised when a KPI formula cannot be parsed or uses a forbidden construct"""
+
+
+# Functions a formula may call
+FORMULA_FUNCTIONS = {"min": min, "max": max, "round": round, "sum": sum, "abs": abs}
+
+# Syntax a formula may use: names, literals, arithmetic, comparisons and conditionals
+ALLOWED_NODES = (
+    ast.Expression, ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List, ast.Call,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UnaryOp, ast.UAdd, ast.USub, ast.Not,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.IfExp,
+)
+
+# Shared globals for every evaluation, built once
+_EVAL_GLOBALS = {"__builtins__": {}, **FORMULA_FUNCTIONS}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Marks a formula that cannot be turned into array operations
+_NOT_VECTORIZED = object()
+
+# Globals for array evaluation; the names start with "_" so formulas cannot reach them
+if np is not None:
+    _VECTOR_GLOBALS = {
+        "__builtins__": {},
+        "_where": np.where,
+        "_minimum": lambda first, *rest: _reduce_arrays(np.minimum, first, rest),
+        "_maximum": lambda first, *rest: _reduce_arrays(np.maximum, first, rest),
+        "_abs": np.abs,
+        "_round": lambda value, *ndigits: _round_array(value, *ndigits),
+        "_and": lambda first, *rest: _reduce_arrays(np.logical_and, first, rest),
+        "_or": lambda first, *rest: _reduce_arrays(np.logical_or, first, rest),
+        "_not": np.logical_not,
+        "_int": lambda value: np.asarray(value).astype(np.int64),
+    }
+
+
+def _reduce_arrays(func, first, rest):
+    """Apply a binary elementwise function across any number of operands"""
+    result = first
+    for value in rest:
+        result = func(result, value)
+    return result
+
+
+def _round_array(value, ndigits=None):
+    """Round like the built-in round: round(x) gives integers, round(x, n) floats to n digits"""
+    value = np.asarray(value, dtype=float)
+    rounded = np.round(value, ndigits or 0)
+    if ndigits is not None:
+        # numpy scales by 10**n, which can tip values next to a tie; those use the exact built-in
+        scaled = np.abs(value) * 10.0 ** ndigits
+        with np.errstate(all="ignore"):
+            near_tie = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.spacing(scaled)
+        flat_value, flat_rounded = value.reshape(-1), rounded.reshape(-1)
+        for index in np.flatnonzero(near_tie):
+            flat_rounded[index] = round(float(flat_value[index]), ndigits)
+        return rounded
+    # Integers past 2**53 are not exact in float64; raising sends the formula to the scalar path
+    if not np.all(np.abs(rounded) <= 2 ** 53):
+        raise OverflowError("Rounded values do not fit in an integer column")
+    return rounded.astype(np.int64)
+
+
+class _NotVectorizable(Exception):
+    """The formula uses something that has no elementwise equivalent"""
+
+
+class _VectorTransformer(ast.NodeTransformer):
+    """Rewrite a checked formula so it evaluates over whole columns at once"""
+
+    # Calls that map to elementwise functions, with their minimum argument count
+    VECTOR_CALLS = {"min": ("_minimum", 2), "max": ("_maximum", 2), "abs": ("_abs", 1), "round": ("_round", 1)}
+
+    def _call(self, name, args, node):
+        return ast.copy_location(ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[]), node)
+
+    def _is_boolean(self, node):
+        """Python's and/or/not only match logical_and/or/not on boolean operands"""
+        if isinstance(node, (ast.Compare, ast.BoolOp)):
+            return True
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return True
+        if isinstance(node, ast.IfExp):
+            return self._is_boolean(node.body) and self._is_boolean(node.orelse)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("min", "max"):
+            return all(self._is_boolean(arg) for arg in node.args)
+        return isinstance(node, ast.Constant) and isinstance(node.value, bool)
+
+    def _numeric(self, node):
+        """Visit an arithmetic operand; booleans count as 0 and 1 in Python, while numpy adds them as logical or"""
+        boolean = self._is_boolean(node)
+        node = self.visit(node)
+        return self._call("_int", [node], node) if boolean else node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)):
+            raise _NotVectorizable()
+        return node
+
+    def visit_Tuple(self, node):
+        raise _NotVectorizable()
+
+    def visit_List(self, node):
+        raise _NotVectorizable()
+
+    def visit_Call(self, node):
+        vector_name, min_args = self.VECTOR_CALLS.get(node.func.id, (None, 0))
+        # sum() needs an iterable, and round() only takes a literal integer number of digits
+        if vector_name is None or len(node.args) < min_args or (node.func.id == "abs" and len(node.args) != 1):
+            raise _NotVectorizable()
+        if node.func.id == "round" and (len(node.args) > 2 or (len(node.args) == 2 and not (
+                isinstance(node.args[1], ast.Constant) and type(node.args[1].value) is int))):
+            raise _NotVectorizable()
+        return self._call(vector_name, [self.visit(arg) for arg in node.args], node)
+
+    def visit_IfExp(self, node):
+        return self._call("_where", [self.visit(node.test), self.visit(node.body), self.visit(node.orelse)], node)
+
+    def visit_BoolOp(self, node):
+        if not all(self._is_boolean(value) for value in node.values):
+            raise _NotVectorizable()
+        name = "_and" if isinstance(node.op, ast.And) else "_or"
+        return self._call(name, [self.visit(value) for value in node.values], node)
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return self._call("_not", [self.visit(node.operand)], node)
+        node.operand = self._numeric(node.operand)
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self._numeric(node.left)
+        node.right = self._numeric(node.right)
+        return node
+
+    def visit_Compare(self, node):
+        # a < b < c becomes (a < b) and (b < c)
+        operands = [self.visit(node.left)] + [self.visit(comparator) for comparator in node.comparators]
+        pairs = [
+            ast.copy_location(ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]]), node)
+            for i, op in enumerate(node.ops)
+        ]
+        return pairs[0] if len(pairs) == 1 else self._call("_and", pairs, node)
+
+
+def build_columns(environments):
+    """Turn a list of variable mappings into one float array per numeric variable
+
+    Variables that are missing for some rows or hold text are left out, so
+    formulas reading them are evaluated row by row instead.
+    """
+    if np is None or not environments:
+        return {}
+
+    names = set()
+    for env in environments:
+        names.update(env)
+
+    columns = {}
+    for name in names:
+        values = [env.get(name) for env in environments]
+        if all(isinstance(value, (int, float)) for value in values):
+            try:
+                columns[name] = np.array(values, dtype=float)
+            except OverflowError:
+                continue
+    return columns
+
+
+def to_python_syntax(formula):
+    """Translate the KPI formula syntax (``then``) to a Python expression"""
+    return formula.strip().replace(" then ", " if ")
+
+
+class CompiledFormula:
+    """A KPI formula parsed, checked and compiled once"""
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.expression = to_python_syntax(formula)
+
+        try:
+            tree = ast.parse(self.expression, mode="eval")
+        except SyntaxError as e:
+            raise FormulaError(f"Invalid formula syntax: {e.msg}") from e
+
+        self.variables = frozenset(self._check_tree(tree))
+        self.code = compile(tree, "<kpi formula>", "eval")
+        self._vector_code = None
+
+    def _check_tree(self, tree):
+        """Reject anything outside the allow-list and collect variable names"""
+        variables = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise FormulaError(f"'{type(node).__name__}' is not allowed in formulas")
+
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FORMULA_FUNCTIONS:
+                    raise FormulaError("Only min, max, round, sum and abs can be called in formulas")
+                if node.keywords:
+                    raise FormulaError("Keyword arguments are not allowed in formulas")
+
+            elif isinstance(node, ast.Name):
+                if node.id.startswith("_"):
+                    raise FormulaError(f"Name '{node.id}' is not allowed in formulas")
+                if node.id not in FORMULA_FUNCTIONS:
+                    variables.add(node.id)
+
+        return variables
+
+    def evaluate(self, variables):
+        """Evaluate the formula with the given variable values"""
+        return eval(self.code, _EVAL_GLOBALS, variables)
+
+    @property
+    def vector_code(self):
+        """Code evaluating the formula over numpy columns, or None if it cannot be vectorized"""
+        if np is None:
+            return None
+        if self._vector_code is None:
+            try:
+                vector_tree = _VectorTransformer().visit(ast.parse(self.expression, mode="eval"))
+                self._vector_code = compile(ast.fix_missing_locations(vector_tree), "<kpi formula>", "eval")
+            except _NotVectorizable:
+                self._vector_code = _NOT_VECTORIZED
+        return None if self._vector_code is _NOT_VECTORIZED else self._vector_code
+
+    def evaluate_columns(self, columns, rows):
+        """Evaluate the formula for the given row indices of a column matrix
+
+        Returns a list with one value per row, where None marks rows whose
+        result was not finite and must be evaluated row by row to reproduce
+        the scalar behaviour. Returns None if the formula cannot be vectorized
+        or reads a variable that has no column.
+        """
+        code = self.vector_code
+        if code is None or not self.variables.issubset(columns):
+            return None
+
+        env = {name: columns[name][rows] for name in self.variables}
+        try:
+            with np.errstate(all="ignore"):
+                result = eval(code, _VECTOR_GLOBALS, env)
+            result = np.broadcast_to(np.asarray(result), (len(rows),))
+        except Exception:
+            return None
+        if result.dtype.kind not in "biuf":
+            return None
+
+        values = result.tolist()
+        if result.dtype.kind == "f":
+            for row in np.flatnonzero(~np.isfinite(result)):
+                values[row] = None
+        return values
+
+    def missing_variables(self, variables):
+        """Get the variable names the formula reads but the mapping does not provide"""
+        return self.variables.difference(variables)
+
+
+def compile_formula(formula, kpi_id=None):
+    """Get the compiled formula for a KPI, parsing it only the first time it is seen"""
+    key = (kpi_id, formula)
+    compiled = _cache.get(key)
+    if compiled is None:
+        compiled = CompiledFormula(formula)
+        with _cache_lock:
+            compiled = _cache.setdefault(key, compiled)
+    return compiled
+
+
+def validate_formula(formula):
+    """Check a formula without evaluating it, raising FormulaError if it is not allowed"""
+    return compile_formula(formula)
+
+
+def clear_formula_cache():
+    """Forget every compiled formula"""
+    with _cache_lock:
+        _cache.clear()
+
+
+class VariableDependencyIndex:
+    """Which custom variables each department needs, from the formulas of its KPIs"""
+
+    def __init__(self, kpis, custom_variables):
+        variable_names = {var['name'] for var in custom_variables}
+
+        # None collects variables of KPIs that apply to every department
+        self.department_variables = {}
+        for kpi in kpis:
+            used = formula_variables(kpi.get('formula', ''), kpi.get('id')) & variable_names
+            for department in kpi.get('applicable_departments', []) or [None]:
+                self.department_variables.setdefault(department, set()).update(used)
+
+    def variables_for_department(self, department):
+        """Get the names of the variables employees of a department need"""
+        return self.department_variables.get(None, set()) | self.department_variables.get(department, set())
+
+
+_dependency_index = None
+_dependency_index_key = None
+
+
+def formula_variables(formula, kpi_id=None):
+    """Get the names a formula reads, by tokens rather than substrings"""
+    if not formula:
+        return frozenset()
+    try:
+        return compile_formula(formula, kpi_id).variables
+    except FormulaError:
+        # Formulas saved before validation existed may not parse; fall back to identifier tokens
+        return frozenset(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", to_python_syntax(formula)))
+
+
+def get_variable_dependency_index(kpis, custom_variables):
+    """Get the dependency index, rebuilding it only when the KPIs or variables changed"""
+    global _dependency_index, _dependency_index_key
+
+    key = (
+        tuple((kpi.get('id'), kpi.get('formula', ''), tuple(kpi.get('applicable_departments', []) or ()))
+              for kpi in kpis),
+        tuple(sorted(var['name'] for var in custom_variables)),
+    )
+    if _dependency_index is None or key != _dependency_index_key:
+        _dependency_index = VariableDependencyIndex(kpis, custom_variables)
+        _dependency_index_key = key
+    return _dependency_index
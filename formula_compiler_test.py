@@ -0,0 +1,57 @@
+# formula_compiler_test.py
+import pytest
+
+pytest.importorskip("numpy")
+
+from formula_compiler import build_columns, compile_formula
+
+# Ties, values one ulp off a tie in decimal, negatives and ordinary amounts
+VALUES = [2.5, 3.5, -2.5, 0.125, 2.675, 1.005, 1.115, 99.995, -0.285, 1234.5678, 0.0, 17.0, 48213.49999]
+
+
+@pytest.mark.parametrize("formula", [
+    "round(x)",
+    "round(x) + 1",
+    "round(x, 0)",
+    "round(x, 2)",
+    "round(x / 3, 2) * 2",
+    "round(x) if x > 0 else -1",
+])
+def test_vectorized_round_matches_scalar_round(formula):
+    environments = [{"x": value} for value in VALUES]
+    compiled = compile_formula(formula)
+
+    vector_values = compiled.evaluate_columns(build_columns(environments), list(range(len(environments))))
+    scalar_values = [compiled.evaluate(env) for env in environments]
+
+    assert vector_values is not None
+    assert vector_values == scalar_values
+    assert [type(value) for value in vector_values] == [type(value) for value in scalar_values]
+
+
+# Every combination of values on both sides of the thresholds the formulas below use
+ROWS = [{"sales_amount": sales_amount, "rating": rating}
+        for sales_amount in [0.0, 999.5, 1000.0, 2500.0, 6000.0] for rating in [1.0, 3.0, 3.5, 5.0]]
+
+
+@pytest.mark.parametrize("formula", [
+    "((sales_amount > 1000) + (rating > 3)) * 100",
+    "(sales_amount > 1000) * (rating > 3)",
+    "-(rating > 3) + 1",
+    "(not rating > 3) + (rating >= 5) + True",
+    "max(sales_amount > 1000, rating > 3) + 1",
+    "((rating > 3) if sales_amount > 1000 else (rating > 1)) + (rating > 4)",
+    "(1000 < sales_amount <= 5000) * 50",
+    "1 <= rating < 3.5 < 5",
+    "sales_amount * 0.1 if 1000 <= sales_amount < 5000 and rating > 3 else sales_amount * 0.05",
+    "(sales_amount * 0.02 if rating > 3 else 0.0) + (100.0 if sales_amount > 5000 else 0.0)",
+])
+def test_vectorized_formula_matches_scalar_formula(formula):
+    compiled = compile_formula(formula)
+
+    vector_values = compiled.evaluate_columns(build_columns(ROWS), list(range(len(ROWS))))
+    scalar_values = [compiled.evaluate(env) for env in ROWS]
+
+    assert vector_values is not None
+    assert vector_values == scalar_values
+    assert [type(value) for value in vector_values] == [type(value) for value in scalar_values]
@@ -0,0 +1,332 @@
+# instrumentation.py
+"""Spans with wall time, SQL query counts and rows fetched
+
+Instrumentation is off by default; a span is then one global check. Turn it on
+around the work to measure and export the profile:
+
+    with instrumentation.profile() as profiler:
+        calculator.calculate_bonuses_for_department(2024, 3, "Sales")
+    profiler.write("profile.json")      # or "profile.folded" for flame graph tools
+
+Queries are counted by the pooled database connections (see CountingConnection),
+so only work done in this process is seen, not work of calculation worker processes.
+"""
+import functools
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# The active profiler, or None while instrumentation is off
+_profiler = None
+_local = threading.local()
+_NULL_SPAN = nullcontext()
+
+
+class Span:
+    """One open span; queries and rows include those of its children once it is closed"""
+    __slots__ = ("name", "path", "start", "wall", "child_wall", "queries", "rows")
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.start = time.perf_counter()
+        self.wall = 0.0
+        self.child_wall = 0.0
+        self.queries = 0
+        self.rows = 0
+
+
+class Profiler:
+    """Collects spans of every thread, aggregated by their call path"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stats = {}  # path tuple -> [calls, wall, self wall, queries, rows]
+        self.unattributed_queries = 0
+        self.unattributed_rows = 0
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        # Stacks are per thread and start empty for every new profiler
+        if getattr(_local, "profiler", None) is not self:
+            _local.profiler = self
+            _local.stack = []
+        return _local.stack
+
+    def enter(self, name):
+        stack = self._stack()
+        span = Span(name, (stack[-1].path + (name,)) if stack else (name,))
+        stack.append(span)
+        return span
+
+    def exit(self, span):
+        span.wall = time.perf_counter() - span.start
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+        if stack:
+            parent = stack[-1]
+            parent.child_wall += span.wall
+            parent.queries += span.queries
+            parent.rows += span.rows
+
+        with self._lock:
+            stats = self.stats.get(span.path)
+            if stats is None:
+                stats = self.stats[span.path] = [0, 0.0, 0.0, 0, 0]
+            stats[0] += 1
+            stats[1] += span.wall
+            stats[2] += span.wall - span.child_wall
+            stats[3] += span.queries
+            stats[4] += span.rows
+        return span
+
+    def record_query(self):
+        stack = self._stack()
+        if stack:
+            stack[-1].queries += 1
+            return
+        with self._lock:
+            self.unattributed_queries += 1
+
+    def record_rows(self, count):
+        stack = self._stack()
+        if stack:
+            stack[-1].rows += count
+            return
+        with self._lock:
+            self.unattributed_rows += count
+
+    def _self_counts(self):
+        """Queries and rows of each path minus those of its child paths"""
+        self_counts = {path: [stats[3], stats[4]] for path, stats in self.stats.items()}
+        for path, stats in self.stats.items():
+            parent = self_counts.get(path[:-1])
+            if parent is not None:
+                parent[0] -= stats[3]
+                parent[1] -= stats[4]
+        return self_counts
+
+    def queries(self, name=None):
+        """Total queries, or the queries of every outermost span with this name"""
+        with self._lock:
+            if name is None:
+                return self.unattributed_queries + sum(stats[3] for path, stats in self.stats.items()
+                                                       if len(path) == 1)
+            return sum(stats[3] for path, stats in self.stats.items()
+                       if path[-1] == name and name not in path[:-1])
+
+    def to_dict(self):
+        """The profile as {"spans": [...], "totals": {...}}, spans ordered by call path"""
+        with self._lock:
+            items = sorted(self.stats.items())
+            self_counts = self._self_counts()
+            unattributed_queries = self.unattributed_queries
+            unattributed_rows = self.unattributed_rows
+
+        spans = []
+        for path, (calls, wall, self_wall, queries, rows) in items:
+            spans.append({
+                "name": path[-1],
+                "path": ";".join(path),
+                "depth": len(path) - 1,
+                "calls": calls,
+                "wall_ms": round(wall * 1000, 3),
+                "self_ms": round(self_wall * 1000, 3),
+                "queries": queries,
+                "self_queries": self_counts[path][0],
+                "rows": rows,
+                "self_rows": self_counts[path][1],
+            })
+        roots = [span for span in spans if span["depth"] == 0]
+        return {
+            "started_at": self.started_at,
+            "spans": spans,
+            "totals": {
+                "wall_ms": round(sum(span["wall_ms"] for span in roots), 3),
+                "queries": sum(span["queries"] for span in roots) + unattributed_queries,
+                "rows": sum(span["rows"] for span in roots) + unattributed_rows,
+                "unattributed_queries": unattributed_queries,
+                "unattributed_rows": unattributed_rows,
+            },
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_collapsed_stacks(self):
+        """The profile as collapsed stacks ("a;b;c <self microseconds>" per line) for flame graph tools"""
+        with self._lock:
+            items = sorted(self.stats.items())
+        return "".join(f"{';'.join(path)} {int(round(stats[2] * 1_000_000))}\n" for path, stats in items)
+
+    def write(self, path):
+        """Write the profile to a file: collapsed stacks for .folded/.txt, JSON otherwise"""
+        with open(path, "w") as f:
+            if path.lower().endswith((".folded", ".txt")):
+                f.write(self.to_collapsed_stacks())
+            else:
+                f.write(self.to_json())
+                f.write("\n")
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def start_profiling():
+    """Turn instrumentation on with a new profiler and return it"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def stop_profiling():
+    """Turn instrumentation off and return the profiler that was active, if any"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+@contextmanager
+def profile():
+    """Profile a block, e.g. ``with profile() as profiler:``; an active profiler is reused"""
+    profiler = _profiler
+    if profiler is not None:
+        yield profiler
+        return
+    profiler = start_profiling()
+    try:
+        yield profiler
+    finally:
+        stop_profiling()
+
+
+def span(name):
+    """Context manager timing a block as a span, e.g. ``with span("load inputs"):``"""
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_SPAN
+    return _SpanContext(profiler, name)
+
+
+class _SpanContext:
+    __slots__ = ("profiler", "name", "span")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.span = self.profiler.enter(self.name)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.exit(self.span)
+        return False
+
+
+def instrumented(name):
+    """Decorator recording every call of a function as a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            current = profiler.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.exit(current)
+        return wrapper
+    return decorate
+
+
+def instrument_methods(prefix, exclude=()):
+    """Class decorator recording every method (except dunder and excluded ones) as "prefix.method" spans
+
+    Generator methods are left alone, as their work happens after the call returns.
+    """
+    def decorate(cls):
+        for attribute, value in list(vars(cls).items()):
+            if attribute.startswith("__") or attribute in exclude or not inspect.isfunction(value):
+                continue
+            if inspect.isgeneratorfunction(value):
+                continue
+            setattr(cls, attribute, instrumented(f"{prefix}.{attribute}")(value))
+        return cls
+    return decorate
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Cursor reporting its statements and fetched rows to the active profiler"""
+
+    def execute(self, *args):
+        if _profiler is not None:
+            _profiler.record_query()
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        if _profiler is not None:
+            _profiler.record_query()
+        return super().executemany(*args)
+
+    def executescript(self, *args):
+        if _profiler is not None:
+            _profiler.record_query()
+        return super().executescript(*args)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if _profiler is not None and row is not None:
+            _profiler.record_rows(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        if _profiler is not None:
+            _profiler.record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if _profiler is not None:
+            _profiler.record_rows(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    """Connection whose cursors are CountingCursors; pass as sqlite3.connect(..., factory=CountingConnection)
+
+    Statements run directly on the connection (connection.execute) are not counted.
+    """
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget when a block issues more queries or fetches more rows than allowed"""
+
+
+@contextmanager
+def query_budget(max_queries, label="query budget", max_rows=None):
+    """Assert that a block issues at most max_queries statements (and fetches at most max_rows rows)
+
+        with query_budget(3, "load variable grid"):
+            widget.load_data()
+
+    The block is profiled as a span named label; the span is yielded.
+    """
+    with profile():
+        with span(label) as measured:
+            yield measured
+    if measured.queries > max_queries:
+        raise QueryBudgetExceeded(f"{label}: {measured.queries} queries, budget is {max_queries}")
+    if max_rows is not None and measured.rows > max_rows:
+        raise QueryBudgetExceeded(f"{label}: {measured.rows} rows fetched, budget is {max_rows}")
@@ -7,6 +7,8 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont, QSyntaxHighlighter, QTextCharFormat, QColor, QPalette
 import re
 
+from formula_compiler import compile_formula
+
 class FormulaHighlighter(QSyntaxHighlighter):
     """Syntax highlighter for KPI formulas"""
 
@@ -435,18 +437,10 @@ class KPIEditorDialog(QDialog):
 
     def safe_eval_formula(self, formula, variables):
         """Safely evaluate a formula with given variables"""
-        # Replace custom syntax with Python syntax
-        formula = formula.replace(" then ", " if ").replace(" else ", " else ")
-
-        # Create safe evaluation environment
-        safe_dict = {
-            "min": min,
-            "max": max,
-            "round": round,
-            "sum": sum,
-            "abs": abs,
-            "__builtins__": {}
-        }
+        # Parse and check the formula first; raises FormulaError for anything not allowed
+        compiled = compile_formula(formula, self.kpi_data.get("id"))
+
+        safe_dict = {}
 
         # Add base_salary from test data (if provided) or use default
         safe_dict.update(variables)
@@ -481,7 +475,7 @@ class KPIEditorDialog(QDialog):
 
         # Evaluate the formula
         try:
-            return eval(formula, {"__builtins__": {}}, safe_dict)
+            return compiled.evaluate(safe_dict)
         except Exception as e:
             print(f"Error evaluating formula: {e}")
             print(f"Formula: {formula}")
@@ -1,3 +1,4 @@
+import logging
 import sys
 import traceback
 from PyQt6.QtWidgets import QApplication, QMessageBox
@@ -6,6 +7,7 @@ from login_window import LoginWindow
 import os
 import json
 from database import Database
+import instrumentation
 
 
 
@@ -34,6 +36,10 @@ def main():
         # Set the exception hook
         sys.excepthook = exception_hook
 
+        # Progress and diagnostics of the core go to the console; BONUS_LOG_LEVEL=DEBUG shows everything
+        logging.basicConfig(level=os.environ.get("BONUS_LOG_LEVEL", "INFO").upper(),
+                            format="%(levelname)s: %(message)s")
+
         # Enable high DPI scaling (helps with graphics issues)
         QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
 
@@ -49,8 +55,18 @@ def main():
         login_window = LoginWindow()
         login_window.show()
 
+        # BONUS_PROFILE=profile.json (or .folded) records spans of the whole session
+        profile_path = os.environ.get("BONUS_PROFILE")
+        if profile_path:
+            instrumentation.start_profiling()
+
         # Run the application
-        sys.exit(app.exec())
+        exit_code = app.exec()
+
+        if profile_path:
+            instrumentation.stop_profiling().write(profile_path)
+            print(f"Profile written to {profile_path}")
+        sys.exit(exit_code)
 
     except Exception as e:
         print(f"Application failed to start: {e}")
@@ -1,12 +1,15 @@
+import logging
+import os
 import sys
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
     QStatusBar, QTableWidget, QTableWidgetItem, QHeaderView,
     QMessageBox, QLineEdit, QDialog, QComboBox, QSpinBox, QGroupBox,
-    QMenu, QToolButton, QFormLayout, QStackedWidget, QDateEdit, QAbstractScrollArea, QListWidget, QInputDialog
+    QMenu, QToolButton, QFormLayout, QStackedWidget, QDateEdit, QAbstractScrollArea, QListWidget, QInputDialog,
+    QCheckBox, QTableView, QProgressBar, QFileDialog
 )
 
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThreadPool
 from PyQt6.QtGui import QAction
 from datetime import datetime, date
 import calendar
@@ -26,12 +29,14 @@ from variable_entry_widget import VariableEntryWidget
 from order_dialog import OrderDialog
 from new_page_template import NewPageTemplate
 from kpi_editor_dialog import KPIEditorDialog
+from working_calendar import WorkingCalendar
+from employee_table_model import EmployeeTableModel
+from bonus_calculation_worker import BonusCalculationWorker
+from instrumentation import instrumented
+from result_export import ExportError, export_results, iter_stored_results
+from bulk_import import import_csv, write_error_report
 
-
-class EmployeeTableWidget(QTableWidget):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.parent = parent
+logger = logging.getLogger(__name__)
 
 
 class MainWindow(QMainWindow):
@@ -42,6 +47,7 @@ class MainWindow(QMainWindow):
         self.config_manager = ConfigManager(database=self.database)
         self.employees = []
         self.all_orders = []
+        self.bonus_worker = None  # Calculation running in the background, if any
         self.setup_ui()
         self.load_employees_from_db()
         #self.new_page = NewPageTemplate('')
@@ -83,6 +89,10 @@ class MainWindow(QMainWindow):
         orders_action.triggered.connect(self.show_orders)
         employees_menu.addAction(orders_action)
 
+        import_action = QAction("Import from CSV...", self)
+        import_action.triggered.connect(self.import_employees_csv)
+        employees_menu.addAction(import_action)
+
         # Dashboard menu
         dashboard_menu = menubar.addMenu("Dashboard")
         dashboard_action = QAction("Dashboard", self)
@@ -101,6 +111,10 @@ class MainWindow(QMainWindow):
         calculate_bonus_action.triggered.connect(self.open_bonus_calculation)
         bonus_menu.addAction(calculate_bonus_action)
 
+        export_results_action = QAction("Export Results...", self)
+        export_results_action.triggered.connect(self.export_bonus_results)
+        bonus_menu.addAction(export_results_action)
+
         # Configuration menu
         # config_menu = menubar.addMenu("Configuration")
         # config_action = QAction("System Configuration", self)
@@ -278,7 +292,7 @@ class MainWindow(QMainWindow):
         filter_layout.addStretch()
 
         refresh_btn = QPushButton("Refresh")
-        refresh_btn.clicked.connect(self.load_employees_from_db)
+        refresh_btn.clicked.connect(self.refresh_employees)
         filter_layout.addWidget(refresh_btn)
 
         filter_group.setLayout(filter_layout)
@@ -288,23 +302,37 @@ class MainWindow(QMainWindow):
         self.employee_count_label = QLabel()
         layout.addWidget(self.employee_count_label)
 
-        # Employee table
-        self.employee_table = EmployeeTableWidget(self)
-        self.employee_table.setColumnCount(6)  # Changed from 7 to 8
-        self.employee_table.setHorizontalHeaderLabels([
-            "ID", "Name", "Department", "Salary", "Status", "Actions"
-            # Added Father's Name
-        ])
+        # Employee table: rows are rendered by the model on demand
+        self.employee_model = EmployeeTableModel(self)
+        self.employee_table = QTableView()
+        self.employee_table.setModel(self.employee_model)
+        # Keep the database order until a header is clicked
+        self.employee_table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.employee_table.setSortingEnabled(True)
+        self.employee_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.employee_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        self.employee_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+
+        # Fitting columns to contents would measure every row, so use fixed widths instead
         header = self.employee_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)  # ID
-        header.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)  # First Name
-
-        header.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)  # Department
-        header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)  # Salary
-        header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)  # Status
-        header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)  # Actions
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)  # Name
+        for column, width in ((0, 100), (2, 160), (3, 120), (4, 100), (5, 70)):
+            header.resizeSection(column, width)
+
+        # One action menu shared by every row, opened from the Actions column or by right-click
+        self.employee_action_menu = QMenu(self)
+        for label, order_type in (("📝 Change Salary", "salary change"),
+                                  ("📝 Change Department", "department change"),
+                                  ("🔴 Terminate Employee", "termination")):
+            action = self.employee_action_menu.addAction(label)
+            action.setData(order_type)
+        self.employee_table.clicked.connect(self.on_employee_table_clicked)
+        self.employee_table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.employee_table.customContextMenuRequested.connect(
+            lambda pos: self.show_employee_action_menu(self.employee_table.indexAt(pos), pos)
+        )
 
-        self.employee_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         layout.addWidget(self.employee_table)
 
         page.setLayout(layout)
@@ -374,6 +402,14 @@ class MainWindow(QMainWindow):
         self.calc_dept_combo.addItems(departments)
         working_days_layout.addWidget(self.calc_dept_combo)
 
+        # Salary changes are prorated by working days automatically; the dialog is only for overrides
+        self.review_salary_changes_check = QCheckBox("Review salary changes")
+        self.review_salary_changes_check.setToolTip(
+            "Show the working days at each salary rate for employees whose salary changed this month, "
+            "so they can be overridden before calculating"
+        )
+        working_days_layout.addWidget(self.review_salary_changes_check)
+
         period_layout.addLayout(working_days_layout)
         period_group.setLayout(period_layout)
         layout.addWidget(period_group)
@@ -393,6 +429,13 @@ class MainWindow(QMainWindow):
         info_group.setLayout(info_layout)
         layout.addWidget(info_group)
 
+        # Shown above stored results whose inputs changed after they were calculated
+        self.outdated_results_label = QLabel()
+        self.outdated_results_label.setWordWrap(True)
+        self.outdated_results_label.setStyleSheet("background-color: #fff3cd; padding: 8px; border-radius: 5px;")
+        self.outdated_results_label.setVisible(False)
+        layout.addWidget(self.outdated_results_label)
+
         # Results table
         self.results_table = QTableWidget()
         self.results_table.setColumnCount(6)
@@ -404,6 +447,11 @@ class MainWindow(QMainWindow):
         header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         layout.addWidget(self.results_table)
 
+        # Show the stored run of the selected period instead of recalculating it
+        self.calc_month_combo.currentIndexChanged.connect(self.load_stored_bonuses)
+        self.calc_year_spin.valueChanged.connect(self.load_stored_bonuses)
+        self.calc_dept_combo.currentIndexChanged.connect(self.load_stored_bonuses)
+
         # Action buttons at the bottom
         buttons_layout = QHBoxLayout()
 
@@ -420,11 +468,21 @@ class MainWindow(QMainWindow):
             self, "Not Implemented", "Save functionality will be implemented in a future update."))
         buttons_layout.addWidget(save_bonuses_btn)
 
+        # Progress of a background calculation
+        self.calc_progress_bar = QProgressBar()
+        self.calc_progress_bar.setVisible(False)
+        buttons_layout.addWidget(self.calc_progress_bar)
+
+        self.cancel_calculation_btn = QPushButton("Cancel")
+        self.cancel_calculation_btn.setVisible(False)
+        self.cancel_calculation_btn.clicked.connect(self.cancel_bonus_calculation)
+        buttons_layout.addWidget(self.cancel_calculation_btn)
+
         # Calculate Bonuses button - moved to bottom
-        calculate_btn = QPushButton("Calculate Bonuses")
-        calculate_btn.setStyleSheet("QPushButton { padding: 10px; font-size: 14px; font-weight: bold; }")
-        calculate_btn.clicked.connect(lambda: self.calculate_bonuses())
-        buttons_layout.addWidget(calculate_btn)
+        self.calculate_btn = QPushButton("Calculate Bonuses")
+        self.calculate_btn.setStyleSheet("QPushButton { padding: 10px; font-size: 14px; font-weight: bold; }")
+        self.calculate_btn.clicked.connect(lambda: self.calculate_bonuses())
+        buttons_layout.addWidget(self.calculate_btn)
 
         layout.addLayout(buttons_layout)
 
@@ -555,138 +613,158 @@ class MainWindow(QMainWindow):
         """Show the bonus calculation page"""
         self.stacked_widget.setCurrentIndex(3)
         self.statusBar().showMessage("Bonus Calculation")
+        self.load_stored_bonuses()
 
-    def load_employees_from_db(self):
-        """Load employees from database"""
-        self.employees = self.database.get_all_employees()
-        self.display_employees(self.employees)
-        self.update_employee_count()
-
-        # Reset employee name dictionary
-        if hasattr(self, 'employee_name_dict'):
-            delattr(self, 'employee_name_dict')
-
-    def update_employee_count(self):
-        """Update the employee count label"""
-        total = len(self.employees)
-        active = len([emp for emp in self.employees if emp["status"] == "Active"])
-        terminated = total - active
-
-        self.employee_count_label.setText(
-            f"Showing {total} employees ({active} active, {terminated} terminated)"
-        )
-
-    def display_employees(self, employees):
-        """Display employees in table with action menus"""
-        self.employee_table.setRowCount(len(employees))
-
-        for row, employee in enumerate(employees):
-            # Employee data
-            self.employee_table.setItem(row, 0, QTableWidgetItem(employee["id"]))
-
-            self.employee_table.setItem(row, 2, QTableWidgetItem(str(employee["department"])))
-
-            # Get employee name - fetch directly from database
-            employee_name = self.get_employee_name_from_db(employee["id"])
-            self.employee_table.setItem(row, 1, QTableWidgetItem(employee_name))
-
-            # In display_employees method, around line 447:
-            try:
-                # Get salary value and ensure it's a float
-                salary_value = employee['salary']
-                if not isinstance(salary_value, (int, float)):
-                    # Try to convert if it's a string
-                    try:
-                        salary_value = float(str(salary_value).replace('$', '').replace(',', '').strip())
-                    except:
-                        salary_value = 0.0
-
-                salary_item = QTableWidgetItem(f"${salary_value:,.2f}")
-            except Exception as e:
-                print(f"ERROR formatting salary for employee {employee.get('id', 'unknown')}: {e}")
-
-            salary_item = QTableWidgetItem(f"${employee['salary']:,.2f}")
-            salary_item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-            self.employee_table.setItem(row, 3, salary_item)
-
-            # Status with color coding
-            status_item = QTableWidgetItem(employee["status"])
-            if employee["status"] == "Terminated":
-                status_item.setForeground(Qt.GlobalColor.red)
-                status_item.setBackground(Qt.GlobalColor.lightGray)
-            else:
-                status_item.setForeground(Qt.GlobalColor.darkGreen)
-            status_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.employee_table.setItem(row, 4, status_item)
-
-            # Action menu button
-            action_btn = QToolButton()
-            action_btn.setText("⋮")  # Three dots menu
-            action_btn.setStyleSheet("QToolButton { padding: 5px; border: 1px solid #ccc; border-radius: 3px; }")
-            action_btn.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+    def load_stored_bonuses(self):
+        """Display the last stored calculation run of the selected period, if there is one"""
+        if self.bonus_worker is not None:
+            return  # The running calculation owns the results table
 
-            # Create menu
-            menu = QMenu(self)
-
-            change_salary_action = QAction("📝 Change Salary", self)
+        month = self.calc_month_combo.currentIndex() + 1
+        year = self.calc_year_spin.value()
+        department_filter = self.calc_dept_combo.currentText()
 
-            change_salary_action.triggered.connect(lambda checked, emp=employee:self.terminate_employee(emp,"salary change"))
-            menu.addAction(change_salary_action)
+        run = self.database.get_latest_bonus_run(year, month, department_filter)
+        if run is None:
+            self.results_table.setRowCount(0)
+            self.outdated_results_label.setVisible(False)
+            return
 
-            change_department_action = QAction("📝 Change Department", self)
+        results = self.database.get_bonus_run_results(run["id"])
+        self.display_bonus_results(results)
+        calculated_on = run['created_at'][:16].replace('T', ' ')
+        self.statusBar().showMessage(f"Bonus Calculation - showing results calculated on {calculated_on}")
+
+        # Variables, orders or the configuration may have changed since the run was stored
+        outdated_ids = BonusCalculator(self.database, self.config_manager).get_outdated_employee_ids(run, results)
+        if outdated_ids is None:
+            self.outdated_results_label.setText(
+                f"These results calculated on {calculated_on} are outdated: KPIs, variables or the configuration "
+                f"changed since. Click 'Calculate Bonuses' to update them.")
+        elif outdated_ids:
+            self.outdated_results_label.setText(
+                f"These results calculated on {calculated_on} are outdated for {len(outdated_ids)} employees whose "
+                f"data changed since. Click 'Calculate Bonuses' to update them.")
+        self.outdated_results_label.setVisible(bool(outdated_ids) or outdated_ids is None)
+
+    def export_bonus_results(self):
+        """Export the stored results of the selected period and department to CSV, XLSX or Parquet"""
+        month = self.calc_month_combo.currentIndex() + 1
+        year = self.calc_year_spin.value()
+        department = self.calc_dept_combo.currentText()
 
-            change_department_action.triggered.connect(lambda checked, emp=employee:self.terminate_employee(emp,"department change"))
-            menu.addAction(change_department_action)
+        if self.database.get_latest_bonus_run(year, month, department) is None:
+            QMessageBox.information(self, "Export Results",
+                                    f"There are no calculated results for {department} in "
+                                    f"{self.calc_month_combo.currentText()} {year}.\n"
+                                    f"Please calculate bonuses first.")
+            return
 
-            terminate_action = QAction("🔴 Terminate Employee", self)
-            terminate_action.triggered.connect(lambda checked, emp=employee: self.terminate_employee(emp,"termination"))
+        default_name = f"bonuses_{year}_{month:02d}_{department.replace(' ', '_')}.csv"
+        path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export Results", default_name, "CSV (*.csv);;Excel (*.xlsx);;Parquet (*.parquet)"
+        )
+        if not path:
+            return
+        if not os.path.splitext(path)[1]:
+            path += {"Excel (*.xlsx)": ".xlsx", "Parquet (*.parquet)": ".parquet"}.get(selected_filter, ".csv")
 
-            menu.addAction(terminate_action)
+        try:
+            # Streamed from the stored run, one employee at a time
+            count = export_results(iter_stored_results(self.database, [(year, month)], department), path)
+        except (ExportError, OSError) as e:
+            QMessageBox.critical(self, "Export Failed", f"Failed to export results: {str(e)}")
+            return
 
-            action_btn.setMenu(menu)
+        self.statusBar().showMessage(f"Exported {count} rows to {path}")
 
-            # Add button to table - column index changed from 6 to 7
-            self.employee_table.setCellWidget(row, 5, action_btn)
-    def filter_employees(self):
-        """Filter employees based on search criteria"""
-        search_text = self.search_input.text().lower()
-        dept_filter = self.dept_combo.currentText()
-        status_filter = self.status_combo.currentText()
+    def import_employees_csv(self):
+        """Import employees and orders from a CSV file and show which rows failed"""
+        path, _ = QFileDialog.getOpenFileName(self, "Import Employees and Orders", "", "CSV (*.csv)")
+        if not path:
+            return
 
-        filtered_employees = []
-        for emp in self.employees:
-            # Search text filter
-            matches_search = (not search_text or
-                              search_text in emp["id"].lower() or
-                              search_text in emp["first_name"].lower() or
-                              search_text in emp["last_name"].lower() or
-                              search_text in emp["department"].lower())
+        try:
+            report = import_csv(self.database, path, self.config_manager.get_departments())
+        except Exception as e:
+            # Batches written before the failure stay imported
+            QMessageBox.critical(self, "Import Failed", f"Failed to import {path}: {str(e)}")
+            return
+        finally:
+            self.refresh_employees()
+            self.load_orders_from_db()
 
-            # Department filter
-            matches_dept = (dept_filter == "All Departments" or
-                            emp["department"] == dept_filter)
+        summary = (f"Imported {report['employees']} employees, {report['orders']} orders and "
+                   f"{report['changes']} employee changes from {report['rows']} rows.")
+        if not report["errors"]:
+            QMessageBox.information(self, "Import Complete", summary)
+            return
 
-            # Status filter
-            matches_status = (status_filter == "All" or
-                              emp["status"] == status_filter)
+        details = "\n".join(f"Line {error['line']}: {error['message']}" for error in report["errors"][:10])
+        if len(report["errors"]) > 10:
+            details += f"\n... and {len(report['errors']) - 10} more"
+        reply = QMessageBox.warning(
+            self, "Import Completed with Errors",
+            f"{summary}\n\n{len(report['errors'])} rows were not imported:\n{details}\n\nSave the failed rows to a file?",
+            QMessageBox.StandardButton.Save | QMessageBox.StandardButton.Close
+        )
+        if reply == QMessageBox.StandardButton.Save:
+            errors_path, _ = QFileDialog.getSaveFileName(self, "Save Failed Rows", "import_errors.csv", "CSV (*.csv)")
+            if errors_path:
+                write_error_report(report["errors"], errors_path)
 
-            if matches_search and matches_dept and matches_status:
-                filtered_employees.append(emp)
+    def load_employees_from_db(self):
+        """Load employees from database"""
+        self.employees = self.database.get_all_employees()
+        self.display_employees(self.employees)
+        self.update_employee_count()
 
-        self.display_employees(filtered_employees)
+    def refresh_employees(self):
+        """Reload employees from the database, dropping the cached employee directory"""
+        self.database.invalidate_employee_directory()
+        self.load_employees_from_db()
 
-        # Update count for filtered results
-        total = len(filtered_employees)
-        active = len([emp for emp in filtered_employees if emp["status"] == "Active"])
+    def update_employee_count(self):
+        """Update the employee count label for the employees passing the filters"""
+        visible = self.employee_model.visible_employees()
+        total = len(visible)
+        active = len([emp for emp in visible if emp["status"] == "Active"])
         terminated = total - active
 
         if total == len(self.employees):
-            self.update_employee_count()
+            self.employee_count_label.setText(
+                f"Showing {total} employees ({active} active, {terminated} terminated)"
+            )
         else:
             self.employee_count_label.setText(
                 f"Showing {total} of {len(self.employees)} employees ({active} active, {terminated} terminated)"
             )
 
+    def display_employees(self, employees):
+        """Display employees in the table; the current filters and sort order are kept"""
+        self.employee_model.set_employees(employees)
+
+    def filter_employees(self):
+        """Filter employees based on search criteria"""
+        self.employee_model.set_filter(
+            self.search_input.text(), self.dept_combo.currentText(), self.status_combo.currentText()
+        )
+        self.update_employee_count()
+
+    def on_employee_table_clicked(self, index):
+        """Open the action menu when the Actions cell of a row is clicked"""
+        if index.column() == EmployeeTableModel.ACTIONS_COLUMN:
+            self.show_employee_action_menu(index, self.employee_table.visualRect(index).bottomLeft())
+
+    def show_employee_action_menu(self, index, pos):
+        """Show the shared action menu for the employee of a row"""
+        if not index.isValid():
+            return
+
+        employee = self.employee_model.employee_at(index.row())
+        action = self.employee_action_menu.exec(self.employee_table.viewport().mapToGlobal(pos))
+        if action:
+            self.terminate_employee(employee, action.data())
 
     def terminate_employee(self, employee,order_type):
         """Terminate an employee"""
@@ -710,20 +788,17 @@ class MainWindow(QMainWindow):
 
     def calculate_bonuses(self, pre_calculated_results=None):
         """Calculate bonuses or display pre-calculated results"""
-        import traceback
-        print("DEBUG: calculate_bonuses called with:", pre_calculated_results)
-
         if pre_calculated_results is False:
-            print("DEBUG: pre_calculated_results is False, treating as validation failure")
+            logger.debug("pre_calculated_results is False, treating as validation failure")
             pre_calculated_results = None
 
         if pre_calculated_results is not None:
             # Display pre-calculated results
-            print("DEBUG: Displaying pre-calculated results")
+            logger.debug("Displaying %d pre-calculated results", len(pre_calculated_results))
             results = pre_calculated_results
         else:
             # Calculate bonuses normally
-            print("DEBUG: Calculating bonuses from scratch")
+            logger.debug("Calculating bonuses from scratch")
             month = self.calc_month_combo.currentIndex() + 1
             year = self.calc_year_spin.value()
             department_filter = self.calc_dept_combo.currentText()
@@ -734,57 +809,128 @@ class MainWindow(QMainWindow):
             # Check for salary changes in the selected month
             employees_with_changes = calculator.get_employees_with_salary_changes(year, month)
 
-            # DEBUG: Check what's returned
-            print(f"DEBUG: Found {len(employees_with_changes)} employees with salary changes")
-            for i, emp_data in enumerate(employees_with_changes):
-                employee = emp_data['employee']
-                changes = emp_data['changes']
-                print(
-                    f"  Employee {i + 1}: {employee['first_name']} {employee['last_name']} has {len(changes)} changes")
-                for j, change in enumerate(changes):
-                    print(f"    Change {j + 1}: {change['change_date'].strftime('%Y-%m-%d')}, "
-                          f"{change['old_salary']} -> {change['new_salary']}")
+            logger.debug("Found %d employees with salary changes", len(employees_with_changes))
+            if logger.isEnabledFor(logging.DEBUG):
+                for emp_data in employees_with_changes:
+                    employee = emp_data['employee']
+                    for change in emp_data['changes']:
+                        logger.debug("  %s %s (%s): %s, %s -> %s", employee['first_name'], employee['last_name'],
+                                     employee['id'], change['change_date'].strftime('%Y-%m-%d'),
+                                     change['old_salary'], change['new_salary'])
 
             salary_adjustments = None
-            if employees_with_changes:
-                print(f"\nDEBUG main_window: Found {len(employees_with_changes)} employees with changes")
-                for i, emp_data in enumerate(employees_with_changes):
-                    employee = emp_data['employee']
-                    changes = emp_data['changes']
-                    print(f"  Employee {i + 1}: {employee['first_name']} {employee['last_name']} ({employee['id']})")
-                    for j, change in enumerate(changes):
-                        print(
-                            f"    Change {j + 1}: {change['change_date'].strftime('%Y-%m-%d')}, {change['old_salary']} -> {change['new_salary']}")
-
-                # Show advanced salary adjustment dialog
-                dialog = AdvancedSalaryAdjustmentDialog(self, employees_with_changes, working_days)
+            if employees_with_changes and not self.review_salary_changes_check.isChecked():
+                logger.debug("Prorating %d salary changes by working days", len(employees_with_changes))
+            elif employees_with_changes:
+                # Review the precomputed proration in the advanced salary adjustment dialog
+                proration_results = calculator.prorate_salary_changes(year, month, employees_with_changes)
+                dialog = AdvancedSalaryAdjustmentDialog(self, employees_with_changes, working_days, proration_results)
                 if dialog.exec() == QDialog.DialogCode.Accepted:
                     salary_adjustments = dialog.get_adjustments()
-                    print(f"DEBUG: Got salary adjustments for {len(salary_adjustments)} employees")
+                    logger.debug("Got salary adjustments for %d employees", len(salary_adjustments))
                 else:
-                    print("DEBUG: Salary adjustment dialog cancelled")
+                    logger.debug("Salary adjustment dialog cancelled")
                     return
 
-            results = calculator.calculate_bonuses_with_validation(
-                year, month, department_filter, self, working_days, salary_adjustments
-            )
-
-            # Check for both None and False
-            if results is None or results is False:
-                print("DEBUG: Validation failed, returning early")
+            validation = calculator.validate_variable_values(year, month, department_filter)
+            if not validation["valid"]:
+                logger.debug("Validation failed, returning early")
+                QMessageBox.warning(self, "Unsaved Changes", validation["message"])
                 return
 
-        print("main_window calculate_bonuses results: ", results)
+            # The run continues in the background; results arrive through the worker's signals
+            self.start_bonus_calculation(year, month, department_filter, working_days, salary_adjustments)
+            return
 
         # Safety check - ensure results is a list
         if not isinstance(results, list):
-            print(f"ERROR main_window calculate_bonuses line 554: Expected list but got {type(results)}: {results}")
+            logger.error("calculate_bonuses expected a list of results but got %s: %r", type(results), results)
             QMessageBox.critical(self, "Error", f"Unexpected result type: {type(results)}")
             return
 
-        # Display results
-        self.results_table.setRowCount(len(results))
-        for row, result in enumerate(results):
+        # Runs calculated here report completion from on_bonus_calculation_finished
+        self.display_bonus_results(results)
+
+    def start_bonus_calculation(self, year, month, department, working_days, salary_adjustments=None):
+        """Calculate and store bonuses on a worker thread, filling the results table as employees finish"""
+        if self.bonus_worker is not None:
+            return
+
+        worker = BonusCalculationWorker(self.database, self.config_manager, year, month, department,
+                                        working_days, salary_adjustments)
+        worker.signals.progress.connect(self.on_bonus_calculation_progress)
+        worker.signals.results_ready.connect(self.append_bonus_results)
+        worker.signals.finished.connect(self.on_bonus_calculation_finished)
+        worker.signals.cancelled.connect(self.on_bonus_calculation_cancelled)
+        worker.signals.failed.connect(self.on_bonus_calculation_failed)
+        self.bonus_worker = worker
+
+        self.results_table.setRowCount(0)
+        self.outdated_results_label.setVisible(False)
+        self.calc_progress_bar.setRange(0, 0)  # Busy until the first progress report
+        self.calc_progress_bar.setVisible(True)
+        self.cancel_calculation_btn.setEnabled(True)
+        self.cancel_calculation_btn.setVisible(True)
+        self.calculate_btn.setEnabled(False)
+        self.statusBar().showMessage(f"Calculating bonuses for {department}, {month:02d}/{year}...")
+
+        QThreadPool.globalInstance().start(worker)
+
+    def cancel_bonus_calculation(self):
+        """Ask the running calculation to stop; nothing is stored for a cancelled run"""
+        if self.bonus_worker is not None:
+            self.bonus_worker.cancel()
+            self.cancel_calculation_btn.setEnabled(False)
+            self.statusBar().showMessage("Cancelling bonus calculation...")
+
+    def on_bonus_calculation_progress(self, done, total):
+        self.calc_progress_bar.setRange(0, total)
+        self.calc_progress_bar.setValue(done)
+        self.statusBar().showMessage(f"Calculated bonuses for {done} of {total} employees")
+
+    def on_bonus_calculation_finished(self, results):
+        self._end_bonus_calculation()
+
+        # The stored run also holds employees that did not need recalculating
+        self.display_bonus_results(results)
+        self.outdated_results_label.setVisible(False)
+        self.statusBar().showMessage(f"Calculated bonuses for {len(results)} employees")
+        QMessageBox.information(self, "Calculation Complete",
+                                f"Calculated bonuses for {len(results)} employees")
+
+    def on_bonus_calculation_cancelled(self):
+        self._end_bonus_calculation()
+        self.load_stored_bonuses()
+        self.statusBar().showMessage("Bonus calculation cancelled")
+
+    def on_bonus_calculation_failed(self, message):
+        self._end_bonus_calculation()
+        self.load_stored_bonuses()
+        QMessageBox.critical(self, "Error", f"Bonus calculation failed:\n{message}")
+
+    def _end_bonus_calculation(self):
+        self.bonus_worker = None
+        self.calc_progress_bar.setVisible(False)
+        self.cancel_calculation_btn.setVisible(False)
+        self.calculate_btn.setEnabled(True)
+
+    def closeEvent(self, event):
+        """Stop a running calculation before the database goes away"""
+        if self.bonus_worker is not None:
+            self.bonus_worker.cancel()
+            QThreadPool.globalInstance().waitForDone()
+        super().closeEvent(event)
+
+    def display_bonus_results(self, results):
+        """Fill the results table with bonus results"""
+        self.results_table.setRowCount(0)
+        self.append_bonus_results(results)
+
+    def append_bonus_results(self, results):
+        """Add bonus results below the rows already in the results table"""
+        first_row = self.results_table.rowCount()
+        self.results_table.setRowCount(first_row + len(results))
+        for row, result in enumerate(results, first_row):
             self.results_table.setItem(row, 0, QTableWidgetItem(result["employee_id"]))
             self.results_table.setItem(row, 1, QTableWidgetItem(result["employee_name"]))
             self.results_table.setItem(row, 2, QTableWidgetItem(result.get("department", "")))
@@ -793,10 +939,6 @@ class MainWindow(QMainWindow):
             total = result["base_salary"] + result["calculated_bonus"]
             self.results_table.setItem(row, 5, QTableWidgetItem(f"{total:,.2f}"))
 
-        if pre_calculated_results is None:
-            QMessageBox.information(self, "Calculation Complete",
-                                    f"Calculated bonuses for {len(results)} employees")
-
     # Other Menu Actions
     def open_configuration(self):
         """Open configuration management dialog"""
@@ -829,19 +971,11 @@ class MainWindow(QMainWindow):
             self.close()
 
     def calculate_actual_working_days(self, year, month):
-        """Calculate actual working days (Mon-Fri) for a given month/year"""
-
-        # Get the month's calendar
-        cal = calendar.monthcalendar(year, month)
-
-        # Count working days (Monday=0, Friday=4)
-        working_days = 0
-        for week in cal:
-            for day in week[:5]:  # Monday to Friday (0-4)
-                if day != 0:  # 0 means day is not in this month
-                    working_days += 1
+        """Calculate actual working days for a given month/year, honouring the working week and holidays"""
+        working_calendar = WorkingCalendar.from_database(self.database, self.config_manager)
 
-        return working_days
+        # The spin box takes whole days; shortened days round to the nearest day
+        return int(round(working_calendar.month_working_days(year, month)))
 
     def update_working_days(self):
         """Update working days based on selected month/year"""
@@ -867,10 +1001,9 @@ class MainWindow(QMainWindow):
         else:
             print("DEBUG: Order dialog cancelled or closed")
 
+    @instrumented("MainWindow.filter_orders")
     def filter_orders(self):
         """Filter orders based on search criteria and date range"""
-        print(f"DEBUG filter_orders: all_orders length = {len(self.all_orders) if hasattr(self, 'all_orders') else 'no attr'}")
-
         if not hasattr(self, 'all_orders') or not self.all_orders:
             # If no orders, clear the table and return
             self.orders_table.setRowCount(0)
@@ -892,9 +1025,8 @@ class MainWindow(QMainWindow):
             # Convert order_date string to datetime.date object
             try:
                 order_date = datetime.strptime(order["order_date"], "%Y-%m-%d").date()
-                print(f"DEBUG: Order {index} date: {order_date} (string: {order['order_date']})")
-            except:
-                print(f"DEBUG: Error parsing date for order {index}: {order['order_date']}, Error: {e}")
+            except (TypeError, ValueError) as e:
+                logger.debug("Error parsing date for order %d: %s, Error: %s", index, order['order_date'], e)
                 order_date = None
 
             # Date range filter
@@ -903,8 +1035,6 @@ class MainWindow(QMainWindow):
 
             # Order type filter
             if order_type_filter != "All Types" and order["order_action"] != order_type_filter:
-                print(f"DEBUG: Order {index} filtered out by type")
-
                 continue
 
             # Search text filter
@@ -922,13 +1052,11 @@ class MainWindow(QMainWindow):
                     matches = True
 
                 if not matches:
-                    print(f"DEBUG: Order {index} filtered out by search text")
                     continue
 
             filtered_orders.append(order)
-            print(f"DEBUG: Order {index} passed filters")
 
-        print(f"DEBUG: Total filtered orders: {len(filtered_orders)}")
+        logger.debug("Total filtered orders: %d", len(filtered_orders))
         self.display_orders(filtered_orders)
 
     def load_orders_from_db(self):
@@ -963,8 +1091,7 @@ class MainWindow(QMainWindow):
                 self.orders_table.setItem(row,6,QTableWidgetItem(order["new_department"]))
                 self.orders_table.setItem(row,7,QTableWidgetItem(order["new_salary"]))
 
-                # Get employee name - fetch directly from database
-                employee_name = self.get_employee_name_from_db(order["employee_id"])
+                employee_name = self.get_employee_name(order["employee_id"])
                 self.orders_table.setItem(row, 4, QTableWidgetItem(employee_name))
         else:
             # Clear the table if no orders
@@ -993,31 +1120,8 @@ class MainWindow(QMainWindow):
         self.filter_orders()
 
     def get_employee_name(self, employee_id):
-        """Get employee full name from ID"""
-        # Create a dictionary for fast lookup if not exists
-        if not hasattr(self, 'employee_name_dict'):
-            self.employee_name_dict = {}
-            for emp in self.employees:
-                self.employee_name_dict[emp["id"]] = f"{emp['first_name']} {emp['last_name']}"
-
-        return self.employee_name_dict.get(employee_id, "Unknown")
-
-    def get_employee_name_from_db(self, employee_id):
-        """Get employee name directly from database"""
-        try:
-            # Get the employee directly from database
-            employee = self.database.get_employee_by_id(employee_id)
-            if employee:
-                return f"{employee['last_name']} {employee['first_name']} {employee['father_name']}"
-            else:
-                # Try to find in current employees list as fallback
-                for emp in self.employees:
-                    if emp["id"] == employee_id:
-                        return f"{emp['first_name']} {emp['last_name']} {employee['father_name']}"
-                return "Unknown"
-        except Exception as e:
-            print(f"Error getting employee name for {employee_id}: {e}")
-            return "Unknown"
+        """Get employee full name from ID, from the shared employee directory"""
+        return self.database.get_employee_name(employee_id)
 
     def open_departments(self):
         """Show department page"""
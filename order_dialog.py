@@ -1,3 +1,4 @@
+import logging
 import sys
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
@@ -11,12 +12,15 @@ from config_manager import ConfigManager
 from database import Database
 import sqlite3
 
+logger = logging.getLogger(__name__)
+
 class OrderDialog(QDialog):
     def __init__(self, parent = None, order_data = None, config_manager = None,employee = None,order_type = None):
         super().__init__(parent)
         self.order_data = order_data
         self.order_type = order_type
-        self.database = Database()
+        # Reuse the parent's database so the dialog shares its pooled connection
+        self.database = getattr(parent, "database", None) or Database()
         self.config_manager = config_manager or ConfigManager(database=self.database)
         self.employee = employee
 
@@ -330,9 +334,9 @@ class OrderDialog(QDialog):
         if msg_box.clickedButton() == save_button:
             try:
                 # Try to save the order
-                self.save_order()
-                QMessageBox.information(self, "Success", "Order saved successfully!")
-                self.accept()  # Close the dialog only on success
+                if self.save_order():
+                    QMessageBox.information(self, "Success", "Order saved successfully!")
+                    self.accept()  # Close the dialog only on success
             except ValueError as e:
                 # This catches the "active employee exists" error
                 QMessageBox.warning(self, "Error", str(e))
@@ -403,13 +407,20 @@ class OrderDialog(QDialog):
         return "\n".join(summary)
 
     def save_order(self):
-        """Save the order to the database"""
+        """Save the order to the database, returning False if the database rejected it"""
         order_type = self.order_type_combo.currentText()
 
-        if order_type == "employment":
-            self.save_employment_order()
-        else:
-            self.save_non_employment_order(order_type)
+        # Employee changes and the order record are committed or rolled back together
+        try:
+            with self.database.transaction():
+                if order_type == "employment":
+                    self.save_employment_order()
+                else:
+                    self.save_non_employment_order(order_type)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Failed to save order: {str(e)}")
+            return False
+        return True
 
     def save_employment_order(self):
         """Save employment order and create new employee"""
@@ -546,26 +557,18 @@ class OrderDialog(QDialog):
         )
 
     def save_order_record(self, order_number, employee_id, order_date, effective_date, order_action,new_department,new_salary):
-        """Save order to the orders table"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.database.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                           INSERT INTO orders (order_number, employee_id, order_date, effective_date, order_action, new_department, new_salary)
-                           VALUES (?, ?, ?, ?, ?,?,?)
-                           """, (order_number, employee_id, order_date, effective_date, order_action, new_department, new_salary))
-
-            conn.commit()
-            print(f"DEBUG: Order saved - Number: {order_number}, Employee: {employee_id}, Action: {order_action}")
-            return True
-        except Exception as e:
-            print(f"Error saving order: {e}")
-            return False
-        finally:
-            if conn:
-                conn.close()
+        """Save order to the orders table; errors propagate so the enclosing transaction rolls back"""
+        self.database.save_order({
+            "order_number": order_number,
+            "employee_id": employee_id,
+            "order_date": order_date,
+            "effective_date": effective_date,
+            "order_action": order_action,
+            "new_department": new_department,
+            "new_salary": new_salary
+        })
+        logger.debug("Order saved - Number: %s, Employee: %s, Action: %s", order_number, employee_id, order_action)
+        return True
 
 if __name__ =="__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,162 @@
+# result_export.py
+"""Stream bonus results to CSV, XLSX or Parquet files
+
+Results come from the calculator (iter_calculated_results) or from stored runs
+(iter_stored_results) and are written chunk by chunk, so an export holds at
+most one month of results and one chunk of rows in memory. XLSX needs openpyxl
+and Parquet needs pyarrow; both are optional.
+"""
+import csv
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ["csv", "xlsx", "parquet"]
+DEFAULT_CHUNK_SIZE = 5000
+
+RESULT_FIELDS = ["period_year", "period_month", "employee_id", "employee_name", "department",
+                 "base_salary", "calculated_bonus"]
+# One row per employee and KPI; the employee columns repeat on each KPI row
+KPI_FIELDS = ["kpi_name", "kpi_calculation_method", "kpi_bonus_amount"]
+
+
+class ExportError(Exception):
+    """Raised when results cannot be exported in the requested format"""
+
+
+def export_fields(include_kpis=True):
+    return RESULT_FIELDS + KPI_FIELDS if include_kpis else list(RESULT_FIELDS)
+
+
+def iter_export_rows(results, include_kpis=True):
+    """Flatten result dicts into row tuples in export_fields order
+
+    With include_kpis every KPI of kpi_details becomes a row; an employee
+    without KPIs still gets one row with empty KPI columns.
+    """
+    for result in results:
+        row = tuple(result.get(field) for field in RESULT_FIELDS)
+        kpi_details = result.get("kpi_details") if include_kpis else None
+        if not include_kpis:
+            yield row
+        elif not kpi_details:
+            yield row + (None, None, None)
+        else:
+            for kpi in kpi_details:
+                yield row + (kpi["kpi_name"], kpi["calculation_method"], kpi["bonus_amount"])
+
+
+def iter_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Group an iterable of rows into lists of at most chunk_size rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_calculated_results(calculator, department, start, end, working_days=None):
+    """Yield freshly calculated results month by month over an inclusive (year, month) range, storing nothing"""
+    for month_result in calculator.iter_bonuses_for_range(department, start, end, working_days):
+        yield from month_result["results"]
+
+
+def iter_stored_results(database, periods, department):
+    """Yield the results of the latest stored run of each (year, month); periods without a run are skipped"""
+    for year, month in periods:
+        run = database.get_latest_bonus_run(year, month, department)
+        if run is not None:
+            yield from database.iter_bonus_run_results(run["id"])
+
+
+def detect_format(path, export_format=None):
+    """Get the export format from the argument or the file extension"""
+    export_format = export_format or os.path.splitext(path)[1].lower().lstrip(".")
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format '{export_format}', use one of: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def write_csv_rows(stream, rows, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write a header and rows to an open text stream, flushing after every chunk"""
+    writer = csv.writer(stream)
+    writer.writerow(fields)
+    count = 0
+    for chunk in iter_chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        stream.flush()
+        count += len(chunk)
+    return count
+
+
+def _write_csv(path, rows, fields, chunk_size):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        return write_csv_rows(f, rows, fields, chunk_size)
+
+
+def _write_xlsx(path, rows, fields, chunk_size):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError("XLSX export needs openpyxl (pip install openpyxl)")
+
+    # Write-only workbooks stream rows to disk instead of keeping every cell
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Bonuses")
+    sheet.append(fields)
+    count = 0
+    for chunk in iter_chunks(rows, chunk_size):
+        for row in chunk:
+            sheet.append(row)
+        count += len(chunk)
+    workbook.save(path)
+    return count
+
+
+def _write_parquet(path, rows, fields, chunk_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    types = {"period_year": pa.int32(), "period_month": pa.int32(), "base_salary": pa.float64(),
+             "calculated_bonus": pa.float64(), "kpi_bonus_amount": pa.float64()}
+    schema = pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+    # One row group per chunk
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(rows, chunk_size):
+            columns = [pa.array(column, type=schema.field(index).type)
+                       for index, column in enumerate(zip(*chunk))]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+
+def export_results(results, path, export_format=None, include_kpis=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write results (any iterable of result dicts) to a file, returning the number of rows written
+
+    The file is written under a temporary name and renamed when complete,
+    so a failed export never leaves a truncated file behind.
+    """
+    export_format = detect_format(path, export_format)
+    partial_path = f"{path}.part"
+    try:
+        count = _WRITERS[export_format](partial_path, iter_export_rows(results, include_kpis),
+                                        export_fields(include_kpis), chunk_size)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    logger.info("Exported %d rows to %s", count, path)
+    return count
@@ -1,19 +1,33 @@
+import logging
 import sys
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
     QPushButton, QMessageBox, QHeaderView, QSpinBox, QGroupBox, QComboBox
 )
 from PyQt6.QtCore import Qt
-from datetime import datetime, timedelta
+from salary_proration import SalaryProrationEngine
+
+logger = logging.getLogger(__name__)
 
 
 class AdvancedSalaryAdjustmentDialog(QDialog):
-    def __init__(self, parent=None, employees_with_changes=None, total_working_days=22):
+    def __init__(self, parent=None, employees_with_changes=None, total_working_days=22, proration_results=None):
         super().__init__(parent)
         self.employees = employees_with_changes or []  # Use passed data, default to empty list
         self.total_working_days = total_working_days
         self.adjustments = {}
 
+        # Periods and days come precomputed from the proration engine; the table only reviews and overrides them
+        self.proration_engine = SalaryProrationEngine.from_database(getattr(parent, "database", None),
+                                                                    getattr(parent, "config_manager", None))
+        self.proration = proration_results
+        if self.proration is None and self.employees:
+            self.proration = self.proration_engine.prorate_changes(
+                self.employees, self.get_year_from_employee_data(), self.get_month_from_employee_data()
+            )
+        self.proration = self.proration or {}
+        self.row_periods = []  # (employee_id, period) for every table row
+
         self.setWindowTitle("Salary Change Adjustment (Multiple Changes)")
         self.setFixedSize(1000, 600)
         self.setup_ui()
@@ -35,7 +49,8 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
         # Instructions
         info_label = QLabel(
             f"One or more employees had salary changes during this month. "
-            f"Please specify how many working days were at each salary rate.\n"
+            f"Working days at each salary rate were calculated from the working calendar; "
+            f"review them and change any that need overriding.\n"
             f"Total working days in month: {self.total_working_days}\n"
             f"Note: You can have multiple salary changes per employee."
         )
@@ -91,23 +106,19 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
         self.setLayout(layout)
 
     def populate_table(self):
-        """Populate table with actual employees and their multiple salary changes"""
+        """Populate table with the precomputed salary periods of every employee"""
         print(f"DEBUG populate_table: Starting with {len(self.employees)} employees")
 
+        self.row_periods = []
         row_count = 0
-        for emp_idx, emp_data in enumerate(self.employees):
+        for emp_data in self.employees:
             employee = emp_data['employee']
-            changes = emp_data['changes']
-
-            print(f"DEBUG: Processing employee {emp_idx + 1}: {employee['first_name']} {employee['last_name']} "
-                  f"with {len(changes)} changes")
-
-            # For each change, create a period
-            periods = self.create_periods_for_employee(employee, changes)
+            periods = self.create_periods_for_employee(employee, emp_data['changes'])
 
             # Add rows for each period
             for period_idx, period in enumerate(periods):
                 self.adjustment_table.insertRow(row_count)
+                self.row_periods.append((employee['id'], period))
 
                 # Fill employee info for EVERY row
                 self.adjustment_table.setItem(row_count, 0, QTableWidgetItem(employee['id']))
@@ -120,11 +131,7 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
                 self.adjustment_table.setItem(row_count, 3, QTableWidgetItem(str(period_idx + 1)))
 
                 # Change date (for changes) or period info
-                if 'change_date' in period:
-                    self.adjustment_table.setItem(row_count, 4,
-                                                  QTableWidgetItem(period['change_date'].strftime("%Y-%m-%d")))
-                else:
-                    self.adjustment_table.setItem(row_count, 4, QTableWidgetItem("Initial"))
+                self.adjustment_table.setItem(row_count, 4, QTableWidgetItem(period.get('change_date', "Initial")))
 
                 # Salary rate
                 self.adjustment_table.setItem(row_count, 5, QTableWidgetItem(f"${period['salary']:,.2f}"))
@@ -132,23 +139,13 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
                 # Days at this rate (spin box)
                 days_spin = QSpinBox()
                 days_spin.setRange(0, self.total_working_days)
-                days_spin.setValue(period.get('days', 0))
+                days_spin.setValue(self._period_days(period))
                 days_spin.valueChanged.connect(self.validate_and_update)
                 self.adjustment_table.setCellWidget(row_count, 6, days_spin)
 
-                # Store employee info in the spinbox
-                days_spin.setProperty('employee_id', employee['id'])
-                days_spin.setProperty('employee_name', f"{employee['first_name']} {employee['last_name']}")
-                days_spin.setProperty('period_idx', period_idx)
-
                 # From date and To date
-                from_date_str = period.get('from_date', '').strftime("%Y-%m-%d") if period.get('from_date') else ""
-                to_date_str = period.get('to_date', '').strftime("%Y-%m-%d") if period.get('to_date') else ""
-                self.adjustment_table.setItem(row_count, 7, QTableWidgetItem(from_date_str))
-                self.adjustment_table.setItem(row_count, 8, QTableWidgetItem(to_date_str))
-
-                print(f"DEBUG: Added row {row_count} for {employee['first_name']}, Period {period_idx + 1}, "
-                      f"${period['salary']:,.2f}, {period.get('days', 0)} days")
+                self.adjustment_table.setItem(row_count, 7, QTableWidgetItem(period['from_date']))
+                self.adjustment_table.setItem(row_count, 8, QTableWidgetItem(period['to_date']))
 
                 row_count += 1
 
@@ -156,92 +153,34 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
         self.validate_and_update()
 
     def create_periods_for_employee(self, employee, changes):
-        """Create salary periods for an employee with multiple changes"""
-        periods = []
+        """Get the salary periods of an employee from the precomputed proration"""
+        adjustment = self.proration.get(employee['id'])
+        return adjustment['periods'] if adjustment else []
 
-        if not changes or len(changes) == 0:
-            return periods
-
-        # Get month/year from first change
-        first_change_date = changes[0]['change_date']
-        month = first_change_date.month
-        year = first_change_date.year
-
-        print(
-            f"\nDEBUG create_periods: Processing {employee['first_name']} for {month}/{year} with {len(changes)} changes")
-
-        # Calculate month boundaries
-        first_day = datetime(year, month, 1)
-        if month == 12:
-            last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-
-        print(f"  Month boundaries: {first_day.strftime('%Y-%m-%d')} to {last_day.strftime('%Y-%m-%d')}")
-        print(f"  Total days in month: {(last_day - first_day).days + 1}")
-
-        # Sort changes by date
-        changes.sort(key=lambda x: x['change_date'])
-
-        # Handle initial period (before first change)
-        first_change = changes[0]
-        initial_from = first_day
-        initial_to = first_change['change_date'] - timedelta(days=1)
-        initial_days = self.calculate_working_days(initial_from, initial_to)
-
-        if initial_days > 0:
-            periods.append({
-                'salary': first_change['old_salary'],
-                'from_date': initial_from,
-                'to_date': initial_to,
-                'days': initial_days
-            })
-            print(
-                f"  Initial period: ${first_change['old_salary']:,.2f} from {initial_from.strftime('%Y-%m-%d')} to {initial_to.strftime('%Y-%m-%d')} = {initial_days} working days")
-
-        # Add periods for each change
-        for i, change in enumerate(changes):
-            from_date = change['change_date']
-
-            # Determine to_date
-            if i < len(changes) - 1:
-                # Next change is the to_date
-                next_change = changes[i + 1]
-                to_date = next_change['change_date'] - timedelta(days=1)
-            else:
-                # Last change goes to end of month
-                to_date = last_day
-
-            period_days = self.calculate_working_days(from_date, to_date)
-            if period_days > 0:
-                periods.append({
-                    'salary': change['new_salary'],
-                    'change_date': change['change_date'],
-                    'from_date': from_date,
-                    'to_date': to_date,
-                    'days': period_days
-                })
-                print(
-                    f"  Change {i + 1}: ${change['new_salary']:,.2f} from {from_date.strftime('%Y-%m-%d')} to {to_date.strftime('%Y-%m-%d')} = {period_days} working days")
-
-        # If no periods created (shouldn't happen), create one period for the whole month
-        if not periods:
-            total_days = self.calculate_working_days(first_day, last_day)
-            periods.append({
-                'salary': employee['salary'],
-                'from_date': first_day,
-                'to_date': last_day,
-                'days': total_days
-            })
-            print(f"  Single period: ${employee['salary']:,.2f} for {total_days} days")
+    def _period_days(self, period):
+        """Working days of a period as shown in the table; shortened days round to whole days"""
+        return int(round(period['days']))
 
-        print(f"  Total periods: {len(periods)}")
+    def _collect_employee_days(self):
+        """Get {employee_id: (name, days allocated, unchanged)} from the table
 
-        # Calculate total working days
-        total_working_days = sum(p['days'] for p in periods)
-        print(f"  Total working days in all periods: {total_working_days}")
+        unchanged is True while every period still has its calculated days.
+        """
+        employee_days = {}
+        for row, (emp_id, period) in enumerate(self.row_periods):
+            days_spin = self.adjustment_table.cellWidget(row, 6)
+            if not days_spin:
+                continue
 
-        return periods
+            name, total_days, unchanged = employee_days.get(
+                emp_id, (self.proration[emp_id]['employee_name'], 0, True)
+            )
+            employee_days[emp_id] = (
+                name,
+                total_days + days_spin.value(),
+                unchanged and days_spin.value() == self._period_days(period)
+            )
+        return employee_days
 
     def calculate_working_days(self, from_date, to_date):
         """Calculate exact working days between two dates (inclusive)"""
@@ -249,24 +188,8 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
             print(f"  ERROR: Invalid dates - from_date: {from_date}, to_date: {to_date}")
             return 0
 
-        # Calculate exact working days (Monday-Friday)
-        total_calendar_days = (to_date - from_date).days + 1
-
-        # Count each day, check if it's a weekend (Monday=0, Sunday=6)
-        working_days = 0
-        weekend_days = 0
-        for i in range(total_calendar_days):
-            current_date = from_date + timedelta(days=i)
-            # Monday=0, Friday=4, Saturday=5, Sunday=6
-            if current_date.weekday() < 5:  # Monday to Friday
-                working_days += 1
-            else:
-                weekend_days += 1
-
-        print(
-            f"    {from_date.strftime('%Y-%m-%d')} to {to_date.strftime('%Y-%m-%d')}: {total_calendar_days} calendar days, {working_days} working days, {weekend_days} weekend days")
-
-        return working_days
+        # Working week and holidays come from the shared calendar; the table shows whole days
+        return int(round(self.proration_engine.working_calendar.count(from_date, to_date)))
 
     def validate_and_update(self):
         """Validate days allocation and update summary"""
@@ -275,46 +198,24 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
 
     def update_summary(self):
         """Update the summary label"""
-        employee_totals = {}
-        employee_names = {}
-
-        # Collect data from ALL rows
-        for row in range(self.adjustment_table.rowCount()):
-            # Get employee ID from column 0
-            emp_id_item = self.adjustment_table.item(row, 0)
-            # Get employee name from column 1
-            name_item = self.adjustment_table.item(row, 1)
-            # Get days spinbox from column 6
-            days_spin = self.adjustment_table.cellWidget(row, 6)
-
-            # Check if all data is present
-            if emp_id_item and name_item and days_spin:
-                emp_id = emp_id_item.text()
-                emp_name = name_item.text()
-
-                if emp_id and emp_name:
-                    if emp_id not in employee_totals:
-                        employee_totals[emp_id] = 0
-                        employee_names[emp_id] = emp_name
-
-                    employee_totals[emp_id] += days_spin.value()
+        employee_days = self._collect_employee_days()
 
         # Build summary text
-        if employee_totals:
+        all_valid = True
+        if employee_days:
             summary_text = "Days allocated per employee:\n"
-            all_valid = True
 
-            for emp_id, total_days in employee_totals.items():
-                status = "✓" if total_days == self.total_working_days else "✗"
-                if total_days != self.total_working_days:
+            for emp_name, total_days, unchanged in employee_days.values():
+                is_valid = unchanged or total_days == self.total_working_days
+                status = "✓" if is_valid else "✗"
+                if not is_valid:
                     all_valid = False
 
-                emp_name = employee_names.get(emp_id, emp_id)
                 summary_text += f"  {emp_name}: {total_days}/{self.total_working_days} days {status}\n"
 
             # Add overall status
             if all_valid:
-                summary_text += f"\n✅ All employees have exactly {self.total_working_days} days allocated."
+                summary_text += f"\n✅ All employees have their working days allocated."
             else:
                 summary_text += f"\n⚠️ Some employees don't have {self.total_working_days} days allocated."
         else:
@@ -324,37 +225,16 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
         return all_valid
 
     def validate_days(self):
-        """Validate that days sum equals total working days for each employee"""
-        employee_totals = {}
-        employee_names = {}
-        invalid_employees = []
+        """Validate that overridden days sum to the total working days for each employee
 
-        # Collect data from ALL rows
-        for row in range(self.adjustment_table.rowCount()):
-            # Get employee ID from column 0
-            emp_id_item = self.adjustment_table.item(row, 0)
-            # Get employee name from column 1
-            name_item = self.adjustment_table.item(row, 1)
-            # Get days spinbox from column 6
-            days_spin = self.adjustment_table.cellWidget(row, 6)
-
-            # Check if all data is present
-            if emp_id_item and name_item and days_spin:
-                emp_id = emp_id_item.text()
-                emp_name = name_item.text()
-
-                if emp_id and emp_name:
-                    if emp_id not in employee_totals:
-                        employee_totals[emp_id] = 0
-                        employee_names[emp_id] = emp_name
-
-                    employee_totals[emp_id] += days_spin.value()
-
-        # Check each employee
-        for emp_id, total_days in employee_totals.items():
-            if total_days != self.total_working_days:
-                emp_name = employee_names.get(emp_id, emp_id)
-                invalid_employees.append(f"{emp_name}: {total_days} days (should be {self.total_working_days})")
+        Calculated days are valid as they are, even when shortened days make
+        the rounded periods differ from the monthly total.
+        """
+        invalid_employees = [
+            f"{emp_name}: {total_days} days (should be {self.total_working_days})"
+            for emp_name, total_days, unchanged in self._collect_employee_days().values()
+            if not unchanged and total_days != self.total_working_days
+        ]
 
         if invalid_employees:
             self.validation_label.setText(
@@ -363,107 +243,58 @@ class AdvancedSalaryAdjustmentDialog(QDialog):
             )
             return False
         else:
-            self.validation_label.setText(f"✅ All employees have exactly {self.total_working_days} days allocated.")
+            self.validation_label.setText("✅ All employees have their working days allocated.")
             return True
 
     def auto_calculate_days(self):
-        """Automatically calculate days based on change dates"""
-        # Create a mapping of employee data by ID
-        employee_data_by_id = {}
-        for emp_data in self.employees:
-            employee = emp_data['employee']
-            employee_data_by_id[employee['id']] = emp_data
-
-        # For each row, recalculate based on the employee's changes
-        for row in range(self.adjustment_table.rowCount()):
-            emp_id_item = self.adjustment_table.item(row, 0)
-            if not emp_id_item:
-                continue
-
-            employee_id = emp_id_item.text()
-
-            if employee_id in employee_data_by_id:
-                emp_data = employee_data_by_id[employee_id]
-                employee = emp_data['employee']
-                changes = emp_data['changes']
-
-                periods = self.create_periods_for_employee(employee, changes)
-
-                # Get period index from column 3
-                period_item = self.adjustment_table.item(row, 3)
-                if period_item:
-                    try:
-                        period_idx = int(period_item.text()) - 1
-                        if period_idx < len(periods):
-                            days_spin = self.adjustment_table.cellWidget(row, 6)
-                            if days_spin:
-                                days_spin.setValue(periods[period_idx].get('days', 0))
-                    except ValueError:
-                        continue
+        """Reset every row to the working days calculated from the calendar"""
+        for row, (_, period) in enumerate(self.row_periods):
+            days_spin = self.adjustment_table.cellWidget(row, 6)
+            if days_spin:
+                days_spin.blockSignals(True)
+                days_spin.setValue(self._period_days(period))
+                days_spin.blockSignals(False)
 
         self.validate_and_update()
 
     def calculate_proportional_salaries(self):
-        """Calculate proportional salaries based on working days"""
+        """Calculate proportional salaries, keeping the precomputed result where no days were overridden"""
         if not self.validate_days():
             QMessageBox.warning(self, "Validation Error",
                                 f"Please ensure days sum to {self.total_working_days} for all employees.")
             return
 
         self.adjustments = {}
-        employee_periods = {}
-        employee_names = {}
+        employee_days = self._collect_employee_days()
 
-        # Collect all periods for each employee
-        for row in range(self.adjustment_table.rowCount()):
-            emp_id_item = self.adjustment_table.item(row, 0)
-            name_item = self.adjustment_table.item(row, 1)
-            salary_item = self.adjustment_table.item(row, 5)
+        # Overridden days are read from the spin boxes; salaries come from the periods, not the cell text
+        employee_periods = {}
+        for row, (emp_id, period) in enumerate(self.row_periods):
             days_spin = self.adjustment_table.cellWidget(row, 6)
+            employee_periods.setdefault(emp_id, []).append({
+                'salary': period['salary'],
+                'days': days_spin.value() if days_spin else 0
+            })
 
-            if not emp_id_item or not name_item or not salary_item or not days_spin:
-                continue
-
-            emp_id = emp_id_item.text()
-            emp_name = name_item.text()
-            salary_str = salary_item.text().replace('$', '').replace(',', '')
-
-            try:
-                salary = float(salary_str) if salary_str else 0
-                days = days_spin.value()
-
-                if emp_id not in employee_periods:
-                    employee_periods[emp_id] = []
-                    employee_names[emp_id] = emp_name
-
-                employee_periods[emp_id].append({
-                    'salary': salary,
-                    'days': days
-                })
-            except ValueError:
-                continue
-
-        # Calculate proportional salary for each employee
         for emp_id, periods in employee_periods.items():
-            total_weighted = 0
-            total_days = 0
+            emp_name, _, unchanged = employee_days[emp_id]
+            if unchanged:
+                self.adjustments[emp_id] = self.proration[emp_id]
+                continue
 
-            for period in periods:
-                total_weighted += period['salary'] * period['days']
-                total_days += period['days']
+            total_weighted = sum(period['salary'] * period['days'] for period in periods)
+            total_days = sum(period['days'] for period in periods)
 
             if total_days > 0:
-                proportional_salary = total_weighted / total_days
-
                 self.adjustments[emp_id] = {
-                    'proportional_salary': proportional_salary,
-                    'employee_name': employee_names[emp_id],
+                    'proportional_salary': total_weighted / total_days,
+                    'employee_name': emp_name,
                     'periods': periods,
                     'total_days': total_days,
                     'total_weighted': total_weighted
                 }
-                print(
-                    f"DEBUG: Calculated proportional salary for {employee_names[emp_id]}: ${proportional_salary:,.2f}")
+                logger.debug("Overridden proportional salary for %s: $%.2f", emp_name,
+                             self.adjustments[emp_id]['proportional_salary'])
 
         if self.adjustments:
             self.accept()
@@ -0,0 +1,92 @@
+# salary_proration.py
+from datetime import date, timedelta
+
+from working_calendar import WorkingCalendar
+
+
+class SalaryProrationEngine:
+    """Prorates salaries of employees whose salary changed during a month
+
+    Every salary record overlapping the month becomes a period that lasts until
+    the next change. Each period is weighted by its working days on the working
+    calendar. The working days of all employees are counted in one batched
+    calendar call. No widgets are involved,
+    so the same results drive the calculator, the review dialog and scripts.
+    """
+
+    def __init__(self, working_calendar=None):
+        self.working_calendar = working_calendar or WorkingCalendar()
+
+    @classmethod
+    def from_database(cls, database=None, config_manager=None):
+        """Build the engine on the configured working calendar"""
+        return cls(WorkingCalendar.from_database(database, config_manager))
+
+    def prorate(self, employee_histories, year, month):
+        """Prorate (employee, salary_history) pairs for a month
+
+        Returns {employee_id: adjustment} in the format of the salary adjustment
+        dialog: proportional_salary, employee_name, periods, total_days and
+        total_weighted. Each period has salary, from_date, to_date (YYYY-MM-DD)
+        and days. A period that starts inside the month also has change_date.
+        Employees without working days in the month keep their current salary.
+        """
+        first_day, last_day = self.working_calendar.month_bounds(year, month)
+        first_day, last_day = first_day.isoformat(), last_day.isoformat()
+
+        # One (start, end) range per salary period overlapping the month
+        employee_periods = []
+        ranges = []
+        for employee, salary_history in employee_histories:
+            # The order dialog rewrites the history on every save, so records can repeat
+            records = {}
+            for salary_record in salary_history:
+                records.setdefault((salary_record["salary"], salary_record["effective_date"][:10]), salary_record)
+            records = sorted(records.values(), key=lambda record: record["effective_date"][:10])
+
+            periods = []
+            for i, salary_record in enumerate(records):
+                effective_date = salary_record["effective_date"][:10]
+                period_start = max(effective_date, first_day)
+                # A period ends the day before the next change, and never after its own end date
+                period_end = min((salary_record["end_date"] or last_day)[:10], last_day)
+                if i + 1 < len(records):
+                    next_change = date.fromisoformat(records[i + 1]["effective_date"][:10]) - timedelta(days=1)
+                    period_end = min(period_end, next_change.isoformat())
+                if period_start > period_end:
+                    continue
+
+                period = {"salary": salary_record["salary"], "from_date": period_start, "to_date": period_end}
+                if effective_date > first_day:
+                    period["change_date"] = effective_date
+                periods.append(period)
+                ranges.append((period_start, period_end))
+            employee_periods.append((employee, periods))
+
+        period_days = iter(self.working_calendar.count_many(ranges))
+
+        adjustments = {}
+        for employee, periods in employee_periods:
+            total_weighted = 0
+            total_days = 0
+            for period in periods:
+                period["days"] = next(period_days)
+                total_weighted += period["salary"] * period["days"]
+                total_days += period["days"]
+
+            adjustments[employee["id"]] = {
+                "proportional_salary": total_weighted / total_days if total_days > 0 else employee["salary"],
+                "employee_name": f"{employee['first_name']} {employee['last_name']}",
+                "periods": periods,
+                "total_days": total_days,
+                "total_weighted": total_weighted
+            }
+
+        return adjustments
+
+    def prorate_changes(self, employees_with_changes, year, month):
+        """Prorate the output of BonusCalculator.get_employees_with_salary_changes"""
+        return self.prorate(
+            [(emp_data["employee"], emp_data["salary_history"]) for emp_data in employees_with_changes],
+            year, month
+        )
@@ -0,0 +1,25 @@
+# salary_proration_test.py
+import pytest
+
+from salary_proration import SalaryProrationEngine
+from working_calendar import WorkingCalendar
+
+
+def test_overlapping_and_repeated_records_are_counted_once():
+    employee = {"id": "1", "first_name": "Ann", "last_name": "Lee", "salary": 6000}
+    # Open records written again by the order dialog, and a record ending on the day the next one starts
+    salary_history = [
+        {"salary": 3000, "effective_date": "2024-01-02", "end_date": "2024-03-15"},
+        {"salary": 6000, "effective_date": "2024-03-15", "end_date": None},
+        {"salary": 3000, "effective_date": "2024-01-02", "end_date": None},
+        {"salary": 6000, "effective_date": "2024-03-15", "end_date": None},
+    ]
+
+    adjustment = SalaryProrationEngine(WorkingCalendar()).prorate([(employee, salary_history)], 2024, 3)["1"]
+
+    assert [(period["from_date"], period["to_date"], period["days"]) for period in adjustment["periods"]] == [
+        ("2024-03-01", "2024-03-14", 10),
+        ("2024-03-15", "2024-03-31", 11),
+    ]
+    assert adjustment["total_days"] == 21
+    assert adjustment["proportional_salary"] == pytest.approx((10 * 3000 + 11 * 6000) / 21)
@@ -0,0 +1,196 @@
+# synthetic_data.py
+"""Generate a bonus_system.db of a chosen size for benchmarks and load tests:
+
+    python synthetic_data.py --db bench.db --employees 20000 --departments 20 --months 12
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from database import Database
+
+# Custom variables every generated database gets, as (name, data type, default value)
+VARIABLE_TEMPLATES = [
+    ("sales_amount", "currency", "1000"),
+    ("rating", "number", "3"),
+    ("attendance_rate", "percentage", "0.95"),
+    ("projects_done", "number", "2"),
+    ("overtime_hours", "number", "0"),
+    ("customer_score", "number", "4"),
+]
+
+# Formula shapes; {a} and {b} are replaced by generated variable names
+FORMULA_TEMPLATES = [
+    "base_salary * 0.05 + {a} * 0.01",
+    "{a} * 100 then {a} > 3 else 0",
+    "min(base_salary, 5000) * 0.02 + {b}",
+    "max({a}, {b}) * 10",
+    "round(base_salary * {a} / 100)",
+]
+
+
+def generate_database(db_path, employees=1000, departments=10, kpis=12, variables=6, months=12, year=2024,
+                      salary_change_rate=0.1, orders_per_employee=1, kpi_mix=(0.25, 0.25, 0.5), seed=42,
+                      config_path=None):
+    """Create a database filled with synthetic data, returning a summary of what was generated
+
+    kpi_mix is the share of percentage, fixed and formula KPIs. salary_change_rate
+    is the share of employees with a raise in each month. The departments
+    are written to config_path (default: config.json next to the database),
+    so the application and the benchmarks see them.
+    """
+    random.seed(seed)
+    started = time.perf_counter()
+
+    if os.path.exists(db_path):
+        raise FileExistsError(f"'{db_path}' already exists; generate into a new file")
+    database = Database(db_path)
+
+    department_names = [f"Department {d + 1:02d}" for d in range(departments)]
+    config_path = config_path or os.path.join(os.path.dirname(os.path.abspath(db_path)), "config.json")
+    with open(config_path, "w") as f:
+        json.dump({"departments": {name: "active" for name in department_names}, "kpis": []}, f, indent=2)
+
+    variable_names = []
+    with database.transaction():
+        for index in range(variables):
+            name, data_type, default_value = VARIABLE_TEMPLATES[index % len(VARIABLE_TEMPLATES)]
+            if index >= len(VARIABLE_TEMPLATES):
+                name = f"{name}_{index // len(VARIABLE_TEMPLATES)}"
+            variable_names.append(name)
+            database.save_custom_variable({"name": name, "display_name": name.replace("_", " ").title(),
+                                           "data_type": data_type, "default_value": default_value})
+
+        percentage_share, fixed_share, _ = kpi_mix
+        for index in range(kpis):
+            draw = random.random()
+            kpi = {
+                "name": f"KPI {index + 1:03d}",
+                # Every third KPI applies to all departments, the others to a few
+                "applicable_departments": [] if index % 3 == 0 else random.sample(department_names,
+                                                                                  min(3, departments)),
+            }
+            if draw < percentage_share:
+                kpi["calculation_method"] = "percentage"
+            elif draw < percentage_share + fixed_share:
+                kpi["calculation_method"] = "fixed"
+            else:
+                kpi["calculation_method"] = "formula"
+                kpi["formula"] = random.choice(FORMULA_TEMPLATES).format(
+                    a=random.choice(variable_names) if variable_names else "base_salary",
+                    b=random.choice(variable_names) if variable_names else "base_salary"
+                )
+            database.save_kpi(kpi)
+
+    # Raises take effect mid-month, so they go through proration
+    first_day = date(year, 1, 1)
+    salary_changes = 0
+    order_count = 0
+    with database.transaction():
+        for index in range(employees):
+            employee_id = f"EMP{index + 1:06d}"
+            department = department_names[index % departments]
+            salary = float(random.randrange(2000, 12000, 50))
+            hire_date = first_day - timedelta(days=random.randint(30, 3650))
+
+            salary_history = []
+            effective_date = hire_date
+            for month in range(1, months + 1):
+                if random.random() >= salary_change_rate:
+                    continue
+                change_date = date(year, month, random.randint(2, 28))
+                salary_history.append({"salary": salary, "effective_date": effective_date.isoformat(),
+                                       "end_date": (change_date - timedelta(days=1)).isoformat()})
+                salary = round(salary * random.uniform(1.02, 1.15), 2)
+                effective_date = change_date
+                salary_changes += 1
+            salary_history.append({"salary": salary, "effective_date": effective_date.isoformat(), "end_date": None})
+
+            database.save_employee({
+                "id": employee_id,
+                "first_name": f"First{index + 1}",
+                "last_name": f"Last{index + 1}",
+                "father_name": f"Father{index % 97}",
+                "hire_date": hire_date.isoformat(),
+                "department": department,
+                "salary": salary,
+                "status": "Active" if random.random() > 0.05 else "Terminated",
+                "salary_history": salary_history,
+                "department_history": [{"department": department, "effective_date": hire_date.isoformat(),
+                                        "end_date": None}],
+            })
+
+            for order_index in range(orders_per_employee):
+                if order_index == 0:
+                    order_date, action = hire_date, "employment"
+                else:
+                    order_date = first_day + timedelta(days=random.randint(0, 364))
+                    action = random.choice(["salary change", "department change"])
+                database.save_order({
+                    "order_number": f"ORD-{index + 1:06d}-{order_index + 1}",
+                    "employee_id": employee_id,
+                    "order_date": order_date.isoformat(),
+                    "effective_date": order_date.isoformat(),
+                    "order_action": action,
+                    "new_department": department,
+                    "new_salary": str(salary),
+                })
+                order_count += 1
+
+    employee_ids = [f"EMP{index + 1:06d}" for index in range(employees)]
+    value_count = 0
+    for month in range(1, months + 1):
+        values = [
+            {"employee_id": employee_id, "variable_name": name, "value": round(random.uniform(0, 10), 2)}
+            for employee_id in employee_ids for name in variable_names
+        ]
+        database.save_period_variable_values(year, month, values)
+        value_count += len(values)
+
+    database.close()
+    return {
+        "db_path": db_path,
+        "config_path": config_path,
+        "employees": employees,
+        "departments": departments,
+        "kpis": kpis,
+        "variables": variables,
+        "months": months,
+        "year": year,
+        "variable_values": value_count,
+        "salary_changes": salary_changes,
+        "orders": order_count,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic bonus system database")
+    parser.add_argument("--db", default="bonus_system.db", help="Database file to create")
+    parser.add_argument("--config", help="Configuration file to write (default: config.json next to the database)")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--kpis", type=int, default=12)
+    parser.add_argument("--variables", type=int, default=6)
+    parser.add_argument("--months", type=int, default=12, help="Months of variable values and salary changes")
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--salary-change-rate", type=float, default=0.1,
+                        help="Share of employees with a raise in each month")
+    parser.add_argument("--orders-per-employee", type=int, default=1)
+    parser.add_argument("--kpi-mix", type=float, nargs=3, default=(0.25, 0.25, 0.5),
+                        metavar=("PERCENTAGE", "FIXED", "FORMULA"), help="Share of each KPI calculation method")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    summary = generate_database(
+        args.db, args.employees, args.departments, args.kpis, args.variables, args.months, args.year,
+        args.salary_change_rate, args.orders_per_employee, tuple(args.kpi_mix), args.seed, args.config
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# value_parsing.py
+"""Parse typed or imported variable values into the form they are stored in"""
+
+
+def parse_value_for_storage(input_text, data_type, strict=False):
+    """Parse entered text for storage based on the variable's data type
+
+    Percentages are stored as decimals: "50%" and "50" become 0.5, "0.5" stays
+    0.5. Currency may have $ and thousands separators. Blank or invalid numbers
+    are stored as "0", unless strict is set, when invalid numbers raise ValueError.
+    """
+    input_text = str(input_text).strip()
+
+    if not input_text:
+        # Return empty string for text, "0" for numeric types
+        if data_type == 'text':
+            return ''
+        else:
+            return '0'
+
+    if data_type == 'percentage':
+        # Remove % sign if present
+        clean_text = input_text.replace('%', '')
+        try:
+            float_val = float(clean_text)
+
+            # Check if input had % sign
+            had_percent_sign = '%' in input_text
+
+            if had_percent_sign:
+                # User entered with % sign (e.g., "0.5%" or "50%")
+                # Convert to decimal: 0.5% → 0.005, 50% → 0.5
+                return str(float_val / 100.0)
+            else:
+                # User entered without % sign
+                # If value <= 1, assume it's already decimal (0.5 → 0.5)
+                # If value > 1, assume it's percentage (85 → 0.85)
+                if float_val > 1.0:
+                    return str(float_val / 100.0)
+                else:
+                    return str(float_val)
+        except ValueError:
+            if strict:
+                raise
+            return '0'
+
+    elif data_type == 'currency':
+        # Remove $ and commas
+        clean_text = input_text.replace('$', '').replace(',', '')
+        try:
+            float_val = float(clean_text)
+            return str(float_val)
+        except ValueError:
+            if strict:
+                raise
+            return '0'
+
+    elif data_type == 'number':
+        try:
+            float_val = float(input_text)
+            return str(float_val)
+        except ValueError:
+            if strict:
+                raise
+            return '0'
+
+    else:  # text
+        return input_text
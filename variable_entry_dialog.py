@@ -9,6 +9,8 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QDoubleValidator, QValidator
 from datetime import datetime
 from bonus_calculator import BonusCalculator
+from formula_compiler import get_variable_dependency_index
+from value_parsing import parse_value_for_storage
 import math
 
 
@@ -160,13 +162,16 @@ class VariableEntryDialog(QDialog):
             self.employee_applicable_variables = {}
             kpis = self.config_manager.get_kpis()
 
+            # Every employee of a department needs the same variables
+            department_variables = {}
             for employee in self.employees:
                 # Apply department filter
                 if self.selected_department != "All Departments" and employee['department'] != self.selected_department:
                     continue
 
-                applicable_vars = self.get_applicable_variables_for_employee(employee, kpis)
-                self.employee_applicable_variables[employee['id']] = applicable_vars
+                if employee['department'] not in department_variables:
+                    department_variables[employee['department']] = self.get_applicable_variables_for_employee(employee, kpis)
+                self.employee_applicable_variables[employee['id']] = department_variables[employee['department']]
 
             # Setup table
             self.setup_variables_table(month, year)
@@ -178,20 +183,9 @@ class VariableEntryDialog(QDialog):
 
     def get_applicable_variables_for_employee(self, employee, kpis):
         """Get variables used in KPIs applicable to this employee"""
-        applicable_vars = {}
-
-        for kpi in kpis:
-            # Check if KPI applies to employee's department
-            applicable_depts = kpi.get('applicable_departments', [])
-            if not applicable_depts or employee['department'] in applicable_depts:
-                # Check which variables are used in this KPI's formula
-                formula = kpi.get('formula', '')
-                for var in self.custom_variables:
-                    var_name = var['name']
-                    if var_name in formula:
-                        applicable_vars[var_name] = var  # Store the whole variable object
-
-        return applicable_vars
+        index = get_variable_dependency_index(kpis, self.custom_variables)
+        var_names = index.variables_for_department(employee['department'])
+        return {var['name']: var for var in self.custom_variables if var['name'] in var_names}
 
     def setup_variables_table(self, month, year):
         """Setup the variables entry table"""
@@ -212,6 +206,10 @@ class VariableEntryDialog(QDialog):
             f"Showing {total_employees} employees from {self.selected_department}"
         )
 
+        # Load the saved values of the whole grid in one query
+        department = None if self.selected_department == "All Departments" else self.selected_department
+        period_values = self.database.get_period_variable_values(year, month, department=department)
+
         # Get all unique variables used by any employee in the filtered list
         all_variables = {}
         for employee_id, vars_dict in self.employee_applicable_variables.items():
@@ -296,10 +294,8 @@ class VariableEntryDialog(QDialog):
                         line_edit.setValidator(validator)
                     # For text type, no validator needed
 
-                    # Load existing value from database
-                    existing_value = self.database.get_employee_variable_value(
-                        employee['id'], var_name, year, month
-                    )
+                    # Existing value saved for the period
+                    existing_value = period_values.get(employee['id'], {}).get(var_name)
 
                     if existing_value is not None:
                         # Format the saved value for display
@@ -365,57 +361,7 @@ class VariableEntryDialog(QDialog):
 
     def parse_input_for_storage(self, input_text, data_type):
         """Parse input text for storage based on data type"""
-        input_text = str(input_text).strip()
-
-        if not input_text:
-            # Return empty string for text, "0" for numeric types
-            if data_type == 'text':
-                return ''
-            else:
-                return '0'
-
-        if data_type == 'percentage':
-            # Remove % sign if present
-            clean_text = input_text.replace('%', '')
-            try:
-                float_val = float(clean_text)
-
-                # Check if input had % sign
-                had_percent_sign = '%' in input_text
-
-                if had_percent_sign:
-                    # User entered with % sign (e.g., "0.5%" or "50%")
-                    # Convert to decimal: 0.5% → 0.005, 50% → 0.5
-                    return str(float_val / 100.0)
-                else:
-                    # User entered without % sign
-                    # If value <= 1, assume it's already decimal (0.5 → 0.5)
-                    # If value > 1, assume it's percentage (85 → 0.85)
-                    if float_val > 1.0:
-                        return str(float_val / 100.0)
-                    else:
-                        return str(float_val)
-            except ValueError:
-                return '0'
-
-        elif data_type == 'currency':
-            # Remove $ and commas
-            clean_text = input_text.replace('$', '').replace(',', '')
-            try:
-                float_val = float(clean_text)
-                return str(float_val)
-            except ValueError:
-                return '0'
-
-        elif data_type == 'number':
-            try:
-                float_val = float(input_text)
-                return str(float_val)
-            except ValueError:
-                return '0'
-
-        else:  # text
-            return input_text
+        return parse_value_for_storage(input_text, data_type)
 
     def save_all_values(self):
         """Save all variable values"""
@@ -423,7 +369,8 @@ class VariableEntryDialog(QDialog):
             month = self.month_combo.currentIndex() + 1
             year = self.year_spin.value()
 
-            saved_count = 0
+            values = []
+            cells = []
 
             for row in range(self.variables_table.rowCount()):
                 employee_id_item = self.variables_table.item(row, 0)
@@ -442,24 +389,24 @@ class VariableEntryDialog(QDialog):
                             input_text = widget.text()
                             value_for_storage = self.parse_input_for_storage(input_text, data_type)
 
-                            # Save to database
-                            value_data = {
+                            values.append({
                                 "employee_id": employee_id,
                                 "variable_name": var_name,
-                                "period_year": year,
-                                "period_month": month,
                                 "value": value_for_storage
-                            }
+                            })
+                            cells.append((widget, value_for_storage, data_type))
 
-                            if self.database.save_employee_variable_value(value_data):
-                                saved_count += 1
+            # Save the whole grid in one transaction - all values are stored or none
+            statuses = self.database.save_period_variable_values(year, month, values)
 
-                                # Update display to show formatted value
-                                display_value = self.format_value_for_display(value_for_storage, data_type)
-                                widget.setText(display_value)
+            # Update display to show formatted values
+            for widget, value_for_storage, data_type in cells:
+                widget.setText(self.format_value_for_display(value_for_storage, data_type))
 
+            saved_count = sum(1 for status in statuses if status != "unchanged")
             QMessageBox.information(self, "Success",
-                                    f"Saved {saved_count} variable values for {self.variables_table.rowCount()} employees!")
+                                    f"Saved {saved_count} changed variable values for {self.variables_table.rowCount()} employees!\n"
+                                    f"{len(statuses) - saved_count} values were unchanged.")
 
             # Reload to show updated values
             self.load_data()
@@ -489,10 +436,12 @@ class VariableEntryDialog(QDialog):
         department = self.dept_combo.currentText()
 
         calculator = BonusCalculator(self.database, self.config_manager)
-        results = calculator.validate_and_calculate_bonuses(year, month, department, self)
+        results, validation = calculator.validate_and_calculate_bonuses(year, month, department)
 
-        if results is not None and results is not False:
+        if results is not None:
             self.redirect_to_main_window(year, month, department, results)
+        else:
+            QMessageBox.warning(self, "Unsaved Changes", validation["message"])
 
     def redirect_to_main_window(self, year, month, department, results):
         """Redirect to main window and display results"""
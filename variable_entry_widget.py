@@ -4,12 +4,16 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
     QPushButton, QTableWidget, QTableWidgetItem, QHeaderView,
     QMessageBox, QSpinBox, QGroupBox, QScrollArea,
-    QLineEdit
+    QLineEdit, QFileDialog
 )
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QDoubleValidator, QValidator
 from datetime import datetime
 from bonus_calculator import BonusCalculator
+from formula_compiler import get_variable_dependency_index
+from instrumentation import instrumented
+from value_parsing import parse_value_for_storage
+from variable_import import VariableImportError, import_variable_values
 import math
 
 
@@ -100,6 +104,10 @@ class VariableEntryWidget(QWidget):
 
         button_layout.addStretch()
 
+        import_btn = QPushButton("Import from Spreadsheet...")
+        import_btn.clicked.connect(self.import_from_spreadsheet)
+        button_layout.addWidget(import_btn)
+
         save_btn = QPushButton("Save All Values")
         save_btn.clicked.connect(self.save_all_values)
         button_layout.addWidget(save_btn)
@@ -121,6 +129,7 @@ class VariableEntryWidget(QWidget):
         self.selected_department = department
         self.load_data()
 
+    @instrumented("VariableEntryWidget.load_data")
     def load_data(self):
         """Load employees, variables, and setup the table"""
         if self._loading:
@@ -157,13 +166,16 @@ class VariableEntryWidget(QWidget):
             self.employee_applicable_variables = {}
             kpis = self.config_manager.get_kpis()
 
+            # Every employee of a department needs the same variables
+            department_variables = {}
             for employee in self.employees:
                 # Apply department filter
                 if self.selected_department != "All Departments" and employee['department'] != self.selected_department:
                     continue
 
-                applicable_vars = self.get_applicable_variables_for_employee(employee, kpis)
-                self.employee_applicable_variables[employee['id']] = applicable_vars
+                if employee['department'] not in department_variables:
+                    department_variables[employee['department']] = self.get_applicable_variables_for_employee(employee, kpis)
+                self.employee_applicable_variables[employee['id']] = department_variables[employee['department']]
 
             # Setup table
             self.setup_variables_table(month, year)
@@ -175,20 +187,9 @@ class VariableEntryWidget(QWidget):
 
     def get_applicable_variables_for_employee(self, employee, kpis):
         """Get variables used in KPIs applicable to this employee"""
-        applicable_vars = {}
-
-        for kpi in kpis:
-            # Check if KPI applies to employee's department
-            applicable_depts = kpi.get('applicable_departments', [])
-            if not applicable_depts or employee['department'] in applicable_depts:
-                # Check which variables are used in this KPI's formula
-                formula = kpi.get('formula', '')
-                for var in self.custom_variables:
-                    var_name = var['name']
-                    if var_name in formula:
-                        applicable_vars[var_name] = var
-
-        return applicable_vars
+        index = get_variable_dependency_index(kpis, self.custom_variables)
+        var_names = index.variables_for_department(employee['department'])
+        return {var['name']: var for var in self.custom_variables if var['name'] in var_names}
 
     def setup_variables_table(self, month, year):
         """Setup the variables entry table"""
@@ -209,6 +210,10 @@ class VariableEntryWidget(QWidget):
             f"Showing {total_employees} employees from {self.selected_department}"
         )
 
+        # Load the saved values of the whole grid in one query
+        department = None if self.selected_department == "All Departments" else self.selected_department
+        period_values = self.database.get_period_variable_values(year, month, department=department)
+
         # Get all unique variables used by any employee in the filtered list
         all_variables = {}
         for employee_id, vars_dict in self.employee_applicable_variables.items():
@@ -292,10 +297,8 @@ class VariableEntryWidget(QWidget):
                         validator.setTop(9999999)
                         line_edit.setValidator(validator)
 
-                    # Load existing value from database
-                    existing_value = self.database.get_employee_variable_value(
-                        employee['id'], var_name, year, month
-                    )
+                    # Existing value saved for the period
+                    existing_value = period_values.get(employee['id'], {}).get(var_name)
 
                     if existing_value is not None:
                         # Format the saved value for display
@@ -361,65 +364,17 @@ class VariableEntryWidget(QWidget):
 
     def parse_input_for_storage(self, input_text, data_type):
         """Parse input text for storage based on data type"""
-        input_text = str(input_text).strip()
-
-        if not input_text:
-            # Return empty string for text, "0" for numeric types
-            if data_type == 'text':
-                return ''
-            else:
-                return '0'
-
-        if data_type == 'percentage':
-            # Remove % sign if present
-            clean_text = input_text.replace('%', '')
-            try:
-                float_val = float(clean_text)
-
-                # Check if input had % sign
-                had_percent_sign = '%' in input_text
-
-                if had_percent_sign:
-                    # User entered with % sign (e.g., "0.5%" or "50%")
-                    # Convert to decimal: 0.5% → 0.005, 50% → 0.5
-                    return str(float_val / 100.0)
-                else:
-                    # User entered without % sign
-                    # If value <= 1, assume it's already decimal (0.5 → 0.5)
-                    # If value > 1, assume it's percentage (85 → 0.85)
-                    if float_val > 1.0:
-                        return str(float_val / 100.0)
-                    else:
-                        return str(float_val)
-            except ValueError:
-                return '0'
-
-        elif data_type == 'currency':
-            # Remove $ and commas
-            clean_text = input_text.replace('$', '').replace(',', '')
-            try:
-                float_val = float(clean_text)
-                return str(float_val)
-            except ValueError:
-                return '0'
-
-        elif data_type == 'number':
-            try:
-                float_val = float(input_text)
-                return str(float_val)
-            except ValueError:
-                return '0'
-
-        else:  # text
-            return input_text
+        return parse_value_for_storage(input_text, data_type)
 
+    @instrumented("VariableEntryWidget.save_all_values")
     def save_all_values(self):
         """Save all variable values"""
         try:
             month = self.month_combo.currentIndex() + 1
             year = self.year_spin.value()
 
-            saved_count = 0
+            values = []
+            cells = []
 
             for row in range(self.variables_table.rowCount()):
                 employee_id_item = self.variables_table.item(row, 0)
@@ -438,24 +393,24 @@ class VariableEntryWidget(QWidget):
                             input_text = widget.text()
                             value_for_storage = self.parse_input_for_storage(input_text, data_type)
 
-                            # Save to database
-                            value_data = {
+                            values.append({
                                 "employee_id": employee_id,
                                 "variable_name": var_name,
-                                "period_year": year,
-                                "period_month": month,
                                 "value": value_for_storage
-                            }
+                            })
+                            cells.append((widget, value_for_storage, data_type))
 
-                            if self.database.save_employee_variable_value(value_data):
-                                saved_count += 1
+            # Save the whole grid in one transaction - all values are stored or none
+            statuses = self.database.save_period_variable_values(year, month, values)
 
-                                # Update display to show formatted value
-                                display_value = self.format_value_for_display(value_for_storage, data_type)
-                                widget.setText(display_value)
+            # Update display to show formatted values
+            for widget, value_for_storage, data_type in cells:
+                widget.setText(self.format_value_for_display(value_for_storage, data_type))
 
+            saved_count = sum(1 for status in statuses if status != "unchanged")
             QMessageBox.information(self, "Success",
-                                    f"Saved {saved_count} variable values for {self.variables_table.rowCount()} employees!")
+                                    f"Saved {saved_count} changed variable values for {self.variables_table.rowCount()} employees!\n"
+                                    f"{len(statuses) - saved_count} values were unchanged.")
 
             # Reload to show updated values
             self.load_data()
@@ -463,6 +418,47 @@ class VariableEntryWidget(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save values: {str(e)}")
 
+    def import_from_spreadsheet(self):
+        """Import the period's values from a CSV or XLSX file after confirming what changes"""
+        path, _ = QFileDialog.getOpenFileName(self, "Import Variable Values", "",
+                                              "Spreadsheets (*.csv *.xlsx);;All Files (*)")
+        if not path:
+            return
+
+        month = self.month_combo.currentIndex() + 1
+        year = self.year_spin.value()
+        try:
+            plan = import_variable_values(self.database, path, year, month, dry_run=True)
+        except (VariableImportError, OSError) as e:
+            QMessageBox.critical(self, "Import Failed", str(e))
+            return
+
+        counts = plan["counts"]
+        summary = (f"{counts['inserted']} new, {counts['updated']} changed and {counts['unchanged']} unchanged "
+                   f"values for {self.month_combo.currentText()} {year}.")
+        if plan["unmapped_columns"]:
+            summary += f"\n\nIgnored columns: {', '.join(plan['unmapped_columns'])}"
+        if plan["errors"]:
+            summary += f"\n\n{len(plan['errors'])} cells or rows will be skipped:\n"
+            summary += "\n".join(f"Row {error['row']}: {error['message']}" for error in plan["errors"][:10])
+            if len(plan["errors"]) > 10:
+                summary += f"\n... and {len(plan['errors']) - 10} more"
+
+        if not counts["inserted"] and not counts["updated"]:
+            QMessageBox.information(self, "Nothing to Import", summary)
+            return
+        reply = QMessageBox.question(self, "Import Variable Values", summary + "\n\nImport these values?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+
+        try:
+            import_variable_values(self.database, path, year, month)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to import values: {str(e)}")
+            return
+        self.load_data()
+
     def set_period(self, year, month):
         """Set the period for variable entry"""
         self.year_spin.setValue(year)
@@ -485,10 +481,12 @@ class VariableEntryWidget(QWidget):
         department = self.dept_combo.currentText()
 
         calculator = BonusCalculator(self.database, self.config_manager)
-        results = calculator.validate_and_calculate_bonuses(year, month, department, self)
+        results, validation = calculator.validate_and_calculate_bonuses(year, month, department)
 
-        if results is not None and results is not False:
+        if results is not None:
             self.redirect_to_main_window(year, month, department, results)
+        else:
+            QMessageBox.warning(self, "Unsaved Changes", validation["message"])
 
     def redirect_to_main_window(self, year, month, department, results):
         """Redirect to main window and display results"""
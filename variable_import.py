@@ -0,0 +1,195 @@
+# variable_import.py
+"""Import a period's variable values from a spreadsheet (CSV, or XLSX with openpyxl)
+
+The first row holds the column names. One column identifies the employee
+(employee_id, id or "Employee ID"); the others are matched to custom variables
+by name or display name, or through an explicit {column: variable name}
+mapping. Columns that match nothing are reported and ignored. Values are
+parsed like the variable entry grid parses typed input; blank cells are
+skipped so they never overwrite a stored value.
+"""
+import csv
+import logging
+import os
+
+from value_parsing import parse_value_for_storage
+
+logger = logging.getLogger(__name__)
+
+EMPLOYEE_ID_COLUMNS = ["employee_id", "employee id", "id"]
+
+
+class VariableImportError(Exception):
+    """Raised when a spreadsheet cannot be imported at all"""
+
+
+def read_spreadsheet_rows(path, sheet=None):
+    """Yield the rows of a CSV or XLSX file as lists of cell values, header first"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise VariableImportError("Reading XLSX files needs openpyxl (pip install openpyxl)")
+
+        # Read-only workbooks stream rows instead of loading every cell
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet] if sheet else workbook.active
+            for row in worksheet.iter_rows(values_only=True):
+                yield ["" if cell is None else cell for cell in row]
+        finally:
+            workbook.close()
+    elif extension in (".csv", ".txt"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.reader(f)
+    else:
+        raise VariableImportError(f"Unsupported spreadsheet type '{extension}', use .csv or .xlsx")
+
+
+def map_columns(header, custom_variables, mapping=None):
+    """Find the employee ID column and the variable of every other column
+
+    Returns (employee ID column index, {column index: variable}, unmapped column names).
+    """
+    mapping = {str(column).strip().lower(): name for column, name in (mapping or {}).items()}
+    variables_by_name = {variable["name"]: variable for variable in custom_variables}
+    variables_by_key = {}
+    for variable in custom_variables:
+        variables_by_key[variable["name"].lower()] = variable
+        variables_by_key.setdefault((variable.get("display_name") or "").strip().lower(), variable)
+
+    id_column = None
+    columns = {}
+    unmapped = []
+    for index, column in enumerate(header):
+        key = str(column).strip().lower()
+        if key in mapping:
+            variable = variables_by_name.get(mapping[key])
+            if variable is None:
+                raise VariableImportError(f"Column '{column}' is mapped to unknown variable '{mapping[key]}'")
+            columns[index] = variable
+        elif id_column is None and key in EMPLOYEE_ID_COLUMNS:
+            id_column = index
+        elif key and key in variables_by_key:
+            columns[index] = variables_by_key[key]
+        elif key:
+            unmapped.append(str(column))
+
+    if id_column is None:
+        raise VariableImportError(f"No employee ID column, name one of: {', '.join(EMPLOYEE_ID_COLUMNS)}")
+    if not columns:
+        raise VariableImportError("No column matches a custom variable name or display name")
+    return id_column, columns, unmapped
+
+
+def _comparable(value):
+    """A value in the form the REAL value column returns it"""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return value
+
+
+def plan_variable_import(database, path, year, month, mapping=None, sheet=None):
+    """Read a spreadsheet and diff it against the period's stored values without writing anything
+
+    Returns {"values", "diff", "errors", "unmapped_columns", "counts"}: values is
+    ready for Database.save_period_variable_values; diff has one
+    {employee_id, variable_name, old_value, new_value, status} entry per value,
+    status being "inserted", "updated" or "unchanged"; errors are
+    {row, employee_id, message} for cells or rows that were skipped.
+    """
+    custom_variables = [variable for variable in database.get_custom_variables() if variable.get("is_active", True)]
+    employees = database.get_employee_directory()
+
+    rows = read_spreadsheet_rows(path, sheet)
+    header = next(rows, None)
+    if header is None:
+        raise VariableImportError(f"'{path}' is empty")
+    id_column, columns, unmapped = map_columns(header, custom_variables, mapping)
+
+    values = []
+    errors = []
+    seen = {}
+    for row_number, row in enumerate(rows, start=2):
+        if not any(str(cell).strip() for cell in row):
+            continue
+        cell = row[id_column] if id_column < len(row) else ""
+        if isinstance(cell, float) and cell.is_integer():
+            cell = int(cell)  # Spreadsheets turn numeric IDs into floats
+        employee_id = str(cell).strip()
+        if employee_id not in employees:
+            errors.append({"row": row_number, "employee_id": employee_id,
+                           "message": f"Unknown employee '{employee_id}'"})
+            continue
+
+        for index, variable in columns.items():
+            cell = row[index] if index < len(row) else ""
+            if str(cell).strip() == "":
+                continue
+            try:
+                value = parse_value_for_storage(cell, variable["data_type"], strict=True)
+            except ValueError:
+                errors.append({"row": row_number, "employee_id": employee_id,
+                               "message": f"{variable['name']}: '{cell}' is not a valid {variable['data_type']}"})
+                continue
+
+            key = (employee_id, variable["name"])
+            if key in seen:
+                errors.append({"row": row_number, "employee_id": employee_id,
+                               "message": f"{variable['name']} is already given on row {seen[key]}"})
+                continue
+            seen[key] = row_number
+            values.append({"employee_id": employee_id, "variable_name": variable["name"], "value": value})
+
+    stored = database.get_period_variable_values(year, month, employee_ids={value["employee_id"] for value in values})
+    diff = []
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for value_data in values:
+        employee_values = stored.get(value_data["employee_id"], {})
+        old_value = employee_values.get(value_data["variable_name"])
+        if value_data["variable_name"] not in employee_values:
+            status = "inserted"
+        elif old_value == _comparable(value_data["value"]):
+            status = "unchanged"
+        else:
+            status = "updated"
+        counts[status] += 1
+        diff.append({
+            "employee_id": value_data["employee_id"],
+            "variable_name": value_data["variable_name"],
+            "old_value": old_value,
+            "new_value": value_data["value"],
+            "status": status
+        })
+
+    return {"values": values, "diff": diff, "errors": errors, "unmapped_columns": unmapped, "counts": counts}
+
+
+def import_variable_values(database, path, year, month, mapping=None, sheet=None, dry_run=False):
+    """Plan an import and, unless dry_run, write all its values in one transaction
+
+    Returns the plan of plan_variable_import. Rows with errors are skipped;
+    the other values are written together or, if writing fails, not at all.
+    """
+    plan = plan_variable_import(database, path, year, month, mapping, sheet)
+    if not dry_run and plan["values"]:
+        database.save_period_variable_values(year, month, plan["values"])
+
+    counts = plan["counts"]
+    logger.info("%s %d values for %d-%02d: %d new, %d changed, %d unchanged, %d skipped",
+                "Checked" if dry_run else "Imported", len(plan['values']), year, month, counts['inserted'],
+                counts['updated'], counts['unchanged'], len(plan['errors']))
+    return plan
+
+
+def write_diff(plan, path):
+    """Write the diff and errors of a plan to a CSV file for review"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["employee_id", "variable_name", "old_value", "new_value", "status",
+                                               "row", "message"])
+        writer.writeheader()
+        writer.writerows(plan["diff"])
+        for error in plan["errors"]:
+            writer.writerow(dict(error, status="error"))
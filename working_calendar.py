@@ -0,0 +1,136 @@
+# working_calendar.py
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# Monday to Friday, in numpy.busday_count weekmask format
+DEFAULT_WEEKMASK = "1111100"
+
+
+def _to_date(value):
+    """Accept a date, a datetime or a YYYY-MM-DD string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class WorkingCalendar:
+    """Counts working days with configurable weekends, holidays and shortened days
+
+    Holidays are days off (working fraction 0); shortened days count as their
+    working fraction, e.g. 0.5 for a half day. Counts cover both ends of a range.
+    """
+
+    def __init__(self, weekmask=DEFAULT_WEEKMASK, holidays=None):
+        if len(weekmask) != 7 or set(weekmask) - {"0", "1"}:
+            raise ValueError(f"Invalid weekmask '{weekmask}', expected 7 characters of 0/1 starting on Monday")
+        self.weekmask = weekmask
+        self.working_weekdays = [i for i, flag in enumerate(weekmask) if flag == "1"]
+
+        # Only days that would otherwise be worked change the count
+        full_days_off = []
+        shortened = []
+        for holiday in holidays or []:
+            day = _to_date(holiday["holiday_date"])
+            if weekmask[day.weekday()] != "1":
+                continue
+            fraction = float(holiday.get("working_fraction") or 0)
+            if fraction <= 0:
+                full_days_off.append(day)
+            elif fraction < 1:
+                shortened.append((day, 1 - fraction))
+
+        self.holidays = sorted(set(full_days_off))
+        shortened.sort()
+        self.shortened_days = [day for day, _ in shortened]
+
+        # Running total of hours lost to shortened days, for range sums by bisection
+        self._shortened_loss = [0.0]
+        for _, loss in shortened:
+            self._shortened_loss.append(self._shortened_loss[-1] + loss)
+
+        if np is not None:
+            self._holiday_array = np.array(self.holidays, dtype="datetime64[D]")
+            self._shortened_array = np.array(self.shortened_days, dtype="datetime64[D]")
+            self._shortened_loss_array = np.array(self._shortened_loss)
+
+    @classmethod
+    def from_database(cls, database=None, config_manager=None):
+        """Build the calendar from the holidays table and the configured weekmask"""
+        weekmask = config_manager.get_working_weekmask() if config_manager else DEFAULT_WEEKMASK
+        holidays = []
+        if database:
+            try:
+                holidays = database.get_holidays()
+            except Exception as e:
+                logger.error("Error loading holidays: %s", e)
+        return cls(weekmask, holidays)
+
+    def count(self, start, end):
+        """Count working days from start to end, both included"""
+        return self.count_many([(start, end)])[0]
+
+    def count_many(self, ranges):
+        """Count working days for many (start, end) ranges in one batched call"""
+        if not ranges:
+            return []
+        if np is not None:
+            return self._count_many_numpy(ranges)
+        return [self._count_range(_to_date(start), _to_date(end)) for start, end in ranges]
+
+    def _count_many_numpy(self, ranges):
+        starts = np.array([_to_date(start) for start, _ in ranges], dtype="datetime64[D]")
+        ends = np.array([_to_date(end) for _, end in ranges], dtype="datetime64[D]")
+        valid = starts <= ends
+
+        # busday_count excludes the end date, so count up to the day after
+        day_after = np.where(valid, ends + 1, starts)
+        counts = np.busday_count(starts, day_after, weekmask=self.weekmask, holidays=self._holiday_array)
+
+        if len(self.shortened_days) == 0:
+            return counts.tolist()
+
+        first = np.searchsorted(self._shortened_array, starts, side="left")
+        last = np.searchsorted(self._shortened_array, ends, side="right")
+        losses = np.where(valid, self._shortened_loss_array[np.maximum(last, first)] - self._shortened_loss_array[first], 0)
+        return (counts - losses).tolist()
+
+    def _count_range(self, start, end):
+        """Pure Python count for one range, used without numpy"""
+        if start > end:
+            return 0
+
+        total_days = (end - start).days + 1
+        full_weeks, remainder = divmod(total_days, 7)
+        count = full_weeks * len(self.working_weekdays)
+        for offset in range(remainder):
+            if self.weekmask[(start.weekday() + offset) % 7] == "1":
+                count += 1
+
+        count -= bisect_right(self.holidays, end) - bisect_left(self.holidays, start)
+
+        if self.shortened_days:
+            first = bisect_left(self.shortened_days, start)
+            last = bisect_right(self.shortened_days, end)
+            count -= self._shortened_loss[last] - self._shortened_loss[first]
+        return count
+
+    def month_bounds(self, year, month):
+        """Get the first and last day of a month"""
+        first_day = date(year, month, 1)
+        next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return first_day, next_month - timedelta(days=1)
+
+    def month_working_days(self, year, month):
+        """Count the working days of a month"""
+        return self.count(*self.month_bounds(year, month))